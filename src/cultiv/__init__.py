@@ -1,35 +1,106 @@
-from ._construction._cultivation_stage import (
-    make_inject_and_cultivate_chunks_d3,
-    make_inject_and_cultivate_chunks_d5,
-    make_chunk_d3_double_cat_check,
-    make_chunk_d5_double_cat_check,
-)
-from ._decoding._desaturation_sampler import DesaturationSampler
-from ._error_enumeration_report import ErrorEnumerationReport
-from ._stats_util import (
-    preprocess_intercepted_simulation_stats,
-    split_by_gap_threshold,
-    split_by_gap,
-    split_by_custom_count,
-    split_into_gap_distribution, compute_expected_injection_growth_volume, stat_to_gap_stats,
-)
-from ._decoding import (
-    sinter_samplers,
-)
-from ._construction import (
-    make_color_code,
-    tile_rgb_color,
-    make_escape_to_big_matchable_code_circuit,
-    make_end2end_cultivation_circuit,
-    make_inject_and_cultivate_circuit,
-    make_idle_matchable_code_circuit,
-    make_escape_to_big_color_code_circuit,
-    make_surface_code_memory_circuit,
-    make_growing_color_code_bell_pair_patch,
-    make_hybrid_color_surface_code,
-    make_color_code_to_growing_code_chunk,
-    make_post_escape_matchable_code,
-    make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_simple,
-    make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_full_edges,
-    make_surface_code_cnot,
-)
+import importlib
+from typing import Any, TYPE_CHECKING
+
+# The construction and decoding code pulls in gen, pymatching, and other heavy
+# dependencies. To keep `import cultiv` cheap (every sinter worker does it), the public
+# names are imported from their submodules on first access.
+_LAZY_ATTRIBUTES: dict[str, str] = {
+    **dict.fromkeys([
+        'make_inject_and_cultivate_chunks_d3',
+        'make_inject_and_cultivate_chunks_d5',
+        'make_chunk_d3_double_cat_check',
+        'make_chunk_d5_double_cat_check',
+    ], '._construction._cultivation_stage'),
+    'DesaturationSampler': '._decoding._desaturation_sampler',
+    **dict.fromkeys([
+        'HybridPerfectionistEstimator',
+        'HybridPerfectionistSampler',
+    ], '._decoding._hybrid_perfectionist_sampler'),
+    **dict.fromkeys([
+        'FaultCountStrata',
+        'StratifiedPerfectionistSampler',
+    ], '._decoding._stratified_perfectionist_sampler'),
+    'ErrorEnumerationReport': '._error_enumeration_report',
+    'LogicalErrorCache': '._logical_error_cache',
+    **dict.fromkeys([
+        'preprocess_intercepted_simulation_stats',
+        'split_by_gap_threshold',
+        'split_by_gap',
+        'split_by_custom_count',
+        'split_into_gap_distribution',
+        'compute_expected_injection_growth_volume',
+        'stat_to_gap_stats',
+    ], '._stats_util'),
+    'sinter_samplers': '._decoding',
+    **dict.fromkeys([
+        'make_color_code',
+        'tile_rgb_color',
+        'make_escape_to_big_matchable_code_circuit',
+        'make_end2end_cultivation_circuit',
+        'make_inject_and_cultivate_circuit',
+        'make_idle_matchable_code_circuit',
+        'make_escape_to_big_color_code_circuit',
+        'make_surface_code_memory_circuit',
+        'make_growing_color_code_bell_pair_patch',
+        'make_hybrid_color_surface_code',
+        'make_color_code_to_growing_code_chunk',
+        'make_post_escape_matchable_code',
+        'make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_simple',
+        'make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_full_edges',
+        'make_surface_code_cnot',
+    ], '._construction'),
+}
+
+
+def __getattr__(name: str) -> Any:
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
+if TYPE_CHECKING:
+    from ._construction._cultivation_stage import (
+        make_inject_and_cultivate_chunks_d3,
+        make_inject_and_cultivate_chunks_d5,
+        make_chunk_d3_double_cat_check,
+        make_chunk_d5_double_cat_check,
+    )
+    from ._decoding._desaturation_sampler import DesaturationSampler
+    from ._decoding._hybrid_perfectionist_sampler import HybridPerfectionistEstimator, HybridPerfectionistSampler
+    from ._decoding._stratified_perfectionist_sampler import FaultCountStrata, StratifiedPerfectionistSampler
+    from ._error_enumeration_report import ErrorEnumerationReport
+    from ._logical_error_cache import LogicalErrorCache
+    from ._stats_util import (
+        preprocess_intercepted_simulation_stats,
+        split_by_gap_threshold,
+        split_by_gap,
+        split_by_custom_count,
+        split_into_gap_distribution, compute_expected_injection_growth_volume, stat_to_gap_stats,
+    )
+    from ._decoding import (
+        sinter_samplers,
+    )
+    from ._construction import (
+        make_color_code,
+        tile_rgb_color,
+        make_escape_to_big_matchable_code_circuit,
+        make_end2end_cultivation_circuit,
+        make_inject_and_cultivate_circuit,
+        make_idle_matchable_code_circuit,
+        make_escape_to_big_color_code_circuit,
+        make_surface_code_memory_circuit,
+        make_growing_color_code_bell_pair_patch,
+        make_hybrid_color_surface_code,
+        make_color_code_to_growing_code_chunk,
+        make_post_escape_matchable_code,
+        make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_simple,
+        make_color_code_grown_into_surface_code_then_ablated_into_matchable_code_full_edges,
+        make_surface_code_cnot,
+    )
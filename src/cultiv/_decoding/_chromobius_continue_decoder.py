@@ -4,6 +4,8 @@ import numpy as np
 import sinter
 import stim
 
+from ._decode_isolating_failures import decode_isolating_failures
+
 
 class ChromobiusContinueDecoder(sinter.Decoder):
     """Chromobius, except failing to lift results in a False prediction instead of an error."""
@@ -34,9 +36,11 @@ class CompiledChromobiusContinueDecoder(sinter.CompiledDecoder):
     ) -> np.ndarray:
         dets = bit_packed_detection_event_data
         result = np.zeros(shape=(dets.shape[0], 2), dtype=np.uint8)
-        for k in range(len(dets)):
-            try:
-                result[k, 0] = self.decoder.predict_obs_flips_from_dets_bit_packed(dets[k])
-            except:
-                result[k, 1] = 1
+        failed = decode_isolating_failures(
+            lambda batch: (self.decoder.predict_obs_flips_from_dets_bit_packed(batch)[:, 0],),
+            dets,
+            (result[:, 0],),
+            exceptions=(Exception,),
+        )
+        result[failed, 1] = 1
         return result
@@ -8,6 +8,9 @@ import sinter
 import stim
 
 import gen
+from ._decode_isolating_failures import decode_isolating_failures
+from ._gap_counts import gap_custom_counts
+from ._syndrome_cache import SyndromeCache
 
 
 class ChromobiusGapSampler(sinter.Sampler):
@@ -52,6 +55,16 @@ class _DemError:
                 raise NotImplementedError(f'{instruction}')
         return _DemError(p=p, det_set=frozenset(gen.xor_sorted(det_list)), has_obs=has_obs)
 
+    @staticmethod
+    def list_from_dem(dem: stim.DetectorErrorModel) -> list['_DemError']:
+        """Returns the errors of the flattened dem, in order."""
+        arrays = gen.DemArrays.from_dem(dem)
+        assert not np.any(arrays.obs_masks > 1)
+        return [
+            _DemError(p=p, det_set=frozenset(dets), has_obs=bool(obs_mask))
+            for p, dets, obs_mask in zip(arrays.probabilities.tolist(), arrays.det_lists(), arrays.obs_masks.tolist())
+        ]
+
     def to_instruction(self, obs_det: int) -> stim.DemInstruction:
         targets = []
         for d in sorted(self.det_set):
@@ -69,13 +82,14 @@ class CompiledChromobiusGapSampler(sinter.CompiledSampler):
             raise NotImplementedError(f'{task.detector_error_model.num_observables=} != 1')
         self.main_dem = task.detector_error_model.flattened()
         self.obs_det = self.main_dem.num_detectors
-        coords = self.main_dem.get_detector_coordinates()
+        coords = gen.DemArrays.from_dem(self.main_dem).detector_coordinates()
         adj_pairs = collections.Counter()
 
+        errors = iter(_DemError.list_from_dem(self.main_dem))
         self.gap_dem_base = stim.DetectorErrorModel()
         for inst in self.main_dem:
             if inst.type == 'error':
-                err = _DemError.from_error_instruction(inst)
+                err = next(errors)
                 if err.has_obs and len(err.det_set) == 2:
                     d1, d2 = err.det_set
                     c1 = coords[d1][3]
@@ -101,6 +115,10 @@ class CompiledChromobiusGapSampler(sinter.CompiledSampler):
         circuit = task.circuit.copy()
         circuit.append("DETECTOR")
         self.stim_sampler = circuit.compile_detector_sampler()
+        self.syndrome_cache = SyndromeCache(
+            decode_batch=self._decode_batch,
+            num_det_bytes=(self.obs_det + 8) // 8,
+        )
 
     def decode_dets(self, detection_events: Iterable[int]) -> tuple[bool, int]:
         det_data = np.zeros(shape=self.obs_det + 1, dtype=np.bool_)
@@ -121,23 +139,28 @@ class CompiledChromobiusGapSampler(sinter.CompiledSampler):
     def sample(self, shots: int) -> sinter.AnonTaskStats:
         t0 = time.monotonic()
         dets, actual_obs = self.stim_sampler.sample(shots, separate_observables=True, bit_packed=True)
-        num_errors = 0
-        gap_counts = collections.Counter()
-        for k in range(shots):
-            try:
-                pred, gap = self.decode_shot(dets[k])
-            except ValueError:
-                pred, gap = False, 0
-            if pred != np.any(actual_obs[k]):
-                num_errors += 1
-                gap_counts[f'E{gap}'] += 1
-            else:
-                gap_counts[f'C{gap}'] += 1
+        predictions, gaps = self.syndrome_cache.decode(dets)
+        errors = predictions != np.any(actual_obs, axis=1)
+        gap_counts = gap_custom_counts(gaps=gaps, errors=errors)
         t1 = time.monotonic()
 
         return sinter.AnonTaskStats(
             shots=shots,
-            errors=num_errors,
+            errors=np.count_nonzero(errors),
             seconds=t1 - t0,
             custom_counts=gap_counts,
         )
+
+    def _decode_batch(self, dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        predictions = np.zeros(shape=dets.shape[0], dtype=np.bool_)
+        gaps = np.zeros(shape=dets.shape[0], dtype=np.int64)
+        decode_isolating_failures(self._decode_batch_unchecked, dets, (predictions, gaps))
+        return predictions, gaps
+
+    def _decode_batch_unchecked(self, dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        _, weights0 = self.gap_decoder.predict_weighted_obs_flips_from_dets_bit_packed(dets)
+        flipped = dets.copy()
+        flipped[:, -1] ^= np.uint8(1 << (self.obs_det % 8))
+        _, weights1 = self.gap_decoder.predict_weighted_obs_flips_from_dets_bit_packed(flipped)
+        predictions = self.decoder.predict_obs_flips_from_dets_bit_packed(dets)
+        return np.any(predictions, axis=1), np.round(np.abs(weights1 - weights0))
@@ -163,3 +163,8 @@ def test_simple_case():
     assert decoder.decode_dets(frozenset([6])) == (False, 15)
     assert decoder.decode_dets(frozenset([10, 11, 16])) == (False, 11)
     assert decoder.decode_dets(frozenset([8, 14, 15])) == (False, 17)
+
+    dets, _ = decoder.stim_sampler.sample(500, separate_observables=True, bit_packed=True)
+    predictions, gaps = decoder._decode_batch(dets)
+    for k in range(len(dets)):
+        assert (predictions[k], gaps[k]) == decoder.decode_shot(dets[k].copy())
@@ -0,0 +1,57 @@
+from typing import Callable
+
+import numpy as np
+
+
+def decode_isolating_failures(
+    decode_batch: Callable[[np.ndarray], tuple[np.ndarray, ...]],
+    dets: np.ndarray,
+    out: tuple[np.ndarray, ...],
+    *,
+    exceptions: tuple[type[BaseException], ...] = (ValueError,),
+) -> np.ndarray:
+    """Decodes a batch of shots at once, while tolerating shots that make the decoder raise.
+
+    Batch decoding APIs raise if any shot in the batch fails, without saying which one.
+    When that happens the batch is split in half and each half is retried, until the
+    failing shots are isolated. Only the failing shots end up missing results.
+
+    Args:
+        decode_batch: Decodes a 2d array of bit packed shots, returning a tuple of arrays
+            whose first axis is the shot axis. Must not modify its argument.
+        dets: The bit packed shots to decode.
+        out: Arrays to write the results of `decode_batch` into. Entries for failed shots
+            are left untouched.
+        exceptions: The exception types that indicate a shot failed to decode.
+
+    Returns:
+        A bool array with a True entry for each shot that failed to decode.
+    """
+    failed = np.zeros(shape=dets.shape[0], dtype=np.bool_)
+    _decode_range(decode_batch, dets, out, exceptions, failed, 0, dets.shape[0])
+    return failed
+
+
+def _decode_range(
+    decode_batch: Callable[[np.ndarray], tuple[np.ndarray, ...]],
+    dets: np.ndarray,
+    out: tuple[np.ndarray, ...],
+    exceptions: tuple[type[BaseException], ...],
+    failed: np.ndarray,
+    start: int,
+    end: int,
+) -> None:
+    if start == end:
+        return
+    try:
+        results = decode_batch(dets[start:end])
+    except exceptions:
+        if end - start == 1:
+            failed[start] = True
+        else:
+            mid = (start + end) // 2
+            _decode_range(decode_batch, dets, out, exceptions, failed, start, mid)
+            _decode_range(decode_batch, dets, out, exceptions, failed, mid, end)
+        return
+    for dst, src in zip(out, results):
+        dst[start:end] = src
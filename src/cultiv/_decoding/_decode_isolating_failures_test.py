@@ -0,0 +1,29 @@
+import numpy as np
+
+from ._decode_isolating_failures import decode_isolating_failures
+
+
+def test_decode_isolating_failures():
+    calls = []
+
+    def decode_batch(dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        calls.append(len(dets))
+        if np.any(dets[:, 0] == 255):
+            raise ValueError('bad shot')
+        return dets[:, 0] * 2, dets[:, 1] == 1
+
+    dets = np.array([[k, k & 1] for k in range(10)], dtype=np.uint8)
+    doubled = np.zeros(shape=10, dtype=np.uint8)
+    odd = np.zeros(shape=10, dtype=np.bool_)
+    failed = decode_isolating_failures(decode_batch, dets, (doubled, odd))
+    assert not np.any(failed)
+    assert calls == [10]
+    np.testing.assert_array_equal(doubled, np.arange(10) * 2)
+    np.testing.assert_array_equal(odd, np.arange(10) & 1)
+
+    dets[3, 0] = 255
+    dets[8, 0] = 255
+    doubled[:] = 77
+    failed = decode_isolating_failures(decode_batch, dets, (doubled, odd))
+    np.testing.assert_array_equal(np.flatnonzero(failed), [3, 8])
+    np.testing.assert_array_equal(doubled, [0, 2, 4, 77, 8, 10, 12, 14, 77, 18])
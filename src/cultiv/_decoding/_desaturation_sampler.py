@@ -1,7 +1,11 @@
 import collections
 import dataclasses
+import hashlib
 import heapq
 import math
+import os
+import pathlib
+import tempfile
 import time
 from typing import Literal, cast, Any, AbstractSet
 
@@ -12,11 +16,31 @@ import stim
 
 import gen
 from cultiv._error_set import int_to_flipped_bits
+from ._gap_counts import gap_custom_counts
+from ._staged_detector_sampler import StagedDetectorSampler
+from ._syndrome_cache import SyndromeCache
 
 
 class DesaturationSampler(sinter.Sampler):
+    """Decodes with pymatching, after desaturating the color code parts of the dem.
+
+    When `early_discard` is set, shots stop being simulated as soon as a postselected
+    detector fires (see `StagedDetectorSampler`), instead of being simulated through the
+    entire circuit and then discarded.
+
+    When `cache_dir` is set (or the CULTIV_DECODER_CACHE_DIR environment variable is set),
+    the derived gap dem, gap circuit, and postselected detectors are saved into a
+    subdirectory named after the task's strong id and the derivation's format version.
+    Later workers given the same task load them instead of re-deriving them.
+    """
+    def __init__(self, early_discard: bool = False, cache_dir: str | pathlib.Path | None = None):
+        if cache_dir is None:
+            cache_dir = os.environ.get('CULTIV_DECODER_CACHE_DIR') or None
+        self.early_discard = early_discard
+        self.cache_dir = None if cache_dir is None else pathlib.Path(cache_dir)
+
     def compiled_sampler_for_task(self, task: sinter.Task) -> 'CompiledDesaturationSampler':
-        return CompiledDesaturationSampler.from_task(task)
+        return CompiledDesaturationSampler.from_task(task, early_discard=self.early_discard, cache_dir=self.cache_dir)
 
 
 @dataclasses.dataclass(frozen=True)
@@ -41,6 +65,15 @@ class _DemError:
                 raise NotImplementedError(f'{instruction}')
         return _DemError(p=p, det_set=frozenset(gen.xor_sorted(det_list)), obs_mask=obs_mask)
 
+    @staticmethod
+    def list_from_dem(dem: stim.DetectorErrorModel) -> list['_DemError']:
+        """Returns the errors of the flattened dem, in order."""
+        arrays = gen.DemArrays.from_dem(dem)
+        return [
+            _DemError(p=p, det_set=frozenset(dets), obs_mask=obs_mask)
+            for p, dets, obs_mask in zip(arrays.probabilities.tolist(), arrays.det_lists(), arrays.obs_masks.tolist())
+        ]
+
     def to_instruction(self) -> stim.DemInstruction:
         targets = []
         for d in self.det_set:
@@ -72,6 +105,7 @@ class CompiledDesaturationSampler(sinter.CompiledSampler):
         gap_dem: stim.DetectorErrorModel,
         postselected_detectors: frozenset[int],
         gap_circuit: stim.Circuit,
+        early_discard: bool = False,
     ):
         self.task = task
         self.gap_dem = gap_dem
@@ -82,6 +116,12 @@ class CompiledDesaturationSampler(sinter.CompiledSampler):
         self.num_det_bytes = -(-self.num_dets // 8)
         self._discard_mask = np.packbits(np.array([k in self.postselected_detectors for k in range(self.num_dets)], dtype=np.bool_), bitorder='little')
         self.gap_circuit_sampler = self.gap_circuit.compile_detector_sampler()
+        self.staged_sampler: StagedDetectorSampler | None = None
+        if early_discard:
+            self.staged_sampler = StagedDetectorSampler(
+                self.gap_circuit,
+                postselected_detectors=self.postselected_detectors,
+            )
         self.gap_decoder = pymatching.Matching.from_detector_error_model(self.gap_dem)
         self._obs_det_byte = 1 << ((self.num_dets - 1) % 8)
 
@@ -89,182 +129,57 @@ class CompiledDesaturationSampler(sinter.CompiledSampler):
         edge_w = edge['weight']
         edge_p = edge['error_probability']
         self.decibels_per_w = -math.log10(edge_p / (1 - edge_p)) * 10 / edge_w
+        self.syndrome_cache = SyndromeCache(
+            decode_batch=self._decode_batch_overwrite_last_byte,
+            num_det_bytes=self.num_det_bytes,
+        )
 
     @staticmethod
-    def from_task(task: sinter.Task) -> 'CompiledDesaturationSampler':
-        dem = task.detector_error_model.flattened()
-        num_dets = dem.num_detectors
-        gap_circuit = task.circuit.copy()
-
-        # Parse color and basis annotations out of the dem.
-        det_coords = dem.get_detector_coordinates()
-        det_bases: list[Literal['X', 'Z', '!']] = []
-        det_colors: list[Literal['r', 'g', 'b', '_']] = []
-        postselected_detectors_hidden_from_matcher = set()
-        postselected_detectors_visible_to_matcher = set()
-
-        for d in range(num_dets):
-            coords = det_coords[d]
-            if len(coords) <= 4 or coords[4] == -9:
-                postselected_detectors_hidden_from_matcher.add(d)
-                det_bases.append('!')
-                det_colors.append('_')
-                continue
-
-            coord_annotation = int(coords[4])
-            basis = cast(Any, 'XXXZZZXZ'[coord_annotation])
-            color = cast(Any, 'rgbrgb__'[coord_annotation])
-            det_bases.append(basis)
-            det_colors.append(color)
-            if (color == 'r' and basis == 'X') or (color == 'g' and basis == 'Z'):
-                # Postselect the color code detectors that can be ablated, leaving a matchable code.
-                postselected_detectors_visible_to_matcher.add(d)
-
-        # Parse errors out of the dem.
-        errors = []
-        for inst in dem:
-            if inst.type != 'error':
-                continue
-            errors.append(_DemError.from_error_instruction(inst))
-
-        # Classify each single-basis error's obs flip, to help with decomposition.
-        dets_to_obs = {}
-        for err in errors:
-            bases = {
-                det_bases[d]
-                for d in err.det_set
-            }
-            if len(bases) == 1 and len(err.det_set) == 2 and err.obs_mask:
-                a, b = err.det_set
-                postselected_detectors_hidden_from_matcher.add(a)
-                postselected_detectors_hidden_from_matcher.add(b)
-            if len(bases) == 1:
-                dets_to_obs[err.det_set] = err.obs_mask
-
-        # Find single-basis RGB triplet errors that need to be simplified for the matcher.
-        virtual_pair_nodes = set()
-        for err in errors:
-            colors = {det_colors[d] for d in err.det_set}
-            bases = {det_bases[d] for d in err.det_set}
-            if len(err.det_set) == 3:
-                if len(bases) == 1 and colors == {'r', 'g', 'b'}:
-                    a, b, c = err.det_set
-                    virtual_pair_nodes.add(frozenset([a, b]))
-                    virtual_pair_nodes.add(frozenset([a, c]))
-                    virtual_pair_nodes.add(frozenset([b, c]))
-            elif len(err.det_set) == 2 and len(bases) == 1 and (colors == {'r', 'g'} or colors == {'r', 'b'} or colors == {'b', 'g'}):
-                a, b = err.det_set
-                virtual_pair_nodes.add(frozenset([a, b]))
-
-        pair2virtual = {}
-        for pair in sorted(virtual_pair_nodes, key=lambda e: tuple(sorted(e))):
-            k = len(pair2virtual) + num_dets
-            pair2virtual[pair] = k
-            a, b = pair
-            if a != -1 and b != -1:
-                det_coords[k] = [(x + y) / 2 for x, y in list(zip(det_coords[a], det_coords[b]))[:3]]
-            else:
-                c = a if a != -1 else b
-                det_coords[k] = det_coords[c][:3]
-                det_coords[k][0] += 0.25
-                det_coords[k][1] += 0.25
-                det_coords[k][2] += 0.25
-            gap_circuit.append('DETECTOR', [], det_coords[k])
-
-        matchable_dem = stim.DetectorErrorModel()
-        for k in range(num_dets + len(pair2virtual)):
-            matchable_dem.append('detector', det_coords[k], [stim.target_relative_detector_id(k)])
-        for err in errors:
-            colors = collections.Counter(det_colors[d] for d in err.det_set)
-            bases = collections.Counter(det_bases[d] for d in err.det_set)
-            if len(err.det_set) == 2 and err.det_set in virtual_pair_nodes:
-                # A boundary error at the side of the color code region.
-
-                # Add as a normal error, and also as a virtual-pair-node boundary error.
-                virtual_err = _DemError(
-                    p=err.p,
-                    det_set=frozenset([pair2virtual[err.det_set]]),
-                    obs_mask=err.obs_mask,
-                )
-                matchable_dem.append(err.to_instruction())
-                matchable_dem.append(virtual_err.to_instruction())
-
-            elif len(err.det_set) == 3 and len(bases) == 1 and colors == collections.Counter('rgb'):
-                # This is a bulk error within the color code region.
-
-                # Split into three node-to-virtual-node-pair errors.
-                assert err.obs_mask == 0
-                for solo in err.det_set:
-                    virtual_err = _DemError(
-                        p=err.p,
-                        obs_mask=err.obs_mask,
-                        det_set=frozenset([solo, pair2virtual[err.det_set ^ frozenset([solo])]]),
-                    )
-                    matchable_dem.append(virtual_err.to_instruction())
-
-            elif len(err.det_set) <= 2 and (bases.keys() == {'X'} or bases.keys() == {'Z'}):
-                # This is a simple matchable error.
-                matchable_dem.append(err.to_instruction())
-
-            elif bases['X'] <= 2 and bases['Z'] <= 2:
-                # This is a decomposable matchable error.
-
-                # Decompose into X part and Z part.
-                xs = frozenset([d for d in err.det_set if det_bases[d] == 'X'])
-                zs = frozenset([d for d in err.det_set if det_bases[d] == 'Z'])
-                if xs not in dets_to_obs or zs not in dets_to_obs:
-                    # Don't know what the individual parts actually do.
-                    continue
-
-                obs_x = dets_to_obs[xs]
-                obs_z = dets_to_obs[zs]
-                if obs_x ^ obs_z != err.obs_mask:
-                    # Decomposition failed. Could be due to a distance 3 logical error.
-                    continue
-
-                x_part = _DemError(p=err.p, det_set=xs, obs_mask=obs_x)
-                z_part = _DemError(p=err.p, det_set=zs, obs_mask=obs_z)
-                matchable_dem.append(_DemError.to_separated_instruction([
-                    x_part,
-                    z_part,
-                ]))
+    def from_task(
+        task: sinter.Task,
+        *,
+        early_discard: bool = False,
+        cache_dir: str | pathlib.Path | None = None,
+    ) -> 'CompiledDesaturationSampler':
+        if cache_dir is None:
+            gap_dem, postselected_detectors, gap_circuit = _derive_gap_parts(task)
+        else:
+            entry = pathlib.Path(cache_dir) / _cache_key(task)
+            if entry.exists():
+                gap_dem, postselected_detectors, gap_circuit = _read_gap_parts(entry, task)
             else:
-                # Too complicated. Don't tell the matcher about it.
-                pass
-
-        clipped_dem = clipped_matchable_dem(matchable_dem, postselected_detectors_hidden_from_matcher)
-        clipped_dem_with_det_for_obs = _dem_with_obs_detector(clipped_dem)
-        gap_circuit.append("DETECTOR", [], [-9, -9, -9])  # gap observable detector
-        assert gap_circuit.num_detectors == clipped_dem_with_det_for_obs.num_detectors
-
-        clipped_dem.append(stim.DemInstruction('detector', [-9, -9, -9], [stim.target_relative_detector_id(clipped_dem_with_det_for_obs.num_detectors - 1)]))
+                gap_dem, postselected_detectors, gap_circuit = _derive_gap_parts(task)
+                _write_gap_parts(entry, task, gap_dem=gap_dem, postselected_detectors=postselected_detectors, gap_circuit=gap_circuit)
         return CompiledDesaturationSampler(
             task=task,
-            gap_dem=clipped_dem_with_det_for_obs,
-            postselected_detectors=frozenset(postselected_detectors_hidden_from_matcher | postselected_detectors_visible_to_matcher),
+            gap_dem=gap_dem,
+            postselected_detectors=postselected_detectors,
             gap_circuit=gap_circuit,
+            early_discard=early_discard,
         )
 
     def sample(self, shots: int) -> sinter.AnonTaskStats:
         t0 = time.monotonic()
-        dets, actual_obs = self.gap_circuit_sampler.sample(shots, separate_observables=True, bit_packed=True)
-
-        keep_mask = ~np.any(dets & self._discard_mask, axis=1)
-        dets = dets[keep_mask]
-        actual_obs = actual_obs[keep_mask]
+        if self.staged_sampler is not None:
+            dets, actual_obs = self.staged_sampler.sample(shots)
+            num_kept = dets.shape[0]
+        else:
+            dets, actual_obs = self.gap_circuit_sampler.sample(shots, separate_observables=True, bit_packed=True)
+            keep_mask = ~np.any(dets & self._discard_mask, axis=1)
+            dets = dets[keep_mask]
+            actual_obs = actual_obs[keep_mask]
+            num_kept = np.count_nonzero(keep_mask)
         assert actual_obs.shape[1] == 1
         actual_obs = actual_obs[:, 0]
-        predictions, gaps = self._decode_batch_overwrite_last_byte(bit_packed_dets=dets)
+        predictions, gaps = self.syndrome_cache.decode(dets)
         errors = predictions ^ actual_obs
-        counter = collections.Counter()
-        for gap, err in zip(gaps, errors):
-            counter[f'E{round(gap)}' if err else f'C{round(gap)}'] += 1
+        counter = gap_custom_counts(gaps=gaps, errors=errors)
         t1 = time.monotonic()
 
         return sinter.AnonTaskStats(
             shots=shots,
             errors=np.count_nonzero(errors),
-            discards=shots - np.count_nonzero(keep_mask),
+            discards=shots - num_kept,
             seconds=t1 - t0,
             custom_counts=counter,
         )
@@ -288,25 +203,232 @@ class CompiledDesaturationSampler(sinter.CompiledSampler):
         return predictions[0], math.ceil(gaps[0])
 
 
+def _derive_gap_parts(task: sinter.Task) -> tuple[stim.DetectorErrorModel, frozenset[int], stim.Circuit]:
+    dem = task.detector_error_model.flattened()
+    num_dets = dem.num_detectors
+    gap_circuit = task.circuit.copy()
+
+    # Parse color and basis annotations out of the dem.
+    det_coords = gen.DemArrays.from_dem(dem).detector_coordinates()
+    det_bases: list[Literal['X', 'Z', '!']] = []
+    det_colors: list[Literal['r', 'g', 'b', '_']] = []
+    postselected_detectors_hidden_from_matcher = set()
+    postselected_detectors_visible_to_matcher = set()
+
+    for d in range(num_dets):
+        coords = det_coords[d]
+        if len(coords) <= 4 or coords[4] == -9:
+            postselected_detectors_hidden_from_matcher.add(d)
+            det_bases.append('!')
+            det_colors.append('_')
+            continue
+
+        coord_annotation = int(coords[4])
+        basis = cast(Any, 'XXXZZZXZ'[coord_annotation])
+        color = cast(Any, 'rgbrgb__'[coord_annotation])
+        det_bases.append(basis)
+        det_colors.append(color)
+        if (color == 'r' and basis == 'X') or (color == 'g' and basis == 'Z'):
+            # Postselect the color code detectors that can be ablated, leaving a matchable code.
+            postselected_detectors_visible_to_matcher.add(d)
+
+    # Parse errors out of the dem.
+    errors = _DemError.list_from_dem(dem)
+
+    # Classify each single-basis error's obs flip, to help with decomposition.
+    dets_to_obs = {}
+    for err in errors:
+        bases = {
+            det_bases[d]
+            for d in err.det_set
+        }
+        if len(bases) == 1 and len(err.det_set) == 2 and err.obs_mask:
+            a, b = err.det_set
+            postselected_detectors_hidden_from_matcher.add(a)
+            postselected_detectors_hidden_from_matcher.add(b)
+        if len(bases) == 1:
+            dets_to_obs[err.det_set] = err.obs_mask
+
+    # Find single-basis RGB triplet errors that need to be simplified for the matcher.
+    virtual_pair_nodes = set()
+    for err in errors:
+        colors = {det_colors[d] for d in err.det_set}
+        bases = {det_bases[d] for d in err.det_set}
+        if len(err.det_set) == 3:
+            if len(bases) == 1 and colors == {'r', 'g', 'b'}:
+                a, b, c = err.det_set
+                virtual_pair_nodes.add(frozenset([a, b]))
+                virtual_pair_nodes.add(frozenset([a, c]))
+                virtual_pair_nodes.add(frozenset([b, c]))
+        elif len(err.det_set) == 2 and len(bases) == 1 and (colors == {'r', 'g'} or colors == {'r', 'b'} or colors == {'b', 'g'}):
+            a, b = err.det_set
+            virtual_pair_nodes.add(frozenset([a, b]))
+
+    pair2virtual = {}
+    for pair in sorted(virtual_pair_nodes, key=lambda e: tuple(sorted(e))):
+        k = len(pair2virtual) + num_dets
+        pair2virtual[pair] = k
+        a, b = pair
+        if a != -1 and b != -1:
+            det_coords[k] = [(x + y) / 2 for x, y in list(zip(det_coords[a], det_coords[b]))[:3]]
+        else:
+            c = a if a != -1 else b
+            det_coords[k] = det_coords[c][:3]
+            det_coords[k][0] += 0.25
+            det_coords[k][1] += 0.25
+            det_coords[k][2] += 0.25
+        gap_circuit.append('DETECTOR', [], det_coords[k])
+
+    matchable_dem = stim.DetectorErrorModel()
+    for k in range(num_dets + len(pair2virtual)):
+        matchable_dem.append('detector', det_coords[k], [stim.target_relative_detector_id(k)])
+    for err in errors:
+        colors = collections.Counter(det_colors[d] for d in err.det_set)
+        bases = collections.Counter(det_bases[d] for d in err.det_set)
+        if len(err.det_set) == 2 and err.det_set in virtual_pair_nodes:
+            # A boundary error at the side of the color code region.
+
+            # Add as a normal error, and also as a virtual-pair-node boundary error.
+            virtual_err = _DemError(
+                p=err.p,
+                det_set=frozenset([pair2virtual[err.det_set]]),
+                obs_mask=err.obs_mask,
+            )
+            matchable_dem.append(err.to_instruction())
+            matchable_dem.append(virtual_err.to_instruction())
+
+        elif len(err.det_set) == 3 and len(bases) == 1 and colors == collections.Counter('rgb'):
+            # This is a bulk error within the color code region.
+
+            # Split into three node-to-virtual-node-pair errors.
+            assert err.obs_mask == 0
+            for solo in err.det_set:
+                virtual_err = _DemError(
+                    p=err.p,
+                    obs_mask=err.obs_mask,
+                    det_set=frozenset([solo, pair2virtual[err.det_set ^ frozenset([solo])]]),
+                )
+                matchable_dem.append(virtual_err.to_instruction())
+
+        elif len(err.det_set) <= 2 and (bases.keys() == {'X'} or bases.keys() == {'Z'}):
+            # This is a simple matchable error.
+            matchable_dem.append(err.to_instruction())
+
+        elif bases['X'] <= 2 and bases['Z'] <= 2:
+            # This is a decomposable matchable error.
+
+            # Decompose into X part and Z part.
+            xs = frozenset([d for d in err.det_set if det_bases[d] == 'X'])
+            zs = frozenset([d for d in err.det_set if det_bases[d] == 'Z'])
+            if xs not in dets_to_obs or zs not in dets_to_obs:
+                # Don't know what the individual parts actually do.
+                continue
+
+            obs_x = dets_to_obs[xs]
+            obs_z = dets_to_obs[zs]
+            if obs_x ^ obs_z != err.obs_mask:
+                # Decomposition failed. Could be due to a distance 3 logical error.
+                continue
+
+            x_part = _DemError(p=err.p, det_set=xs, obs_mask=obs_x)
+            z_part = _DemError(p=err.p, det_set=zs, obs_mask=obs_z)
+            matchable_dem.append(_DemError.to_separated_instruction([
+                x_part,
+                z_part,
+            ]))
+        else:
+            # Too complicated. Don't tell the matcher about it.
+            pass
+
+    clipped_dem = clipped_matchable_dem(matchable_dem, postselected_detectors_hidden_from_matcher)
+    clipped_dem_with_det_for_obs = _dem_with_obs_detector(clipped_dem)
+    gap_circuit.append("DETECTOR", [], [-9, -9, -9])  # gap observable detector
+    assert gap_circuit.num_detectors == clipped_dem_with_det_for_obs.num_detectors
+
+    clipped_dem.append(stim.DemInstruction('detector', [-9, -9, -9], [stim.target_relative_detector_id(clipped_dem_with_det_for_obs.num_detectors - 1)]))
+    postselected_detectors = frozenset(postselected_detectors_hidden_from_matcher | postselected_detectors_visible_to_matcher)
+    return clipped_dem_with_det_for_obs, postselected_detectors, gap_circuit
+
+
+# Version of what `_derive_gap_parts` produces. Bump it whenever the derivation changes,
+# so that cache entries written by older code are derived again instead of reused.
+#   1: Initial format.
+#   2: Errors are parsed from the flattened dem by `gen.DemArrays`.
+_GAP_PARTS_FORMAT_VERSION = 2
+
+
+def _cache_key(task: sinter.Task) -> str:
+    prefix = f'v{_GAP_PARTS_FORMAT_VERSION}-'
+    if task.decoder is not None:
+        return prefix + task.strong_id()
+    # Without a decoder there's no strong id; hash the parts that affect the derivation.
+    h = hashlib.sha256()
+    h.update(str(task.circuit).encode('utf8'))
+    h.update(b'\n#dem\n')
+    h.update(str(task.detector_error_model).encode('utf8'))
+    return prefix + h.hexdigest()
+
+
+def _read_gap_parts(entry: pathlib.Path, task: sinter.Task) -> tuple[stim.DetectorErrorModel, frozenset[int], stim.Circuit]:
+    gap_dem = stim.DetectorErrorModel.from_file(entry / 'gap.dem')
+    postselected_detectors = frozenset(int(d) for d in np.load(entry / 'postselected_detectors.npy'))
+    gap_circuit = task.circuit.copy()
+    for coords in np.load(entry / 'extra_detector_coords.npy'):
+        gap_circuit.append('DETECTOR', [], coords.tolist())
+    return gap_dem, postselected_detectors, gap_circuit
+
+
+def _write_gap_parts(
+    entry: pathlib.Path,
+    task: sinter.Task,
+    *,
+    gap_dem: stim.DetectorErrorModel,
+    postselected_detectors: frozenset[int],
+    gap_circuit: stim.Circuit,
+) -> None:
+    """Writes a cache entry atomically, so concurrent workers never see a partial entry.
+
+    The gap circuit is the task circuit followed by extra coordinate-only detectors. Only
+    those coordinates are stored, because circuit text rounds coordinates.
+    """
+    extra_detectors = gap_circuit[len(task.circuit):]
+    assert task.circuit + extra_detectors == gap_circuit
+    extra_detector_coords = np.array([inst.gate_args_copy() for inst in extra_detectors], dtype=np.float64)
+    assert extra_detector_coords.shape == (gap_circuit.num_detectors - task.circuit.num_detectors, 3)
+
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    staging = pathlib.Path(tempfile.mkdtemp(dir=entry.parent, prefix=f'.{entry.name}.'))
+    gap_dem.to_file(staging / 'gap.dem')
+    np.save(staging / 'postselected_detectors.npy', np.array(sorted(postselected_detectors), dtype=np.int64))
+    np.save(staging / 'extra_detector_coords.npy', extra_detector_coords)
+    try:
+        staging.rename(entry)
+    except OSError:
+        # Another worker finished deriving the same entry first.
+        for f in staging.iterdir():
+            f.unlink()
+        staging.rmdir()
+
+
 def clipped_matchable_dem(flat_dem: stim.DetectorErrorModel, clip: AbstractSet[int]) -> stim.DetectorErrorModel:
     neighbors = collections.defaultdict(dict)
 
     heap: list[tuple[float, int, int]] = []
     boundaries = set()
-    for inst in flat_dem:
-        if inst.type == 'error':
-            if any(t.is_separator() for t in inst.targets_copy()):
-                continue
-            err = _DemError.from_error_instruction(inst)
-            w = -math.log(err.p / (1 - err.p))
-            if len(err.det_set) == 1:
-                a, = err.det_set
-                heapq.heappush(heap, (w, a, err.obs_mask))
-                boundaries.add(a)
-            elif len(err.det_set) == 2:
-                a, b = err.det_set
-                neighbors[a][b] = (w, err.obs_mask)
-                neighbors[b][a] = (w, err.obs_mask)
+    arrays = gen.DemArrays.from_dem(flat_dem)
+    det_counts = arrays.det_counts
+    for k in np.flatnonzero((arrays.part_counts == 1) & ((det_counts == 1) | (det_counts == 2))).tolist():
+        p = float(arrays.probabilities[k])
+        obs_mask = int(arrays.obs_masks[k])
+        w = -math.log(p / (1 - p))
+        if det_counts[k] == 1:
+            a, = arrays.dets_of(k).tolist()
+            heapq.heappush(heap, (w, a, obs_mask))
+            boundaries.add(a)
+        else:
+            a, b = arrays.dets_of(k).tolist()
+            neighbors[a][b] = (w, obs_mask)
+            neighbors[b][a] = (w, obs_mask)
 
     classification: dict[int, tuple[int, float]] = {}
     while heap:
@@ -318,10 +440,16 @@ def clipped_matchable_dem(flat_dem: stim.DetectorErrorModel, clip: AbstractSet[i
             if neighbor not in classification:
                 heapq.heappush(heap, (cost + extra_cost, neighbor, obs ^ extra_obs))
 
+    # Drop errors with at least two clipped detector targets.
+    dropped = (arrays.count_detector_targets_in(clip) >= 2).tolist()
     new_dem = stim.DetectorErrorModel()
+    k = 0
     for inst in flat_dem:
-        if inst.type != 'error' or sum(t.is_relative_detector_id() and t.val in clip for t in inst.targets_copy()) < 2:
-            new_dem.append(inst)
+        if inst.type == 'error':
+            k += 1
+            if dropped[k - 1]:
+                continue
+        new_dem.append(inst)
     for c in clip:
         if c not in boundaries and c in classification:
             obs, w = classification[c]
@@ -2,7 +2,7 @@ import sinter
 
 import gen
 import cultiv
-from ._desaturation_sampler import DesaturationSampler, _DemError
+from ._desaturation_sampler import DesaturationSampler, _DemError, _GAP_PARTS_FORMAT_VERSION
 
 
 def test_from_dem_end_to_end_d3():
@@ -49,3 +49,22 @@ def test_from_dem_end_to_end_d5():
             pred, gap = dec.decode_det_set(set(err.det_set))
             if gap != 0:
                 assert pred == err.obs_mask, (err, pred, gap)
+
+
+def test_compiled_sampler_cache_dir(tmp_path):
+    c = cultiv.make_end2end_cultivation_circuit(dcolor=3, dsurface=7, basis='Y', r_growing=2, r_end=1, inject_style='unitary')
+    c = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(c)
+    task = sinter.Task(circuit=c, detector_error_model=c.detector_error_model(), decoder='desaturation')
+    fresh = DesaturationSampler().compiled_sampler_for_task(task)
+
+    written = DesaturationSampler(cache_dir=tmp_path).compiled_sampler_for_task(task)
+    entries = list(tmp_path.iterdir())
+    assert [e.name for e in entries] == [f'v{_GAP_PARTS_FORMAT_VERSION}-{task.strong_id()}']
+    loaded = DesaturationSampler(cache_dir=tmp_path).compiled_sampler_for_task(task)
+    assert list(tmp_path.iterdir()) == entries
+
+    for dec in [written, loaded]:
+        assert dec.gap_dem == fresh.gap_dem
+        assert dec.gap_circuit == fresh.gap_circuit
+        assert dec.postselected_detectors == fresh.postselected_detectors
+        assert dec.decode_det_set(set()) == (False, 67)
@@ -0,0 +1,34 @@
+import collections
+
+import numpy as np
+
+
+def gap_custom_counts(*, gaps: np.ndarray, errors: np.ndarray) -> collections.Counter:
+    """Bins shots by their rounded gap, split by whether the shot was a logical error.
+
+    Args:
+        gaps: A float or int array with one gap per shot. Values are rounded to
+            the nearest integer (ties to even, like python's `round`).
+        errors: A bool array with one entry per shot, set for shots that were
+            logical errors.
+
+    Returns:
+        A counter mapping keys like 'C{gap}' (correct shots) and 'E{gap}'
+        (error shots) to the number of shots with that gap. Only non-zero
+        counts are included.
+    """
+    rounded = np.round(gaps).astype(np.int64)
+    errors = np.asarray(errors, dtype=np.bool_)
+    assert rounded.shape == errors.shape
+    result = collections.Counter()
+    if len(rounded) == 0:
+        return result
+
+    offset = min(0, int(np.min(rounded)))
+    rounded -= offset
+    size = int(np.max(rounded)) + 1
+    for prefix, hits in [('C', np.bincount(rounded[~errors], minlength=size)),
+                         ('E', np.bincount(rounded[errors], minlength=size))]:
+        for gap in np.flatnonzero(hits):
+            result[f'{prefix}{gap + offset}'] = int(hits[gap])
+    return result
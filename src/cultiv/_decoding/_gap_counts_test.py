@@ -0,0 +1,37 @@
+import collections
+
+import numpy as np
+
+from ._gap_counts import gap_custom_counts
+
+
+def test_gap_custom_counts():
+    assert gap_custom_counts(gaps=np.array([]), errors=np.array([], dtype=np.bool_)) == collections.Counter()
+
+    assert gap_custom_counts(
+        gaps=np.array([0, 1.4, 1.6, 2.5, 3.5, 7, 7, 7]),
+        errors=np.array([0, 0, 1, 0, 1, 0, 1, 0], dtype=np.bool_),
+    ) == collections.Counter({
+        'C0': 1,
+        'C1': 1,
+        'E2': 1,
+        'C2': 1,
+        'E4': 1,
+        'C7': 2,
+        'E7': 1,
+    })
+
+    assert gap_custom_counts(
+        gaps=np.array([-3, 2], dtype=np.int64),
+        errors=np.array([True, False]),
+    ) == collections.Counter({'E-3': 1, 'C2': 1})
+
+
+def test_gap_custom_counts_matches_loop():
+    rng = np.random.default_rng(1234)
+    gaps = rng.random(10_000) * 100
+    errors = rng.random(10_000) < 0.1
+    expected = collections.Counter()
+    for gap, err in zip(gaps, errors):
+        expected[f'E{round(gap)}' if err else f'C{round(gap)}'] += 1
+    assert gap_custom_counts(gaps=gaps, errors=errors) == expected
@@ -27,10 +27,95 @@ def dem_to_single_error_lookup_table(dem: stim.DetectorErrorModel) -> dict[tuple
     return result
 
 
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _hash_bit_packed_rows(rows: np.ndarray) -> np.ndarray:
+    """Returns a 64 bit hash of each row of a uint8 array."""
+    num_rows, num_bytes = rows.shape
+    num_words = -(-num_bytes // 8)
+    words = np.zeros(shape=(num_rows, num_words * 8), dtype=np.uint8)
+    words[:, :num_bytes] = rows
+    words = words.view(np.uint64)
+    result = np.full(shape=num_rows, fill_value=num_bytes, dtype=np.uint64)
+    for w in range(num_words):
+        result ^= words[:, w]
+        result *= _HASH_MULTIPLIER
+        result ^= result >> np.uint64(29)
+    return result
+
+
+class SingleErrorLookupTable:
+    """An array-backed version of `dem_to_single_error_lookup_table`, for decoding whole batches.
+
+    Entries are sorted by a 64 bit hash of their bit packed syndrome, so each shot is
+    found with `np.searchsorted`. Hash matches are verified against the stored syndrome.
+    """
+
+    def __init__(self, *, hashes: np.ndarray, syndromes: np.ndarray, predictions: np.ndarray):
+        self.hashes = hashes
+        self.syndromes = syndromes
+        self.predictions = predictions
+
+    @staticmethod
+    def from_dem(dem: stim.DetectorErrorModel) -> 'SingleErrorLookupTable':
+        table = dem_to_single_error_lookup_table(dem)
+        num_det_bytes = math.ceil(dem.num_detectors / 8)
+        num_obs_bytes = math.ceil(dem.num_observables / 8)
+        syndromes = np.zeros(shape=(len(table), num_det_bytes), dtype=np.uint8)
+        predictions = np.zeros(shape=(len(table), num_obs_bytes), dtype=np.uint8)
+        for k, (dets, prediction) in enumerate(table.items()):
+            for d in dets:
+                syndromes[k, d // 8] ^= 1 << (d % 8)
+            predictions[k] = prediction
+        hashes = _hash_bit_packed_rows(syndromes)
+        order = np.argsort(hashes, kind='stable')
+        return SingleErrorLookupTable(
+            hashes=hashes[order],
+            syndromes=syndromes[order],
+            predictions=predictions[order],
+        )
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def lookup(self, bit_packed_dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Looks up every shot in a batch.
+
+        Args:
+            bit_packed_dets: A uint8 array of shape (num_shots, num_det_bytes).
+
+        Returns:
+            A (found, predictions) tuple. `found` is a bool array of shape (num_shots,).
+            `predictions` is a uint8 array of shape (num_shots, num_obs_bytes) holding the
+            bit packed predicted observable flips, or zeros where the shot wasn't found.
+        """
+        num_shots = bit_packed_dets.shape[0]
+        row_hashes = _hash_bit_packed_rows(bit_packed_dets)
+        index = np.searchsorted(self.hashes, row_hashes)
+        index[index == len(self.hashes)] = 0
+        found = self.hashes[index] == row_hashes
+        found &= np.all(self.syndromes[index] == bit_packed_dets, axis=1)
+
+        # A hash match with a different syndrome may be due to entries sharing a hash.
+        for shot in np.flatnonzero((self.hashes[index] == row_hashes) & ~found):
+            k = index[shot]
+            while k < len(self.hashes) and self.hashes[k] == row_hashes[shot]:
+                if np.array_equal(self.syndromes[k], bit_packed_dets[shot]):
+                    index[shot] = k
+                    found[shot] = True
+                    break
+                k += 1
+
+        predictions = np.zeros(shape=(num_shots, self.predictions.shape[1]), dtype=np.uint8)
+        predictions[found] = self.predictions[index[found]]
+        return found, predictions
+
+
 class CompiledHighlanderSampler(sinter.CompiledSampler):
     def __init__(self, task: sinter.Task):
         self.stim_sampler = task.circuit.compile_detector_sampler()
-        self.lookup_table = dem_to_single_error_lookup_table(task.detector_error_model)
+        self.lookup_table = SingleErrorLookupTable.from_dem(task.detector_error_model)
 
     def sample(self, max_shots: int) -> sinter.AnonTaskStats:
         t0 = time.monotonic()
@@ -41,15 +126,9 @@ class CompiledHighlanderSampler(sinter.CompiledSampler):
         )
         num_shots = dets.shape[0]
 
-        num_discards = 0
-        num_errors = 0
-        for shot in range(num_shots):
-            key = tuple(np.flatnonzero(np.unpackbits(dets[shot], bitorder='little')))
-            prediction = self.lookup_table.get(key)
-            if prediction is None:
-                num_discards += 1
-            elif not np.array_equal(prediction, obs[shot]):
-                num_errors += 1
+        found, predictions = self.lookup_table.lookup(dets)
+        num_discards = num_shots - np.count_nonzero(found)
+        num_errors = np.count_nonzero(np.any(predictions[found] != obs[found], axis=1))
         t1 = time.monotonic()
 
         return sinter.AnonTaskStats(
@@ -0,0 +1,53 @@
+import numpy as np
+import sinter
+import stim
+
+from . import _highlander_sampler
+from ._highlander_sampler import CompiledHighlanderSampler, SingleErrorLookupTable, dem_to_single_error_lookup_table
+
+
+def test_single_error_lookup_table():
+    circuit = stim.Circuit.generated('repetition_code:memory', distance=5, rounds=3, after_clifford_depolarization=0.01)
+    dem = circuit.detector_error_model()
+    table = dem_to_single_error_lookup_table(dem)
+    packed = SingleErrorLookupTable.from_dem(dem)
+    assert len(packed) == len(table)
+
+    dets, _ = circuit.compile_detector_sampler().sample(2000, bit_packed=True, separate_observables=True)
+    found, predictions = packed.lookup(dets)
+    for shot in range(dets.shape[0]):
+        key = tuple(np.flatnonzero(np.unpackbits(dets[shot], bitorder='little')))
+        expected = table.get(key)
+        assert found[shot] == (expected is not None)
+        if expected is not None:
+            np.testing.assert_array_equal(predictions[shot], expected)
+        else:
+            assert not np.any(predictions[shot])
+    assert 0 < np.count_nonzero(found) < len(found)
+
+
+def test_single_error_lookup_table_hash_collisions(monkeypatch):
+    syndromes = np.array([[1, 0], [2, 0], [3, 0]], dtype=np.uint8)
+    packed = SingleErrorLookupTable(
+        hashes=np.array([5, 5, 5], dtype=np.uint64),
+        syndromes=syndromes,
+        predictions=np.array([[1], [2], [3]], dtype=np.uint8),
+    )
+    dets = np.array([[3, 0], [4, 0], [1, 0], [2, 0]], dtype=np.uint8)
+    monkeypatch.setattr(
+        _highlander_sampler,
+        '_hash_bit_packed_rows',
+        lambda rows: np.full(shape=rows.shape[0], fill_value=5, dtype=np.uint64),
+    )
+    found, predictions = packed.lookup(dets)
+    np.testing.assert_array_equal(found, [True, False, True, True])
+    np.testing.assert_array_equal(predictions[:, 0], [3, 0, 1, 2])
+
+
+def test_highlander_sampler():
+    circuit = stim.Circuit.generated('repetition_code:memory', distance=5, rounds=3, after_clifford_depolarization=0.01)
+    sampler = CompiledHighlanderSampler(sinter.Task(circuit=circuit, detector_error_model=circuit.detector_error_model()))
+    stats = sampler.sample(10_000)
+    assert stats.shots == 10_000
+    assert 50 < stats.discards < 1000
+    assert stats.errors < 0.01 * (stats.shots - stats.discards)
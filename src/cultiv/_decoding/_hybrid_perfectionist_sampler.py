@@ -0,0 +1,90 @@
+import dataclasses
+
+import sinter
+import stim
+
+from cultiv._error_enumeration_report import ErrorEnumerationReport
+from ._stratified_perfectionist_sampler import (
+    CompiledStratifiedPerfectionistSampler,
+    FaultCountStrata,
+    StratifiedRates,
+)
+
+
+class HybridPerfectionistSampler(sinter.Sampler):
+    """Estimates perfectionist rates by enumerating low weight errors and sampling the rest.
+
+    Every logical error made of at most max_weight faults is found by
+    `ErrorEnumerationReport`, so the error rate of the strata with at most max_weight
+    faults is known exactly. Only the strata with more faults are sampled for errors,
+    which is where all the remaining uncertainty is. The low weight strata are still
+    sampled (with a small share of the shots) for their discard rates, unless they were
+    small enough for `FaultCountStrata` to enumerate.
+
+    The returned stats are like those of `StratifiedPerfectionistSampler`: their
+    `errors` field estimates the error count from the exact contribution of the low
+    weight strata plus the reweighted sampled counts of the higher strata, and the
+    per-stratum counts are in the custom counts. Use
+    `HybridPerfectionistEstimator.estimate` on the custom counts for confidence
+    intervals.
+    """
+    def __init__(self, max_weight: int = 4, max_faults: int | None = None):
+        self.max_weight = max_weight
+        self.max_faults = max_faults
+
+    def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
+        dem = task.detector_error_model
+        if dem is None:
+            dem = task.circuit.detector_error_model()
+        estimator = HybridPerfectionistEstimator.from_dem(dem, max_weight=self.max_weight, max_faults=self.max_faults)
+        return CompiledStratifiedPerfectionistSampler(estimator.strata, exact_error_rates=estimator.exact_error_rates)
+
+
+@dataclasses.dataclass(frozen=True)
+class HybridPerfectionistEstimator:
+    """Combines exactly enumerated low weight logical errors with sampled fault strata.
+
+    `exact_error_rates[k]` is the chance that exactly k faults cause an undetected
+    logical error, conditioned on exactly k faults happening. It's the total probability
+    of the enumerated logical errors with k faults divided by the probability of the k
+    fault stratum.
+    """
+    strata: FaultCountStrata
+    report: ErrorEnumerationReport
+    exact_error_rates: dict[int, float]
+
+    @staticmethod
+    def from_dem(
+        dem: stim.DetectorErrorModel,
+        *,
+        max_weight: int,
+        max_faults: int | None = None,
+        cache: dict[str, list[tuple[int, ...]]] | None = None,
+    ) -> 'HybridPerfectionistEstimator':
+        """
+        Args:
+            dem: The error model to estimate rates for.
+            max_weight: Logical errors with up to this many faults are enumerated.
+            max_faults: Passed to `FaultCountStrata.from_dem`.
+            cache: Passed to `ErrorEnumerationReport.from_dem`.
+        """
+        strata = FaultCountStrata.from_dem(dem, max_faults=max_faults)
+        report = ErrorEnumerationReport.from_dem(dem, max_weight=max_weight, cache=cache)
+        probabilities = strata.probabilities
+        exact_error_rates = {}
+        for k in range(1, min(max_weight, strata.max_faults) + 1):
+            if probabilities[k] > 0:
+                heralded_probability = report.distance_to_heralded_error_rate[k] * report.keep_rate
+                exact_error_rates[k] = float(heralded_probability / probabilities[k])
+        return HybridPerfectionistEstimator(
+            strata=strata,
+            report=report,
+            exact_error_rates=exact_error_rates,
+        )
+
+    def estimate(self, custom_counts: dict[str, int], *, confidence: float = 0.95) -> StratifiedRates:
+        return self.strata.estimate(
+            custom_counts,
+            confidence=confidence,
+            exact_error_rates=self.exact_error_rates,
+        )
@@ -0,0 +1,66 @@
+import itertools
+
+import numpy as np
+import sinter
+import stim
+
+from ._hybrid_perfectionist_sampler import HybridPerfectionistEstimator, HybridPerfectionistSampler
+
+
+def test_exact_error_rates_match_brute_force():
+    dem = stim.DetectorErrorModel("""
+        error(0.1) D0
+        error(0.2) D0 D1
+        error(0.05) D1 L0
+        error(0.01) D2 L0
+        error(0.03) D2
+    """)
+    estimator = HybridPerfectionistEstimator.from_dem(dem, max_weight=3, max_faults=4)
+    assert set(estimator.exact_error_rates) == {1, 2, 3}
+    for k, (error_rate, _) in estimator.strata.exact_rates.items():
+        assert abs(estimator.exact_error_rates[k] - error_rate) < 1e-12
+
+    error_set = estimator.report.error_set
+    probabilities = estimator.strata.probabilities
+    for k in [1, 2, 3]:
+        total = 0
+        for fired in itertools.combinations(range(len(error_set.errors)), k):
+            det = 0
+            obs = 0
+            for e in fired:
+                det ^= error_set.errors[e].det
+                obs ^= error_set.errors[e].obs
+            if det == 0 and obs:
+                total += np.prod([p if e in fired else 1 - p for e, p in enumerate(error_set.probs)])
+        assert abs(estimator.exact_error_rates[k] - total / probabilities[k]) < 1e-12
+
+
+def test_hybrid_estimate_matches_direct_sampling():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=3,
+        after_clifford_depolarization=0.02,
+        before_measure_flip_probability=0.02,
+    )
+    task = sinter.Task(circuit=circuit, detector_error_model=circuit.detector_error_model())
+    compiled = HybridPerfectionistSampler(max_weight=3).compiled_sampler_for_task(task)
+    stats = compiled.sample(100_000)
+    assert stats.shots == 100_000
+    estimator = HybridPerfectionistEstimator.from_dem(task.detector_error_model, max_weight=3)
+    rates = estimator.estimate(stats.custom_counts)
+
+    shots = 1_000_000
+    dets, obs = circuit.compile_detector_sampler().sample(shots, separate_observables=True)
+    kept = ~np.any(dets, axis=1)
+    direct_discard_rate = 1 - np.mean(kept)
+    direct_error_rate = np.count_nonzero(obs[kept, 0]) / shots
+
+    assert rates.error_rate_low < rates.error_rate < rates.error_rate_high
+    assert abs(rates.error_rate - direct_error_rate) < 4e-5 + 0.1 * direct_error_rate
+    assert abs(rates.discard_rate - direct_discard_rate) < 0.003
+
+    # The sinter facing counts include the exactly known low weight errors.
+    assert abs(stats.discards / stats.shots - direct_discard_rate) < 0.003
+    expected_errors = stats.shots * rates.error_rate
+    assert abs(stats.errors - expected_errors) < 5 * expected_errors**0.5 + 2
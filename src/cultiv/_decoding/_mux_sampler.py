@@ -1,31 +1,92 @@
+import importlib
+from typing import Any
+
 import sinter
+import stim
+
+# Maps each decoder name to the submodule and class of its sampler (or sinter decoder),
+# and the constructor arguments. Submodules are only imported once a sampler is actually
+# used, so that e.g. a sinter worker collecting with `perfectionist` doesn't pay for
+# importing pymatching, chromobius, or the vector simulators.
+_SAMPLER_FACTORIES: dict[str, tuple[str, str, dict[str, Any]]] = {
+    'highlander': ('_highlander_sampler', 'HighlanderSampler', {}),
+    'vec_intercept_t': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.25, 'sweep_bit_randomization': False}),
+    'vec_intercept_z': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 1, 'sweep_bit_randomization': False}),
+    'vec_intercept_s': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.5, 'sweep_bit_randomization': False}),
+    'vec_intercept_t_twirl': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.25, 'sweep_bit_randomization': False}),
+    'vec_intercept_z_twirl': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 1, 'sweep_bit_randomization': False}),
+    'vec_intercept_s_twirl': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.5, 'sweep_bit_randomization': False}),
+    'vec_intercept_t_shortcut': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.25, 'sweep_bit_randomization': False, 'fault_free_shortcut': True}),
+    'vec_intercept_z_shortcut': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 1, 'sweep_bit_randomization': False, 'fault_free_shortcut': True}),
+    'vec_intercept_s_shortcut': ('_vec_intercept_sampler', 'VecInterceptSampler', {'turns': 0.5, 'sweep_bit_randomization': False, 'fault_free_shortcut': True}),
+    'twirl_intercept_t': ('_twirl_intercept_sampler', 'TwirlInterceptSampler', {'turns': 0.25}),
+    'twirl_intercept_z': ('_twirl_intercept_sampler', 'TwirlInterceptSampler', {'turns': 1}),
+    'twirl_intercept_s': ('_twirl_intercept_sampler', 'TwirlInterceptSampler', {'turns': 0.5}),
+    'chromobius-gap': ('_chromobius_gap_sampler', 'ChromobiusGapSampler', {}),
+    'desaturation': ('_desaturation_sampler', 'DesaturationSampler', {}),
+    'desaturation-staged': ('_desaturation_sampler', 'DesaturationSampler', {'early_discard': True}),
+    'perfectionist-staged': ('_perfectionist_sampler', 'PerfectionistSampler', {'early_discard': True}),
+    'perfectionist-hybrid': ('_hybrid_perfectionist_sampler', 'HybridPerfectionistSampler', {}),
+    'perfectionist-stratified': ('_stratified_perfectionist_sampler', 'StratifiedPerfectionistSampler', {}),
+    'pymatching-gap': ('_pymatching_gap_sampler', 'PymatchingGapSampler', {}),
+}
+_DECODER_FACTORIES: dict[str, tuple[str, str, dict[str, Any]]] = {
+    'notouch': ('_no_touch_decoder', 'NoTouchDecoder', {'discard_on_fail': True}),
+    'notouch-hope': ('_no_touch_decoder', 'NoTouchDecoder', {'discard_on_fail': False}),
+    'chromobius-continue': ('_chromobius_continue_decoder', 'ChromobiusContinueDecoder', {}),
+}
+
+
+class _LazyImport:
+    """Imports a class from a submodule and instantiates it on first use."""
+
+    def __init__(self, module: str, cls: str, kwargs: dict[str, Any]):
+        self.module = module
+        self.cls = cls
+        self.kwargs = kwargs
+        self._value: Any = None
+
+    @property
+    def value(self) -> Any:
+        if self._value is None:
+            module = importlib.import_module(f'{__package__}.{self.module}')
+            self._value = getattr(module, self.cls)(**self.kwargs)
+        return self._value
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Workers re-import the value themselves, instead of unpickling it.
+        return {**self.__dict__, '_value': None}
+
+    def __repr__(self) -> str:
+        args = ', '.join(f'{k}={v!r}' for k, v in self.kwargs.items())
+        return f'{type(self).__name__}({self.cls}({args}))'
+
+
+class LazySampler(_LazyImport, sinter.Sampler):
+    """A sampler that imports and creates the sampler it stands for on first use."""
+
+    def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
+        return self.value.compiled_sampler_for_task(task)
+
+
+class LazyDecoder(_LazyImport, sinter.Decoder):
+    """A decoder that imports and creates the decoder it stands for on first use."""
+
+    def compile_decoder_for_dem(self, *, dem: stim.DetectorErrorModel) -> sinter.CompiledDecoder:
+        return self.value.compile_decoder_for_dem(dem=dem)
 
-from ._chromobius_continue_decoder import ChromobiusContinueDecoder
-from ._chromobius_gap_sampler import ChromobiusGapSampler
-from ._pymatching_gap_sampler import PymatchingGapSampler
-from ._desaturation_sampler import DesaturationSampler
-from ._highlander_sampler import HighlanderSampler
-from ._no_touch_decoder import NoTouchDecoder
-from ._vec_intercept_sampler import VecInterceptSampler
-from ._twirl_intercept_sampler import TwirlInterceptSampler
+    def decode_via_files(self, **kwargs: Any) -> None:
+        return self.value.decode_via_files(**kwargs)
 
 
-def sinter_samplers() -> dict[str, sinter.Sampler]:
+def sinter_samplers() -> dict[str, sinter.Sampler | sinter.Decoder]:
     return {
-        'highlander': HighlanderSampler(),
-        'vec_intercept_t': VecInterceptSampler(turns=0.25, sweep_bit_randomization=False),
-        'vec_intercept_z': VecInterceptSampler(turns=1, sweep_bit_randomization=False),
-        'vec_intercept_s': VecInterceptSampler(turns=0.5, sweep_bit_randomization=False),
-        'vec_intercept_t_twirl': VecInterceptSampler(turns=0.25, sweep_bit_randomization=False),
-        'vec_intercept_z_twirl': VecInterceptSampler(turns=1, sweep_bit_randomization=False),
-        'vec_intercept_s_twirl': VecInterceptSampler(turns=0.5, sweep_bit_randomization=False),
-        'twirl_intercept_t': TwirlInterceptSampler(turns=0.25),
-        'twirl_intercept_z': TwirlInterceptSampler(turns=1),
-        'twirl_intercept_s': TwirlInterceptSampler(turns=0.5),
-        'notouch': NoTouchDecoder(discard_on_fail=True),
-        'notouch-hope': NoTouchDecoder(discard_on_fail=False),
-        'chromobius-continue': ChromobiusContinueDecoder(),
-        'chromobius-gap': ChromobiusGapSampler(),
-        'desaturation': DesaturationSampler(),
-        'pymatching-gap': PymatchingGapSampler(),
+        **{
+            name: LazySampler(module, cls, kwargs)
+            for name, (module, cls, kwargs) in _SAMPLER_FACTORIES.items()
+        },
+        **{
+            name: LazyDecoder(module, cls, kwargs)
+            for name, (module, cls, kwargs) in _DECODER_FACTORIES.items()
+        },
     }
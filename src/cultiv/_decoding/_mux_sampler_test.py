@@ -1,5 +1,42 @@
+import os
+import pathlib
+import pickle
+import subprocess
+import sys
+
+import sinter
+
 from cultiv import sinter_samplers
 
 
 def test_sinter_samplers():
     assert sinter_samplers() is not None
+
+
+def test_sinter_samplers_create_real_samplers():
+    samplers = sinter_samplers()
+    for name, sampler in samplers.items():
+        expected_type = sinter.Decoder if isinstance(sampler, sinter.Decoder) else sinter.Sampler
+        assert isinstance(sampler.value, expected_type), name
+        assert type(sampler.value).__name__ == sampler.cls
+    assert isinstance(samplers['notouch'], sinter.Decoder)
+    assert isinstance(samplers['perfectionist-staged'], sinter.Sampler)
+    assert samplers['notouch-hope'].value.discard_on_fail is False
+    assert samplers['vec_intercept_t_shortcut'].value.fault_free_shortcut
+    assert not samplers['vec_intercept_t'].value.fault_free_shortcut
+
+    restored = pickle.loads(pickle.dumps(samplers['desaturation-staged']))
+    assert restored._value is None
+    assert restored.value.early_discard
+
+
+def test_import_cultiv_is_lazy():
+    heavy = ['gen', 'pymatching', 'chromobius', 'latte.vec_sim', 'cultiv._construction']
+    result = subprocess.run(
+        [sys.executable, '-c', f'import sys, cultiv; cultiv.sinter_samplers(); print([m for m in {heavy!r} if m in sys.modules])'],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, 'PYTHONPATH': str(pathlib.Path(__file__).parent.parent.parent)},
+    )
+    assert result.stdout.strip() == '[]'
@@ -39,10 +39,92 @@ class _LocalLookup:
     local_symptoms_to_error_index: dict[frozenset[int], int]
 
 
+@dataclasses.dataclass(frozen=True)
+class _FlatLookup:
+    """The local lookups of a `_GlobalLookup`, flattened into arrays for batch decoding.
+
+    A set of detectors is hashed by xoring the salts of its detectors. Each entry of the
+    symptom table combines a detector's tag with the hash of one of its local symptom sets.
+    """
+    det_salts: np.ndarray
+    det_tags: np.ndarray
+    neighborhood_starts: np.ndarray
+    neighborhoods: np.ndarray
+    error_starts: np.ndarray
+    error_dets: np.ndarray
+    symptom_keys: np.ndarray
+    symptom_dets: np.ndarray
+    symptom_errors: np.ndarray
+
+    @staticmethod
+    def from_local_lookups(
+        *,
+        num_dets: int,
+        error_det_lists: list[list[int]],
+        det_to_local_lookup: dict[int, _LocalLookup],
+    ) -> '_FlatLookup':
+        rng = np.random.default_rng(seed=0)
+        det_salts = rng.integers(0, 2**64, size=num_dets, dtype=np.uint64, endpoint=False)
+        det_tags = rng.integers(0, 2**64, size=num_dets, dtype=np.uint64, endpoint=False)
+
+        def hash_dets(dets) -> np.uint64:
+            return np.bitwise_xor.reduce(det_salts[sorted(dets)], initial=np.uint64(0))
+
+        neighborhood_starts = np.zeros(shape=num_dets + 1, dtype=np.int64)
+        neighborhoods = []
+        symptom_keys = []
+        symptom_dets = []
+        symptom_errors = []
+        for det in range(num_dets):
+            lookup = det_to_local_lookup.get(det)
+            if lookup is None:
+                # Nothing can flip this detector, so no local symptoms will ever match.
+                neighborhoods.append(det)
+            else:
+                neighborhoods.extend(sorted(lookup.neighborhood))
+                for symptoms, err_index in lookup.local_symptoms_to_error_index.items():
+                    symptom_keys.append(hash_dets(symptoms) ^ det_tags[det])
+                    symptom_dets.append(det)
+                    symptom_errors.append(err_index)
+            neighborhood_starts[det + 1] = len(neighborhoods)
+
+        error_starts = np.zeros(shape=len(error_det_lists) + 1, dtype=np.int64)
+        error_starts[1:] = np.cumsum([len(e) for e in error_det_lists])
+        error_dets = np.array([d for e in error_det_lists for d in e], dtype=np.int64)
+
+        symptom_keys = np.array(symptom_keys, dtype=np.uint64)
+        order = np.argsort(symptom_keys, kind='stable')
+        return _FlatLookup(
+            det_salts=det_salts,
+            det_tags=det_tags,
+            neighborhood_starts=neighborhood_starts,
+            neighborhoods=np.array(neighborhoods, dtype=np.int64),
+            error_starts=error_starts,
+            error_dets=error_dets,
+            symptom_keys=symptom_keys[order],
+            symptom_dets=np.array(symptom_dets, dtype=np.int64)[order],
+            symptom_errors=np.array(symptom_errors, dtype=np.int64)[order],
+        )
+
+
+def _csr_gather(starts: np.ndarray, values: np.ndarray, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Concatenates the CSR rows with the given indices.
+
+    Returns:
+        A (gathered values, offset of each row in the result, length of each row) tuple.
+    """
+    row_starts = starts[rows]
+    lengths = starts[rows + 1] - row_starts
+    offsets = np.cumsum(lengths) - lengths
+    flat_index = np.arange(np.sum(lengths)) - np.repeat(offsets - row_starts, lengths)
+    return values[flat_index], offsets, lengths
+
+
 @dataclasses.dataclass(frozen=True)
 class _GlobalLookup:
     obs_masks: np.ndarray
     det_to_local_lookup: dict[int, _LocalLookup]
+    flat: _FlatLookup
 
     @staticmethod
     def from_dem(dem: stim.DetectorErrorModel) -> '_GlobalLookup':
@@ -74,14 +156,21 @@ class _GlobalLookup:
             )
 
         obs_masks = np.array([err.obs for err in error_list], dtype=np.uint8)
+        flat = _FlatLookup.from_local_lookups(
+            num_dets=dem.num_detectors,
+            error_det_lists=[err.det_list() for err in error_list],
+            det_to_local_lookup=det_to_local_lookup,
+        )
 
-        return _GlobalLookup(det_to_local_lookup=det_to_local_lookup, obs_masks=obs_masks)
+        return _GlobalLookup(det_to_local_lookup=det_to_local_lookup, obs_masks=obs_masks, flat=flat)
 
 
 class CompiledNoTouchDecoder(sinter.CompiledDecoder):
-    def __init__(self, dem: stim.DetectorErrorModel, discard_on_fail: bool):
+    def __init__(self, dem: stim.DetectorErrorModel, discard_on_fail: bool, batch_size: int = 4096):
         self.lookup = _GlobalLookup.from_dem(dem)
         self.discard_on_fail = discard_on_fail
+        self.num_dets = dem.num_detectors
+        self.batch_size = batch_size
 
     def decode_det_set(self, detection_events: frozenset[int]) -> int | None:
         forced = {}
@@ -110,10 +199,82 @@ class CompiledNoTouchDecoder(sinter.CompiledDecoder):
     ) -> np.ndarray:
         dets = bit_packed_detection_event_data
         result = np.zeros(shape=(dets.shape[0], 2), dtype=np.uint8)
-        for k in range(len(dets)):
-            prediction = self.decode_det_set(frozenset(np.flatnonzero(np.unpackbits(dets[k], bitorder='little'))))
+        for start in range(0, len(dets), self.batch_size):
+            end = min(start + self.batch_size, len(dets))
+            self._decode_batch_into(dets[start:end], result[start:end])
+        return result
+
+    def _decode_batch_into(self, dets: np.ndarray, out: np.ndarray) -> None:
+        """Decodes a batch in numpy, falling back to `decode_det_set` for ambiguous shots.
+
+        A shot is unambiguous when every detection event's local symptoms match a local
+        error and no two of those errors disagree about a detector. Shots failing that
+        check are discarded when `discard_on_fail` is set, and otherwise use the slow
+        path (where the result depends on the order detection events are visited).
+        """
+        flat = self.lookup.flat
+        num_shots = dets.shape[0]
+        fired = np.unpackbits(dets, axis=1, bitorder='little', count=self.num_dets).view(np.bool_)
+        pair_shots, pair_dets = np.nonzero(fired)
+        if len(pair_shots) == 0:
+            return
+
+        # Hash the fired part of each detection event's neighborhood, and look it up.
+        neighbors, offsets, lengths = _csr_gather(flat.neighborhood_starts, flat.neighborhoods, pair_dets)
+        neighbor_fired = fired[np.repeat(pair_shots, lengths), neighbors]
+        symptom_hashes = np.bitwise_xor.reduceat(np.where(neighbor_fired, flat.det_salts[neighbors], np.uint64(0)), offsets)
+        num_symptoms = np.add.reduceat(neighbor_fired, offsets)
+        keys = symptom_hashes ^ flat.det_tags[pair_dets]
+        entries = np.searchsorted(flat.symptom_keys, keys)
+        entries[entries == len(flat.symptom_keys)] = 0
+        found = flat.symptom_keys[entries] == keys
+        pair_errors = flat.symptom_errors[entries]
+
+        # Verify hash matches exactly: the error must belong to the detection event's local
+        # lookup and its detectors must be exactly the fired neighbors.
+        error_lengths = np.diff(flat.error_starts)[pair_errors]
+        matched = found & (flat.symptom_dets[entries] == pair_dets) & (error_lengths == num_symptoms)
+        matched_pairs = np.flatnonzero(matched)
+        error_dets, error_offsets, error_lengths = _csr_gather(flat.error_starts, flat.error_dets, pair_errors[matched_pairs])
+        matched_pair_of_error_det = np.repeat(matched_pairs, error_lengths)
+        error_det_fired = fired[pair_shots[matched_pair_of_error_det], error_dets]
+        if len(matched_pairs):
+            matched[matched_pairs] = np.logical_and.reduceat(error_det_fired, error_offsets)
+
+        failed_shots = np.zeros(shape=num_shots, dtype=np.bool_)
+        failed_shots[pair_shots[~found]] = True
+        ambiguous_shots = np.zeros(shape=num_shots, dtype=np.bool_)
+        ambiguous_shots[pair_shots[found & ~matched]] = True
+
+        # Two detection events explained by different errors that share a detector conflict.
+        triple_shots = pair_shots[matched_pair_of_error_det]
+        triple_errors = pair_errors[matched_pair_of_error_det]
+        order = np.lexsort((triple_errors, error_dets, triple_shots))
+        triple_shots = triple_shots[order]
+        error_dets = error_dets[order]
+        triple_errors = triple_errors[order]
+        conflicts = (triple_shots[1:] == triple_shots[:-1]) & (error_dets[1:] == error_dets[:-1]) & (triple_errors[1:] != triple_errors[:-1])
+        failed_shots[triple_shots[1:][conflicts]] = True
+
+        failed_shots &= ~ambiguous_shots
+        if self.discard_on_fail:
+            out[failed_shots, 1] = 1
+        else:
+            ambiguous_shots |= failed_shots
+        clean_shots = ~(failed_shots | ambiguous_shots)
+
+        # The prediction is the combined effect of the distinct errors used by the shot.
+        clean_pairs = np.flatnonzero(clean_shots[pair_shots])
+        shot_errors = np.unique(pair_shots[clean_pairs] * len(self.lookup.obs_masks) + pair_errors[clean_pairs])
+        np.bitwise_xor.at(
+            out[:, 0],
+            shot_errors // len(self.lookup.obs_masks),
+            self.lookup.obs_masks[shot_errors % len(self.lookup.obs_masks)],
+        )
+
+        for k in np.flatnonzero(ambiguous_shots):
+            prediction = self.decode_det_set(frozenset(np.flatnonzero(fired[k])))
             if prediction is None:
-                result[k, 1] = 1
+                out[k, 1] = 1
             else:
-                result[k, 0] = prediction
-        return result
+                out[k, 0] = prediction
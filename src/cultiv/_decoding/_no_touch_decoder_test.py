@@ -1,3 +1,4 @@
+import numpy as np
 import stim
 
 from cultiv._error_set import DemError
@@ -52,6 +53,15 @@ def test_simple_case():
     assert decoder.decode_det_set(frozenset([0, 3, 5, 6])) is None
     assert decoder.decode_det_set(frozenset([0, 2, 3, 5, 6])) is None
 
+    all_subsets = np.arange(1 << 7, dtype=np.uint8).reshape(-1, 1)
+    result = decoder.decode_shots_bit_packed(bit_packed_detection_event_data=all_subsets)
+    for k in range(1 << 7):
+        expected = decoder.decode_det_set(frozenset(d for d in range(7) if k & (1 << d)))
+        if expected is None:
+            assert result[k, 1] == 1
+        else:
+            assert (result[k, 0], result[k, 1]) == (expected, 0)
+
 
 def test_surface_code():
     circuit = stim.Circuit.generated(
@@ -70,3 +80,27 @@ def test_surface_code():
 
     for err in err_list:
         assert decoder.decode_det_set(frozenset(err.det_list())) == err.obs
+
+
+def test_batch_decoding_matches_det_set_decoding():
+    circuit = stim.Circuit.generated(
+        "surface_code:rotated_memory_x",
+        distance=5,
+        rounds=5,
+        after_clifford_depolarization=5e-3,
+    )
+    dem = circuit.detector_error_model()
+    dets, _ = circuit.compile_detector_sampler().sample(2000, bit_packed=True, separate_observables=True)
+    for discard_on_fail in [False, True]:
+        decoder = CompiledNoTouchDecoder(dem, discard_on_fail=discard_on_fail, batch_size=512)
+        result = decoder.decode_shots_bit_packed(bit_packed_detection_event_data=dets)
+        if discard_on_fail:
+            assert 0 < np.count_nonzero(result[:, 1]) < len(dets) // 2
+        else:
+            assert not np.any(result[:, 1])
+        for k in range(len(dets)):
+            expected = decoder.decode_det_set(frozenset(np.flatnonzero(np.unpackbits(dets[k], bitorder='little'))))
+            if expected is None:
+                assert result[k, 1] == 1
+            else:
+                assert (result[k, 0], result[k, 1]) == (expected, 0)
@@ -3,29 +3,50 @@ import time
 import numpy as np
 import sinter
 
+from ._staged_detector_sampler import StagedDetectorSampler
+
 
 class PerfectionistSampler(sinter.Sampler):
-    """Predicts obs aren't flipped. Discards shots with any detection events."""
+    """Predicts obs aren't flipped. Discards shots with any detection events.
+
+    When `early_discard` is set, shots stop being simulated as soon as they
+    produce a detection event (see `StagedDetectorSampler`).
+    """
+    def __init__(self, early_discard: bool = False):
+        self.early_discard = early_discard
+
     def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
-        return CompiledPerfectionistSampler(task)
+        return CompiledPerfectionistSampler(task, early_discard=self.early_discard)
 
 
 class CompiledPerfectionistSampler(sinter.CompiledSampler):
-    def __init__(self, task: sinter.Task):
+    def __init__(self, task: sinter.Task, early_discard: bool = False):
         self.stim_sampler = task.circuit.compile_detector_sampler()
+        self.staged_sampler: StagedDetectorSampler | None = None
+        if early_discard:
+            self.staged_sampler = StagedDetectorSampler(
+                task.circuit,
+                postselected_detectors=frozenset(range(task.circuit.num_detectors)),
+            )
 
     def sample(self, max_shots: int) -> sinter.AnonTaskStats:
         t0 = time.monotonic()
-        dets, obs = self.stim_sampler.sample(
-            shots=max_shots,
-            bit_packed=True,
-            separate_observables=True,
-        )
-        num_shots = dets.shape[0]
-        discards = np.any(dets, axis=1)
-        errors = np.any(obs, axis=1)
-        num_discards = np.count_nonzero(discards)
-        num_errors = np.count_nonzero(errors & ~discards)
+        if self.staged_sampler is not None:
+            _, obs = self.staged_sampler.sample(max_shots)
+            num_shots = max_shots
+            num_discards = max_shots - obs.shape[0]
+            num_errors = np.count_nonzero(np.any(obs, axis=1))
+        else:
+            dets, obs = self.stim_sampler.sample(
+                shots=max_shots,
+                bit_packed=True,
+                separate_observables=True,
+            )
+            num_shots = dets.shape[0]
+            discards = np.any(dets, axis=1)
+            errors = np.any(obs, axis=1)
+            num_discards = np.count_nonzero(discards)
+            num_errors = np.count_nonzero(errors & ~discards)
         t1 = time.monotonic()
 
         return sinter.AnonTaskStats(
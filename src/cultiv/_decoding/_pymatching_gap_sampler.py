@@ -1,4 +1,3 @@
-import collections
 import math
 import time
 
@@ -9,6 +8,8 @@ import stim
 
 from latte.dem_util import dem_with_compressed_detectors, \
     dem_with_replaced_targets
+from ._gap_counts import gap_custom_counts
+from ._syndrome_cache import SyndromeCache
 
 
 class PymatchingGapSampler(sinter.Sampler):
@@ -87,6 +88,10 @@ class CompiledPymatchingGapSampler(sinter.CompiledSampler):
         edge_w = edge['weight']
         edge_p = edge['error_probability']
         self.decibels_per_w = -math.log10(edge_p / (1 - edge_p)) * 10 / edge_w
+        self.syndrome_cache = SyndromeCache(
+            decode_batch=self._decode_batch,
+            num_det_bytes=-(-aligned_circuit.num_detectors // 8),
+        )
 
     def sample(self, max_shots: int) -> sinter.AnonTaskStats:
         t0 = time.monotonic()
@@ -100,15 +105,32 @@ class CompiledPymatchingGapSampler(sinter.CompiledSampler):
         num_discards = np.count_nonzero(discard_mask)
         dets = dets[~discard_mask]
         actual_obs = actual_obs[~discard_mask]
-        num_kept_shots = dets.shape[0]
 
+        predictions, gaps = self.syndrome_cache.decode(dets)
+        errors = predictions != actual_obs[:, 0]
+        num_errors = np.count_nonzero(errors)
+
+        # Classify all shots by their error + gap.
+        custom_counts = gap_custom_counts(gaps=gaps, errors=errors)
+        t1 = time.monotonic()
+
+        return sinter.AnonTaskStats(
+            shots=num_shots,
+            errors=num_errors,
+            discards=num_discards,
+            seconds=t1 - t0,
+            custom_counts=custom_counts,
+        )
+
+    def _decode_batch(self, dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        num_shots = dets.shape[0]
         predictions: np.ndarray | None = None
         if self.compiled_decoder is not None:
             predictions = self.compiled_decoder.decode_shots_bit_packed(
                 bit_packed_detection_event_data=dets
             )[:, 0]
 
-        weights = np.zeros(shape=(num_kept_shots, 1 << self.num_obs), dtype=np.float64)
+        weights = np.zeros(shape=(num_shots, 1 << self.num_obs), dtype=np.float64)
         for mask in range(1 << self.num_obs):
             dets[:, self.controlled_det_byte] = mask
             weight = _decode_weight_with_pymatching_with_better_error_message(
@@ -117,32 +139,12 @@ class CompiledPymatchingGapSampler(sinter.CompiledSampler):
                 self.d2c,
             )
             weights[:, mask] = weight
-
         if self.compiled_decoder is None:
             predictions = np.array(np.argmin(weights, axis=1), dtype=np.uint8)
         assert predictions is not None
-        errors = predictions != actual_obs[:, 0]
         sorted_weights = np.sort(weights, axis=1)
-        gaps = (sorted_weights[:, 1] - sorted_weights[:, 0])
-        num_errors = np.count_nonzero(errors)
-
-        # Classify all shots by their error + gap.
-        custom_counts = collections.Counter()
-        gaps_db = np.round(gaps * self.decibels_per_w).astype(dtype=np.int64)
-        for k in range(num_kept_shots):
-            g = gaps_db[k]
-            e = 'CE'[errors[k]]
-            key = f'{e}{g}'
-            custom_counts[key] += 1
-        t1 = time.monotonic()
-
-        return sinter.AnonTaskStats(
-            shots=num_shots,
-            errors=num_errors,
-            discards=num_discards,
-            seconds=t1 - t0,
-            custom_counts=custom_counts,
-        )
+        gaps = (sorted_weights[:, 1] - sorted_weights[:, 0]) * self.decibels_per_w
+        return predictions, gaps
 
 
 def _decode_weight_with_pymatching_with_better_error_message(
@@ -0,0 +1,87 @@
+import numpy as np
+import sinter
+import stim
+
+import cultiv
+import gen
+from ._desaturation_sampler import DesaturationSampler
+from ._perfectionist_sampler import PerfectionistSampler
+from ._staged_detector_sampler import StagedDetectorSampler
+
+
+def test_staged_sampler_cross_stage_detectors():
+    circuit = stim.Circuit("""
+        R 0 1 2
+        X_ERROR(0.25) 0 2
+        CX 0 1
+        M 1
+        DETECTOR(0, 0, 0, 0, -9) rec[-1]
+        TICK
+        R 1
+        CX 0 1
+        X_ERROR(0.25) 2
+        CX 2 1
+        M 1
+        DETECTOR(1, 0, 0) rec[-1] rec[-2]
+        M 2
+        DETECTOR(2, 0, 0) rec[-1]
+        OBSERVABLE_INCLUDE(0) rec[-1] rec[-3]
+    """)
+    sampler = StagedDetectorSampler(circuit, postselected_detectors={0}, batch_size=256)
+    assert len(sampler.stages) == 2
+    assert sampler.stages[1].live_qubits == [0, 2]
+
+    dets, obs = sampler.sample(10_000)
+    assert dets.shape[1] == 1
+    assert obs.shape[1] == 1
+    assert 7000 < dets.shape[0] < 8000
+    dets = np.unpackbits(dets, axis=1, bitorder='little', count=3)
+    assert not np.any(dets[:, 0])
+    # Qubit 0 was never flipped on kept shots, and qubit 2 flips both later detectors.
+    assert np.array_equal(dets[:, 1], dets[:, 2])
+    assert np.array_equal(dets[:, 2], np.unpackbits(obs, axis=1, bitorder='little', count=1)[:, 0])
+    assert 0.3 < np.mean(dets[:, 2]) < 0.45
+
+
+def test_staged_sampler_matches_full_sampling():
+    circuit = cultiv.make_inject_and_cultivate_circuit(dcolor=3, inject_style='unitary', basis='Y')
+    circuit = gen.NoiseModel.uniform_depolarizing(2e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
+    postselected = frozenset(range(0, circuit.num_detectors, 3))
+    sampler = StagedDetectorSampler(circuit, postselected_detectors=postselected)
+    assert len(sampler.stages) == 2
+
+    shots = 50_000
+    staged_dets, _ = sampler.sample(shots)
+    full_dets, _ = circuit.compile_detector_sampler().sample(shots, bit_packed=True, separate_observables=True)
+    full_dets = np.unpackbits(full_dets, axis=1, bitorder='little', count=circuit.num_detectors)
+    full_dets = full_dets[~np.any(full_dets[:, sorted(postselected)], axis=1)]
+    staged_dets = np.unpackbits(staged_dets, axis=1, bitorder='little', count=circuit.num_detectors)
+    assert abs(len(staged_dets) - len(full_dets)) < shots * 0.02
+    np.testing.assert_allclose(np.mean(staged_dets, axis=0), np.mean(full_dets, axis=0), atol=0.02)
+
+
+def test_early_discard_samplers():
+    circuit = cultiv.make_end2end_cultivation_circuit(dcolor=3, dsurface=7, basis='Y', r_growing=2, r_end=1, inject_style='unitary')
+    circuit = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
+    task = sinter.Task(circuit=circuit, detector_error_model=circuit.detector_error_model())
+
+    stats = DesaturationSampler(early_discard=True).compiled_sampler_for_task(task).sample(4096)
+    assert stats.shots == 4096
+    assert 0 < stats.discards < 4096
+    assert sum(stats.custom_counts.values()) == stats.shots - stats.discards
+    assert stats.errors / (stats.shots - stats.discards) < 0.1
+
+    stats = PerfectionistSampler(early_discard=True).compiled_sampler_for_task(task).sample(4096)
+    assert stats.shots == 4096
+    assert 0 < stats.discards < 4096
+    assert stats.errors < 0.1 * (stats.shots - stats.discards)
+
+
+def test_early_discard_noiseless():
+    circuit = cultiv.make_inject_and_cultivate_circuit(dcolor=3, inject_style='unitary', basis='Y')
+    stats = PerfectionistSampler(early_discard=True).compiled_sampler_for_task(sinter.Task(
+        circuit=circuit,
+    )).sample(1000)
+    assert stats.shots == 1000
+    assert stats.discards == 0
+    assert stats.errors == 0
@@ -0,0 +1,352 @@
+import collections
+import dataclasses
+import statistics
+import time
+
+import numpy as np
+import sinter
+import stim
+
+from cultiv._error_set import DemErrorSet
+
+
+class StratifiedPerfectionistSampler(sinter.Sampler):
+    """Estimates perfectionist error and discard rates by stratifying shots by fault count.
+
+    At low noise almost every shot is fault free, so plain sampling spends nearly all of
+    its time confirming that nothing happened. This sampler instead splits its shots
+    between the strata "exactly k of the DEM's error mechanisms fired", for
+    k = 1..max_faults, and samples each stratum exactly. Weighting each stratum's rates
+    by the probability of k faults gives unbiased estimates of the full rates, except for
+    the (bounded) contribution of shots with more than max_faults faults. By default
+    max_faults is picked so that contribution is below 1e-12.
+
+    The returned stats' `errors` and `discards` fields are unbiased estimates of how many
+    of the `shots` shots would have been errors and discards: each stratum's sampled
+    counts are reweighted by the stratum's probability, the enumerated strata contribute
+    their exact rates, and the expected counts are randomly rounded to integers. So
+    sinter's rates and stopping conditions work as usual, though sinter's binomial
+    confidence intervals are only an approximation of the estimate's uncertainty. The
+    raw counts of each stratum are kept in the custom counts (`k{k}_shots`,
+    `k{k}_errors`, `k{k}_discards`), which `FaultCountStrata.estimate` turns into rates
+    with proper confidence intervals.
+    """
+    def __init__(self, max_faults: int | None = None):
+        self.max_faults = max_faults
+
+    def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
+        dem = task.detector_error_model
+        if dem is None:
+            dem = task.circuit.detector_error_model()
+        strata = FaultCountStrata.from_dem(dem, max_faults=self.max_faults)
+        return CompiledStratifiedPerfectionistSampler(strata)
+
+
+@dataclasses.dataclass(frozen=True)
+class StratifiedRates:
+    """Rate estimates, with confidence intervals, made from fault count strata."""
+    error_rate: float
+    error_rate_low: float
+    error_rate_high: float
+    discard_rate: float
+    discard_rate_low: float
+    discard_rate_high: float
+
+    @property
+    def kept_error_rate(self) -> float:
+        """The chance that a kept shot has a logical error."""
+        return self.error_rate / (1 - self.discard_rate)
+
+    @property
+    def kept_error_rate_low(self) -> float:
+        return self.error_rate_low / (1 - self.discard_rate_low)
+
+    @property
+    def kept_error_rate_high(self) -> float:
+        return min(1.0, self.error_rate_high / max(1e-300, 1 - self.discard_rate_high))
+
+
+def perfectionist_outcomes(masks: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Returns which shots are errors and which are discards, given their symptom masks.
+
+    Args:
+        masks: Combined symptom masks in `DemErrorSet.masks` layout, with shape
+            (num_shots, num_words). Bit 0 is the observable and the other bits are
+            detectors. Modified in place.
+    """
+    flips_obs = (masks[:, 0] & 1).astype(np.bool_)
+    masks[:, 0] &= ~masks.dtype.type(1)
+    discards = np.any(masks, axis=1)
+    return flips_obs & ~discards, discards
+
+
+@dataclasses.dataclass(frozen=True)
+class FaultCountStrata:
+    """Samples the symptoms of exactly k faults, drawn from a DEM's error mechanisms.
+
+    Conditioned on exactly k of the independent mechanisms firing, a set S of mechanisms
+    fires with probability proportional to the product of the odds p/(1-p) of its members.
+    `tails[j, i]` is the sum of those products over all j-subsets of the mechanisms from
+    index i onward (the elementary symmetric polynomial), which both gives the
+    probability of each stratum and lets the members of S be drawn one at a time, in
+    increasing index order, by inverting a cumulative distribution.
+
+    `tail_probability` is the probability of more than `max_faults` faults.
+
+    Strata with few enough fault combinations are enumerated instead of sampled; their
+    exact (error rate, discard rate) pairs are in `exact_rates`.
+    """
+    masks: np.ndarray
+    odds: np.ndarray
+    tails: np.ndarray
+    fault_free_probability: float
+    tail_probability: float
+    exact_rates: dict[int, tuple[float, float]]
+
+    @staticmethod
+    def from_dem(
+        dem: stim.DetectorErrorModel,
+        *,
+        max_faults: int | None = None,
+        tail_tolerance: float = 1e-12,
+        max_exact_combinations: int = 1_000_000,
+    ) -> 'FaultCountStrata':
+        """
+        Args:
+            dem: The error model to sample faults from.
+            max_faults: The largest number of faults to stratify. Defaults to the smallest
+                number such that the probability of more faults is below tail_tolerance.
+            tail_tolerance: Used to pick max_faults when it isn't given.
+            max_exact_combinations: The one and two fault strata are enumerated exactly
+                when they have at most this many fault combinations.
+        """
+        error_set = DemErrorSet.from_dem(dem)
+        probs = error_set.probs
+        odds = probs / (1 - probs)
+        n = len(probs)
+        fault_free_probability = float(np.exp(np.sum(np.log1p(-probs))))
+        expected_faults = float(np.sum(probs))
+
+        # Extend the table until the remaining strata are negligible. Past the mean, the
+        # stratum probabilities shrink at least geometrically, so the last row bounds the
+        # rest.
+        rows = [np.ones(shape=n + 1, dtype=np.float64)]
+        while len(rows) <= n:
+            row = np.zeros(shape=n + 1, dtype=np.float64)
+            row[:n] = np.cumsum((odds * rows[-1][1:])[::-1])[::-1]
+            rows.append(row)
+            j = len(rows) - 1
+            if max_faults is not None and j >= max_faults + 16:
+                break
+            if max_faults is None and j > 2 * expected_faults + 2 and row[0] * fault_free_probability < tail_tolerance * 1e-6:
+                break
+        probabilities = np.array([row[0] for row in rows]) * fault_free_probability
+        tails_after = np.cumsum(probabilities[::-1])[::-1][1:]
+        if max_faults is None:
+            negligible = np.flatnonzero(tails_after < tail_tolerance)
+            max_faults = max(1, int(negligible[0])) if len(negligible) else len(rows) - 1
+        max_faults = min(max_faults, n)
+
+        masks = error_set.masks[:, None] if error_set.masks.ndim == 1 else error_set.masks
+        exact_rates = {}
+        if 1 <= max_faults and n <= max_exact_combinations:
+            errors, discards = perfectionist_outcomes(masks.copy())
+            exact_rates[1] = (float(np.sum(odds[errors]) / rows[1][0]), float(np.sum(odds[discards]) / rows[1][0]))
+        if 2 <= max_faults and n * (n - 1) // 2 <= max_exact_combinations:
+            error_weight = 0.0
+            discard_weight = 0.0
+            for i in range(n - 1):
+                errors, discards = perfectionist_outcomes(masks[i + 1:] ^ masks[i])
+                error_weight += odds[i] * np.sum(odds[i + 1:][errors])
+                discard_weight += odds[i] * np.sum(odds[i + 1:][discards])
+            exact_rates[2] = (float(error_weight / rows[2][0]), float(discard_weight / rows[2][0]))
+
+        return FaultCountStrata(
+            masks=masks,
+            odds=odds,
+            tails=np.array(rows[:max_faults + 1]),
+            fault_free_probability=fault_free_probability,
+            tail_probability=float(tails_after[max_faults]) if max_faults < len(tails_after) else 0.0,
+            exact_rates=exact_rates,
+        )
+
+    @property
+    def max_faults(self) -> int:
+        return self.tails.shape[0] - 1
+
+    @property
+    def probabilities(self) -> np.ndarray:
+        """The probability of exactly k faults, for k = 0..max_faults."""
+        return self.tails[:, 0] * self.fault_free_probability
+
+    def sample_error_indices(self, k: int, shots: int, rng: np.random.Generator) -> np.ndarray:
+        """Returns a (shots, k) array of the indices of the mechanisms that fired in each shot."""
+        assert 0 < k <= self.max_faults
+        if self.tails[k, 0] == 0:
+            raise ValueError(f'There are fewer than {k=} error mechanisms.')
+        result = np.zeros(shape=(shots, k), dtype=np.int64)
+        start = np.zeros(shape=shots, dtype=np.int64)
+        for j in range(k):
+            remaining = k - j
+            v = (1 - rng.random(shots)) * self.tails[remaining, start]
+            chosen = np.searchsorted(-self.tails[remaining], -v, side='right') - 1
+            result[:, j] = chosen
+            start = chosen + 1
+        return result
+
+    def sample_masks(self, k: int, shots: int, rng: np.random.Generator) -> np.ndarray:
+        """Returns the combined symptom mask of each shot, in `DemErrorSet.masks` layout."""
+        indices = self.sample_error_indices(k, shots, rng)
+        result = self.masks[indices[:, 0]]
+        for j in range(1, k):
+            result ^= self.masks[indices[:, j]]
+        return result
+
+    def estimate(
+        self,
+        custom_counts: dict[str, int],
+        *,
+        confidence: float = 0.95,
+        exact_error_rates: dict[int, float] | None = None,
+    ) -> StratifiedRates:
+        """Combines per-stratum counts into rate estimates with confidence intervals.
+
+        Each stratum's rate is given a normal approximation interval, using add-half
+        smoothed counts for the variance so strata with no hits still contribute
+        uncertainty. The intervals are combined in quadrature with the stratum
+        probabilities as weights. Strata in `exact_rates` contribute no uncertainty. The
+        upper bounds also include the whole probability of the shots that were never
+        sampled: those with more than max_faults faults, and those in strata without any
+        shots.
+
+        Args:
+            custom_counts: The per-stratum counts made by the sampler.
+            confidence: The probability mass of the confidence intervals.
+            exact_error_rates: Exactly known error rates (conditioned on the number of
+                faults) for some strata, e.g. from enumerating all low weight logical
+                errors. They are used instead of those strata's sampled error counts.
+        """
+        z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+        probabilities = self.probabilities
+        rates = {}
+        for kind in ['errors', 'discards']:
+            total = 0.0
+            variance = 0.0
+            unsampled = self.tail_probability
+            for k in range(1, self.max_faults + 1):
+                if k in self.exact_rates:
+                    total += probabilities[k] * self.exact_rates[k][kind == 'discards']
+                    continue
+                if kind == 'errors' and exact_error_rates is not None and k in exact_error_rates:
+                    total += probabilities[k] * exact_error_rates[k]
+                    continue
+                n = custom_counts.get(f'k{k}_shots', 0)
+                hits = custom_counts.get(f'k{k}_{kind}', 0)
+                if n == 0:
+                    unsampled += probabilities[k]
+                    continue
+                smoothed = (hits + 0.5) / (n + 1)
+                total += probabilities[k] * hits / n
+                variance += probabilities[k]**2 * smoothed * (1 - smoothed) / n
+            spread = z * variance**0.5
+            rates[kind] = (total, max(0.0, total - spread), min(1.0, total + spread + unsampled))
+        return StratifiedRates(
+            error_rate=rates['errors'][0],
+            error_rate_low=rates['errors'][1],
+            error_rate_high=rates['errors'][2],
+            discard_rate=rates['discards'][0],
+            discard_rate_low=rates['discards'][1],
+            discard_rate_high=rates['discards'][2],
+        )
+
+
+class CompiledStratifiedPerfectionistSampler(sinter.CompiledSampler):
+    def __init__(self, strata: FaultCountStrata, *, exact_error_rates: dict[int, float] | None = None):
+        self.strata = strata
+        self.exact_error_rates = {} if exact_error_rates is None else exact_error_rates
+        self.ks = [
+            k
+            for k in range(1, self.strata.max_faults + 1)
+            if self.strata.tails[k, 0] > 0 and k not in self.strata.exact_rates
+        ]
+        self.rng = np.random.default_rng()
+        # Running totals, used to steer shots towards the strata that matter most.
+        self.stratum_shots = np.zeros(shape=len(self.ks), dtype=np.int64)
+        self.stratum_errors = np.zeros(shape=len(self.ks), dtype=np.int64)
+
+    def allocate(self, shots: int) -> tuple[np.ndarray, np.ndarray]:
+        """Splits shots between the strata, roughly minimizing the error rate's variance.
+
+        Uses Neyman allocation (shots proportional to stratum probability times the
+        standard deviation of its error indicator) with add-half smoothed error rates, so
+        the strata start out evenly covered and shift as errors are seen. Strata with
+        exactly known error rates are only sampled for their discard rates, so they only
+        get the minimum share. Every stratum keeps at least a small share, so none is
+        starved.
+
+        Returns:
+            A (shares, allocation) tuple. The shots are split randomly, so that stratum i
+            gets `shares[i] * shots` shots on average and `allocation[i]` shots this time.
+        """
+        smoothed = (self.stratum_errors + 0.5) / (self.stratum_shots + 1)
+        weights = self.strata.probabilities[self.ks] * np.sqrt(smoothed * (1 - smoothed))
+        weights[[k in self.exact_error_rates for k in self.ks]] = 0
+        if np.sum(weights) > 0:
+            weights /= np.sum(weights)
+        weights = np.maximum(weights, 0.1 / len(self.ks))
+        weights /= np.sum(weights)
+        return weights, self.rng.multinomial(shots, weights)
+
+    def _random_round(self, value: float) -> int:
+        """Rounds to a neighboring integer, with the chances picked so the mean is `value`."""
+        whole = np.floor(value)
+        return int(whole) + int(self.rng.random() < value - whole)
+
+    def sample(self, shots: int) -> sinter.AnonTaskStats:
+        t0 = time.monotonic()
+        probabilities = self.strata.probabilities
+
+        # Expected counts from the strata that don't need sampling.
+        expected_errors = 0.0
+        expected_discards = 0.0
+        for k, (error_rate, discard_rate) in self.strata.exact_rates.items():
+            expected_errors += shots * probabilities[k] * error_rate
+            expected_discards += shots * probabilities[k] * discard_rate
+        for k, error_rate in self.exact_error_rates.items():
+            if k not in self.strata.exact_rates:
+                expected_errors += shots * probabilities[k] * error_rate
+
+        custom_counts = {}
+        if self.ks:
+            shares, allocation = self.allocate(shots)
+            for i, n in enumerate(allocation):
+                k = self.ks[i]
+                if n == 0:
+                    continue
+                errors, discards = perfectionist_outcomes(self.strata.sample_masks(k, n, self.rng))
+                errors = np.count_nonzero(errors)
+                discards = np.count_nonzero(discards)
+                custom_counts[f'k{k}_shots'] = int(n)
+                custom_counts[f'k{k}_errors'] = errors
+                custom_counts[f'k{k}_discards'] = discards
+                self.stratum_shots[i] += n
+                self.stratum_errors[i] += errors
+
+                # Each shot of the stratum stands for probabilities[k] / shares[i] shots.
+                # Dividing by the expected allocation, instead of the actual one, keeps
+                # this unbiased even when a stratum gets no shots.
+                weight = probabilities[k] / shares[i]
+                if k not in self.exact_error_rates:
+                    expected_errors += weight * errors
+                expected_discards += weight * discards
+
+        num_errors = min(shots, self._random_round(expected_errors))
+        num_discards = min(shots - num_errors, self._random_round(expected_discards))
+        t1 = time.monotonic()
+        return sinter.AnonTaskStats(
+            shots=shots,
+            errors=num_errors,
+            discards=num_discards,
+            seconds=t1 - t0,
+            custom_counts=collections.Counter(custom_counts),
+        )
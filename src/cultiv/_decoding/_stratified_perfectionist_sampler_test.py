@@ -0,0 +1,117 @@
+import itertools
+
+import numpy as np
+import sinter
+import stim
+
+from cultiv._error_set import DemErrorSet
+from ._stratified_perfectionist_sampler import (
+    CompiledStratifiedPerfectionistSampler,
+    FaultCountStrata,
+    StratifiedPerfectionistSampler,
+)
+
+
+def test_fault_count_strata_exact_distribution():
+    dem = stim.DetectorErrorModel("""
+        error(0.1) D0
+        error(0.2) D1
+        error(0.05) D2 L0
+        error(0.3) D0 D1
+    """)
+    strata = FaultCountStrata.from_dem(dem, max_faults=2)
+    probs = [0.1, 0.2, 0.05, 0.3]
+    expected = np.zeros(5)
+    for fired in itertools.product([0, 1], repeat=4):
+        expected[sum(fired)] += np.prod([p if f else 1 - p for p, f in zip(probs, fired)])
+    np.testing.assert_allclose(strata.probabilities, expected[:3])
+    assert abs(strata.tail_probability - expected[3:].sum()) < 1e-12
+
+    indices = strata.sample_error_indices(2, 200_000, np.random.default_rng(5))
+    assert np.all(indices[:, 0] < indices[:, 1])
+    odds = strata.odds
+    pairs = list(itertools.combinations(range(4), 2))
+    weights = np.array([odds[a] * odds[b] for a, b in pairs])
+    counts = np.array([np.count_nonzero((indices[:, 0] == a) & (indices[:, 1] == b)) for a, b in pairs])
+    np.testing.assert_allclose(counts / len(indices), weights / weights.sum(), atol=0.005)
+
+
+def test_stratified_estimate_matches_direct_sampling():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=3,
+        after_clifford_depolarization=0.02,
+        before_measure_flip_probability=0.02,
+    )
+    task = sinter.Task(circuit=circuit, detector_error_model=circuit.detector_error_model())
+    compiled = StratifiedPerfectionistSampler().compiled_sampler_for_task(task)
+    stats = compiled.sample(300_000)
+    assert stats.shots == 300_000
+    rates = compiled.strata.estimate(stats.custom_counts)
+
+    shots = 1_000_000
+    dets, obs = circuit.compile_detector_sampler().sample(shots, separate_observables=True)
+    kept = ~np.any(dets, axis=1)
+    direct_discard_rate = 1 - np.mean(kept)
+    direct_error_rate = np.count_nonzero(obs[kept, 0]) / shots
+
+    assert rates.discard_rate_low < rates.discard_rate < rates.discard_rate_high
+    assert abs(rates.discard_rate - direct_discard_rate) < 0.003
+    assert rates.error_rate_low < rates.error_rate < rates.error_rate_high
+    assert abs(rates.error_rate - direct_error_rate) < 4e-5 + 0.1 * direct_error_rate
+    assert rates.kept_error_rate_low < rates.kept_error_rate < rates.kept_error_rate_high
+
+    # The sinter facing counts are also estimates of the full rates.
+    assert abs(stats.discards / stats.shots - direct_discard_rate) < 0.003
+    expected_errors = stats.shots * rates.error_rate
+    assert abs(stats.errors - expected_errors) < 5 * expected_errors**0.5 + 2
+
+
+def test_noiseless():
+    circuit = stim.Circuit.generated('repetition_code:memory', distance=3, rounds=3)
+    stats = StratifiedPerfectionistSampler().compiled_sampler_for_task(sinter.Task(circuit=circuit)).sample(100)
+    assert stats.shots == 100
+    assert stats.errors == stats.discards == 0
+
+
+def test_exact_strata():
+    dem = stim.DetectorErrorModel("""
+        error(0.1) D0
+        error(0.2) D1
+        error(0.05) D1 L0
+        error(0.01) L0
+    """)
+    strata = FaultCountStrata.from_dem(dem, max_faults=3)
+    assert set(strata.exact_rates) == {1, 2}
+    odds = strata.odds
+    errors = DemErrorSet.from_dem(dem).errors
+    bare_l0 = next(k for k, e in enumerate(errors) if e.det == 0)
+    d1 = next(k for k, e in enumerate(errors) if e.det == 2 and e.obs == 0)
+    d1_l0 = next(k for k, e in enumerate(errors) if e.det == 2 and e.obs == 1)
+    # Single faults: only the bare L0 error is undetected.
+    single = odds[bare_l0] / odds.sum()
+    np.testing.assert_allclose(strata.exact_rates[1], (single, 1 - single))
+    # Pairs: only D1 together with D1 L0 is an undetected logical error.
+    total = sum(odds[a] * odds[b] for a, b in itertools.combinations(range(4), 2))
+    pair = odds[d1] * odds[d1_l0] / total
+    np.testing.assert_allclose(strata.exact_rates[2], (pair, 1 - pair))
+
+
+def test_enumerated_strata_are_counted():
+    dem = stim.DetectorErrorModel("""
+        error(0.1) D0
+        error(0.2) D1
+        error(0.05) D1 L0
+        error(0.01) L0
+    """)
+    strata = FaultCountStrata.from_dem(dem, max_faults=2)
+    compiled = CompiledStratifiedPerfectionistSampler(strata)
+    assert compiled.ks == []
+    stats = compiled.sample(1_000_000)
+    probabilities = strata.probabilities
+    expected_errors = sum(probabilities[k] * rates[0] for k, rates in strata.exact_rates.items())
+    expected_discards = sum(probabilities[k] * rates[1] for k, rates in strata.exact_rates.items())
+    assert abs(stats.errors - expected_errors * stats.shots) <= 1
+    assert abs(stats.discards - expected_discards * stats.shots) <= 1
+    assert stats.custom_counts == {}
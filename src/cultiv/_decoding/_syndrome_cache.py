@@ -0,0 +1,94 @@
+import collections
+from typing import Callable
+
+import numpy as np
+
+
+class SyndromeCache:
+    """An LRU cache of per-shot decoding results, keyed by the shot's detection events.
+
+    At low noise almost every kept shot has no detection events or one of a handful of
+    small syndromes, so decoding each of them again is wasted work. The cache sits in
+    front of a batch decoder: repeated syndromes (within a batch or across batches) are
+    looked up, and only unseen syndromes are passed to the decoder.
+
+    The empty syndrome is decoded when the cache is created, so it is always warm.
+    """
+
+    def __init__(
+        self,
+        *,
+        decode_batch: Callable[[np.ndarray], tuple[np.ndarray, ...]],
+        num_det_bytes: int,
+        max_size: int = 1 << 14,
+    ):
+        """
+        Args:
+            decode_batch: Takes a uint8 array of bit packed detection events with shape
+                (num_shots, num_det_bytes). Returns a tuple of per-shot result arrays, each
+                with shape (num_shots,). May modify its argument.
+            num_det_bytes: The number of bytes in each bit packed shot.
+            max_size: The maximum number of syndromes to remember.
+        """
+        assert max_size >= 1
+        self._decode_batch = decode_batch
+        self.num_det_bytes = num_det_bytes
+        self.max_size = max_size
+        self._entries: collections.OrderedDict[bytes, tuple] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        empty_results = self._decode_batch(np.zeros(shape=(1, num_det_bytes), dtype=np.uint8))
+        self._dtypes = [np.asarray(column).dtype for column in empty_results]
+        self._entries[bytes(num_det_bytes)] = tuple(column[0] for column in empty_results)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def decode(self, bit_packed_dets: np.ndarray) -> tuple[np.ndarray, ...]:
+        """Returns the decoder's results for each shot, decoding only unseen syndromes.
+
+        Args:
+            bit_packed_dets: A uint8 array with shape (num_shots, num_det_bytes). Not
+                modified.
+
+        Returns:
+            The same tuple of per-shot arrays that `decode_batch` would have returned.
+        """
+        num_shots, num_bytes = bit_packed_dets.shape
+        assert num_bytes == self.num_det_bytes
+        keys = np.ascontiguousarray(bit_packed_dets).view(np.dtype((np.void, num_bytes)))[:, 0]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        unique_rows = unique_keys.view(np.uint8).reshape(len(unique_keys), num_bytes)
+
+        unique_results: list[tuple | None] = []
+        miss_indices = []
+        for k in range(len(unique_keys)):
+            key = unique_keys[k].tobytes()
+            result = self._entries.get(key)
+            if result is None:
+                miss_indices.append(k)
+            else:
+                self._entries.move_to_end(key)
+            unique_results.append(result)
+
+        if miss_indices:
+            decoded = self._decode_batch(unique_rows[miss_indices].copy())
+            for j, k in enumerate(miss_indices):
+                result = tuple(column[j] for column in decoded)
+                unique_results[k] = result
+                self._entries[unique_keys[k].tobytes()] = result
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        self.misses += len(miss_indices)
+        self.hits += num_shots - len(miss_indices)
+
+        if not unique_results:
+            return tuple(np.zeros(shape=0, dtype=dtype) for dtype in self._dtypes)
+        columns = zip(*unique_results)
+        return tuple(np.array(column, dtype=dtype)[inverse] for column, dtype in zip(columns, self._dtypes))
@@ -0,0 +1,41 @@
+import numpy as np
+
+from ._syndrome_cache import SyndromeCache
+
+
+def test_syndrome_cache():
+    decoded = []
+
+    def decode_batch(dets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        decoded.append(dets.copy())
+        weights = np.count_nonzero(np.unpackbits(dets, axis=1), axis=1)
+        dets[:] = 255  # Allowed to clobber its input.
+        return weights & 1 == 1, weights * 0.5
+
+    cache = SyndromeCache(decode_batch=decode_batch, num_det_bytes=2, max_size=3)
+    assert len(decoded) == 1 and not np.any(decoded[0])
+    assert len(cache) == 1
+
+    dets = np.array([[0, 0], [1, 0], [0, 0], [1, 0], [3, 1]], dtype=np.uint8)
+    original = dets.copy()
+    parity, halves = cache.decode(dets)
+    np.testing.assert_array_equal(dets, original)
+    np.testing.assert_array_equal(parity, [False, True, False, True, True])
+    np.testing.assert_array_equal(halves, [0, 0.5, 0, 0.5, 1.5])
+    assert parity.dtype == np.bool_
+    assert len(decoded) == 2
+    assert sorted(map(bytes, decoded[1])) == [b'\x01\x00', b'\x03\x01']
+    assert (cache.hits, cache.misses) == (3, 2)
+    assert cache.hit_rate == 0.6
+    assert len(cache) == 3
+
+    # Overflowing evicts the least recently used syndrome.
+    cache.decode(np.array([[0, 0], [7, 0]], dtype=np.uint8))
+    assert len(cache) == 3
+    cache.decode(np.array([[1, 0]], dtype=np.uint8))
+    assert bytes(decoded[-1][0]) == b'\x01\x00'
+    assert (cache.hits, cache.misses) == (4, 4)
+
+    parity, halves = cache.decode(np.zeros(shape=(0, 2), dtype=np.uint8))
+    assert parity.shape == halves.shape == (0,)
+    assert halves.dtype == np.float64
@@ -15,68 +15,79 @@ class TwirlInterceptSampler(sinter.Sampler):
     errors, as suggested in https://arxiv.org/abs/2003.03049 . THIS
     SEEMS TO WORK VERY POORLY BE VERY CAREFUL USING THIS SAMPLER.
     """
-    def __init__(self, turns: float):
+    def __init__(self, turns: float, batch_size: int = 4096):
         self.turns = turns
+        self.batch_size = batch_size
 
     def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
-        return CompiledTwirlInterceptSampler(task, self.turns)
+        return CompiledTwirlInterceptSampler(task, self.turns, self.batch_size)
 
 
 class CompiledTwirlInterceptSampler(sinter.CompiledSampler):
-    def __init__(self, task: sinter.Task, turns: float):
+    def __init__(self, task: sinter.Task, turns: float, batch_size: int = 4096):
         assert turns % 0.25 == 0 and 0 <= turns < 2
         self.task = task
         self.turns = turns
+        self.batch_size = batch_size
         self.num_qubits = task.circuit.num_qubits
-        self.instructions = self.task.circuit.flattened()
         self.is_t_like = self.turns % 0.5 == 0.25
         self.is_s_like = self.turns % 1 == 0.5
         self.is_z_like = self.turns % 1 == 0
+        self.steps = self._compile_steps(self.task.circuit.flattened())
         self.simulator: stim.FlipSimulator | None = None
+        self.rng = np.random.default_rng()
+
+    def _compile_steps(self, circuit: stim.Circuit) -> list[stim.CircuitInstruction | tuple[int, ...]]:
+        """Converts the circuit into simulator instructions and T twirls.
+
+        A T twirl is represented by the tuple of qubits to twirl. The simulator has no
+        method for reading the X flips of many instances at once, so each twirl is preceded
+        by a Z basis measurement of its qubits. Stabilizer randomization is disabled when
+        twirling, so these probe measurements only record the X flips and don't change the
+        Pauli frame. Measurement record targets of later instructions are shifted to skip
+        over the probes.
+        """
+        steps: list[stim.CircuitInstruction | tuple[int, ...]] = []
+        # The index of each of the circuit's measurements in the simulator's record.
+        measurement_indices: list[int] = []
+        num_simulated_measurements = 0
+
+        def append_inst(inst: stim.CircuitInstruction):
+            nonlocal num_simulated_measurements
+            targets = inst.targets_copy()
+            if any(t.is_measurement_record_target for t in targets):
+                targets = [
+                    stim.target_rec(measurement_indices[len(measurement_indices) + t.value] - num_simulated_measurements)
+                    if t.is_measurement_record_target else t
+                    for t in targets
+                ]
+                inst = stim.CircuitInstruction(inst.name, targets, inst.gate_args_copy())
+            n = inst.num_measurements
+            measurement_indices.extend(range(num_simulated_measurements, num_simulated_measurements + n))
+            num_simulated_measurements += n
+            steps.append(inst)
+
+        def append_t_or_s_or_z(targets: list[stim.GateTarget]):
+            nonlocal num_simulated_measurements
+            qubits = tuple(t.qubit_value for t in targets)
+            if self.is_t_like:
+                # Twirled T gate randomizes X-vs-Y error distinction.
+                assert len(set(qubits)) == len(qubits)
+                steps.append(stim.CircuitInstruction('M', qubits))
+                num_simulated_measurements += len(qubits)
+                steps.append(qubits)
+            elif self.is_s_like:
+                # S gates do the normal thing.
+                steps.append(stim.CircuitInstruction('S', qubits))
+            elif self.is_z_like:
+                # Errors not changed by a Z gate.
+                pass
+            else:
+                raise NotImplementedError(f'{self.turns=}')
 
-    def _t_twirl(self, qubits: list[int]):
-        assert len(set(qubits)) == len(qubits)
-
-        xy_twirl = np.zeros((self.num_qubits, self.simulator.batch_size), dtype=np.bool_)
-
-        # Only twirl targeted qubits.
-        for q in qubits:
-            xy_twirl[q, :] = np.random.randint(0, 2, self.simulator.batch_size, dtype=np.bool_)
-
-        # Don't twirl unless there is an X error or Y error present.
-        for k, flip in enumerate(self.simulator.peek_pauli_flips()):
-            xs,  _ = flip.to_numpy(bit_packed=False)
-            xy_twirl[:, k] &= xs
-
-        self.simulator.broadcast_pauli_errors(pauli='Z', mask=xy_twirl)
-
-    def _do_t_or_s_or_z(self, targets: list[stim.GateTarget]):
-        if self.is_t_like:
-            # Twirled T gate randomizes X-vs-Y error distinction.
-            self._t_twirl([t.qubit_value for t in targets])
-        elif self.is_s_like:
-            # S gates do the normal thing.
-            self.simulator.do(stim.CircuitInstruction("S", [t.qubit_value for t in targets]))
-        elif self.is_z_like:
-            # Errors not changed by a Z gate.
-            pass
-        else:
-            raise NotImplementedError(f'{self.turns=}')
-
-    def _sample_once(self, shots: int) -> sinter.AnonTaskStats:
-        shots = min(shots, 256)
-        if self.simulator is None or shots != self.simulator.batch_size:
-            self.simulator = stim.FlipSimulator(
-                batch_size=shots,
-                num_qubits=self.num_qubits,
-                disable_stabilizer_randomization=self.is_t_like,
-            )
-        else:
-            self.simulator.reset()
-
-        for inst in self.instructions:
+        for inst in circuit:
             if inst.name == 'S' or inst.name == 'S_DAG':
-                self._do_t_or_s_or_z(inst.targets_copy())
+                append_t_or_s_or_z(inst.targets_copy())
             elif inst.name == 'MPP':
                 args = inst.gate_args_copy()
                 for terms in inst.target_groups():
@@ -92,17 +103,47 @@ class CompiledTwirlInterceptSampler(sinter.CompiledSampler):
                     sub_targets.pop()
 
                     if is_tsz_basis_measurement:
-                        self._do_t_or_s_or_z(terms)
-                    self.simulator.do(stim.CircuitInstruction('MPP', sub_targets, args))
+                        append_t_or_s_or_z(terms)
+                    append_inst(stim.CircuitInstruction('MPP', sub_targets, args))
                     if is_tsz_basis_measurement:
-                        self._do_t_or_s_or_z(terms)
+                        append_t_or_s_or_z(terms)
+            else:
+                append_inst(inst)
+        return steps
+
+    def _t_twirl(self, qubits: tuple[int, ...]):
+        simulator = self.simulator
+        # The X flips of the qubits, as recorded by the probe measurement just before.
+        x_flips = simulator.get_measurement_flips(bit_packed=True)[-len(qubits):]
+
+        # Only twirl targeted qubits, and only where there is an X error or Y error present.
+        twirl = x_flips & self.rng.integers(0, 256, size=x_flips.shape, dtype=np.uint8)
+        xy_twirl = np.zeros((max(qubits) + 1, simulator.batch_size), dtype=np.bool_)
+        xy_twirl[list(qubits)] = np.unpackbits(twirl, axis=1, count=simulator.batch_size, bitorder='little')
+
+        simulator.broadcast_pauli_errors(pauli='Z', mask=xy_twirl)
+
+    def _sample_once(self, shots: int) -> sinter.AnonTaskStats:
+        shots = min(shots, self.batch_size)
+        if self.simulator is None or shots != self.simulator.batch_size:
+            self.simulator = stim.FlipSimulator(
+                batch_size=shots,
+                num_qubits=self.num_qubits,
+                disable_stabilizer_randomization=self.is_t_like,
+            )
+        else:
+            self.simulator.clear()
+
+        for step in self.steps:
+            if isinstance(step, tuple):
+                self._t_twirl(step)
             else:
-                self.simulator.do(inst)
+                self.simulator.do(step)
 
-        discard_mask = np.any(self.simulator.get_detector_flips(bit_packed=False), axis=0)
-        error_mask = np.any(self.simulator.get_observable_flips(bit_packed=False), axis=0)
-        discards = np.count_nonzero(discard_mask)
-        errors = np.count_nonzero(error_mask & ~discard_mask)
+        discard_mask = np.bitwise_or.reduce(self.simulator.get_detector_flips(bit_packed=True), axis=0)
+        error_mask = np.bitwise_or.reduce(self.simulator.get_observable_flips(bit_packed=True), axis=0)
+        discards = np.count_nonzero(np.unpackbits(discard_mask, count=shots, bitorder='little'))
+        errors = np.count_nonzero(np.unpackbits(error_mask & ~discard_mask, count=shots, bitorder='little'))
         return sinter.AnonTaskStats(shots=shots, errors=errors, discards=discards)
 
     def sample(self, shots: int) -> sinter.AnonTaskStats:
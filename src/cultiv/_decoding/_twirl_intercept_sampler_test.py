@@ -71,3 +71,28 @@ def test_twirl_sample_on_simple_circuit(t: float, error_basis: str):
         raise NotImplementedError(f'{t=}')
 
     assert abs(discard_rate - expected_rate) <= 0.01, (discard_rate, expected_rate)
+
+
+def test_twirl_probes_preserve_measurement_lookbacks():
+    circuit = stim.Circuit("""
+        R 0 1
+        X_ERROR(0.25) 1
+        M 1
+        S 0
+        MPP Y0
+        CX rec[-2] 0
+        S 0
+        M 0 1
+        DETECTOR rec[-1] rec[-4]
+        DETECTOR rec[-2] rec[-4]
+        OBSERVABLE_INCLUDE(0) rec[-4]
+    """)
+    compiled = TwirlInterceptSampler(turns=0.25).compiled_sampler_for_task(sinter.Task(circuit=circuit))
+    num_probes = sum(1 for step in compiled.steps if isinstance(step, tuple))
+    assert num_probes == 4
+    sample = compiled.sample(10_000)
+    assert sample.shots == 10_000
+    # The X error on qubit 1 is copied onto qubit 0 by the feedback. The detectors compare
+    # both qubits against the first measurement, so only the observable sees the error.
+    assert sample.discards == 0
+    assert 2000 < sample.errors < 3000
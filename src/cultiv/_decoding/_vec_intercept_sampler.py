@@ -1,11 +1,14 @@
 import random
 import time
+from typing import Literal
 
+import numpy as np
 import sinter
 import stim
 
 import gen
 from latte.vec_sim import VecSim
+from ._vec_intercept_tape import VecInterceptTape
 
 
 class VecInterceptSampler(sinter.Sampler):
@@ -15,30 +18,97 @@ class VecInterceptSampler(sinter.Sampler):
     consistent powers of T all distill correctly.
 
     Uses a vector simulator to make it possible to perform non
-    stabilizer gates.
+    stabilizer gates. The circuit is compiled once into a
+    `VecInterceptTape`, which is replayed on `batch_size` shots at a
+    time by a `BatchVecSim`.
+
+    With `fault_free_shortcut` set, the number of shots with no faults is
+    drawn from a binomial distribution and those shots are all assigned the
+    outcome of one noiseless reference shot. Only the remaining shots are
+    simulated, with their noise conditioned on having at least one fault.
+    This assumes the noiseless circuit's detectors and observables are
+    deterministic, which is the case for the circuits this sampler is for.
     """
 
-    def __init__(self, turns: float, sweep_bit_randomization: bool):
+    def __init__(
+        self,
+        turns: float,
+        sweep_bit_randomization: bool,
+        batch_size: int = 16,
+        time_opcodes: bool = False,
+        fault_free_shortcut: bool = False,
+    ):
         self.turns = turns
         self.sweep_bit_randomization = sweep_bit_randomization
+        self.batch_size = batch_size
+        self.time_opcodes = time_opcodes
+        self.fault_free_shortcut = fault_free_shortcut
 
     def compiled_sampler_for_task(self, task: sinter.Task) -> sinter.CompiledSampler:
-        return CompiledVecInterceptSampler(task, self.turns, self.sweep_bit_randomization)
+        return CompiledVecInterceptSampler(
+            task,
+            self.turns,
+            self.sweep_bit_randomization,
+            self.batch_size,
+            time_opcodes=self.time_opcodes,
+            fault_free_shortcut=self.fault_free_shortcut,
+        )
 
 
 class CompiledVecInterceptSampler(sinter.CompiledSampler):
-    def __init__(self, task: sinter.Task, turns: float, sweep_bit_randomization: bool):
+    def __init__(
+        self,
+        task: sinter.Task,
+        turns: float,
+        sweep_bit_randomization: bool,
+        batch_size: int = 16,
+        *,
+        time_opcodes: bool = False,
+        fault_free_shortcut: bool = False,
+    ):
         self.task = task
         self.turns = turns
         self.sweep_bit_randomization = sweep_bit_randomization
+        self.batch_size = batch_size
+        self.tape = VecInterceptTape.from_circuit(task.circuit, turns)
+        # Total seconds spent on each opcode of the tape, when `time_opcodes` is set.
+        self.opcode_seconds: dict[str, float] | None = {} if time_opcodes else None
+        self.fault_free_shortcut = fault_free_shortcut
+        self.rng = np.random.default_rng()
+        self._fault_free_stats: sinter.AnonTaskStats | None = None
+
+    def fault_free_stats(self) -> sinter.AnonTaskStats:
+        """Returns the stats of one noiseless shot, simulating it the first time."""
+        if self._fault_free_stats is None:
+            self._fault_free_stats = self.tape.sample(
+                shots=1,
+                sweep_bit_randomization=self.sweep_bit_randomization,
+                faults='none',
+                rng=self.rng,
+            )
+        return self._fault_free_stats
 
     def sample(self, shots: int) -> sinter.AnonTaskStats:
         result = sinter.AnonTaskStats()
-        for _ in range(shots):
-            result += sample_circuit_with_vec_sim(
-                self.task.circuit,
-                self.turns,
-                self.sweep_bit_randomization,
+        faults: Literal['any', 'some'] = 'any'
+        if self.fault_free_shortcut:
+            t0 = time.monotonic()
+            reference = self.fault_free_stats()
+            num_fault_free = shots - int(self.rng.binomial(shots, 1 - self.tape.fault_free_probability))
+            result += sinter.AnonTaskStats(
+                shots=num_fault_free,
+                errors=reference.errors * num_fault_free,
+                discards=reference.discards * num_fault_free,
+                seconds=time.monotonic() - t0,
+            )
+            faults = 'some'
+        while result.shots < shots:
+            result += self.tape.sample(
+                shots=min(self.batch_size, shots - result.shots),
+                sweep_bit_randomization=self.sweep_bit_randomization,
+                faults=faults,
+                rng=self.rng,
+                opcode_seconds=self.opcode_seconds,
             )
         return result
 
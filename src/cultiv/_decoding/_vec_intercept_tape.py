@@ -0,0 +1,330 @@
+import dataclasses
+import time
+from typing import Any, Literal, cast
+
+import numpy as np
+import sinter
+import stim
+
+from latte.batch_vec_sim import BatchVecSim
+
+OP_PHASE = 0
+OP_CX = 1
+OP_CZ = 2
+OP_PAULI = 3
+OP_RESET_Z = 4
+OP_RESET_X = 5
+OP_MEASURE_Z = 6
+OP_MEASURE_X = 7
+OP_MEASURE_OBS = 8
+OP_PAULI_ERROR = 9
+OP_DEPOLARIZE1 = 10
+OP_DEPOLARIZE2 = 11
+OP_FEEDBACK = 12
+OP_SWEEP = 13
+OP_DETECTOR = 14
+OP_OBSERVABLE = 15
+
+OPCODE_NAMES = [
+    'PHASE',
+    'CX',
+    'CZ',
+    'PAULI',
+    'RESET_Z',
+    'RESET_X',
+    'MEASURE_Z',
+    'MEASURE_X',
+    'MEASURE_OBS',
+    'PAULI_ERROR',
+    'DEPOLARIZE1',
+    'DEPOLARIZE2',
+    'FEEDBACK',
+    'SWEEP',
+    'DETECTOR',
+    'OBSERVABLE',
+]
+
+_PAULI_INDEX = {'X': 1, 'Y': 2, 'Z': 3}
+_T_PHASE = complex(np.exp(0.25j * np.pi))
+
+
+@dataclasses.dataclass(frozen=True)
+class VecInterceptTape:
+    """An intercept circuit compiled into a flat list of operations for `BatchVecSim`.
+
+    Compiling once avoids dispatching on instruction names, copying targets, resolving
+    measurement record offsets, and rebuilding MPP instructions on every shot. S and S_DAG
+    gates are replaced by powers of T as in `sample_circuit_with_vec_sim`, with runs of
+    phase gates on the same qubit folded into a single phase.
+
+    Each operation is a tuple whose first item is one of the `OP_*` opcodes. Measurement
+    record targets are converted into absolute measurement indices. Every independent
+    fault location (a noisy measurement, a qubit hit by a single qubit channel, or a pair
+    hit by a two qubit channel) gets a noise site index; noisy operations refer to their
+    first site, or -1 when noiseless. Knowing every site's probability up front is what
+    allows `sample` to condition on whether any fault happens.
+    """
+    ops: tuple[tuple[Any, ...], ...]
+    num_qubits: int
+    num_measurements: int
+    num_observables: int
+    num_sweep_bits: int
+    noise_probabilities: np.ndarray
+
+    @property
+    def fault_free_probability(self) -> float:
+        """The probability that a shot has no faults at all."""
+        return float(np.exp(np.sum(np.log1p(-self.noise_probabilities))))
+
+    @staticmethod
+    def from_circuit(circuit: stim.Circuit, turns: float) -> 'VecInterceptTape':
+        assert turns % 0.25 == 0
+        turns %= 2
+        t_count = round(turns * 4)
+        t_phase = _T_PHASE**t_count
+        ops: list[tuple[Any, ...]] = []
+        noise_probabilities: list[float] = []
+        num_measurements = 0
+        num_observables = 0
+
+        def rec(t: stim.GateTarget) -> int:
+            assert t.is_measurement_record_target
+            assert -num_measurements <= t.value < 0
+            return num_measurements + t.value
+
+        def sites(p: float, count: int) -> int:
+            if not p:
+                return -1
+            noise_probabilities.extend([p] * count)
+            return len(noise_probabilities) - count
+
+        def phase(q: int, p: complex) -> None:
+            if abs(p - 1) < 1e-8:
+                return
+            if ops and ops[-1][0] == OP_PHASE and ops[-1][1] == q:
+                p *= ops.pop()[2]
+                if abs(p - 1) < 1e-8:
+                    return
+            ops.append((OP_PHASE, q, p))
+
+        for inst in circuit.flattened():
+            name = inst.name
+            targets = inst.targets_copy()
+            args = inst.gate_args_copy()
+            p = args[0] if args else 0
+            if name in ['QUBIT_COORDS', 'SHIFT_COORDS', 'TICK']:
+                pass
+            elif name == 'S' or name == 'S_DAG':
+                for t in targets:
+                    phase(t.qubit_value, t_phase if name == 'S' else t_phase.conjugate())
+            elif name == 'MPP':
+                for terms in inst.target_groups():
+                    obs: dict[int, Literal['X', 'Y', 'Z']] = {}
+                    inverted = False
+                    for t in terms:
+                        inverted ^= t.is_inverted_result_target
+                        obs[t.qubit_value] = cast(Literal['X', 'Y', 'Z'], t.pauli_type)
+                    all_y = all(t.is_y_target for t in terms)
+                    if all_y:
+                        for q in obs:
+                            phase(q, t_phase.conjugate() * 1j)
+                    ops.append((OP_MEASURE_OBS, obs, inverted, sites(p, 1), num_measurements))
+                    num_measurements += 1
+                    if all_y:
+                        for q in obs:
+                            phase(q, -1j * t_phase)
+            elif name == 'M' or name == 'MX':
+                for t in targets:
+                    ops.append((OP_MEASURE_Z if name == 'M' else OP_MEASURE_X, t.qubit_value, t.is_inverted_result_target, sites(p, 1), num_measurements))
+                    num_measurements += 1
+            elif name == 'R' or name == 'RX':
+                for t in targets:
+                    ops.append((OP_RESET_Z if name == 'R' else OP_RESET_X, t.qubit_value))
+            elif name in ['X', 'Y', 'Z']:
+                for t in targets:
+                    ops.append((OP_PAULI, t.qubit_value, _PAULI_INDEX[name]))
+            elif name == 'X_ERROR' or name == 'Z_ERROR':
+                if p:
+                    qs = tuple(t.qubit_value for t in targets)
+                    ops.append((OP_PAULI_ERROR, qs, _PAULI_INDEX[name[0]], sites(p, len(qs))))
+            elif name == 'DEPOLARIZE1':
+                if p:
+                    ops.append((OP_DEPOLARIZE1, tuple(t.qubit_value for t in targets), sites(p, len(targets))))
+            elif name == 'DEPOLARIZE2':
+                if p:
+                    ops.append((OP_DEPOLARIZE2, tuple(t.qubit_value for t in targets), sites(p, len(targets) // 2)))
+            elif name == 'CX' or name == 'CZ':
+                for k in range(0, len(targets), 2):
+                    t1, t2 = targets[k], targets[k + 1]
+                    if name == 'CZ' and not t2.is_qubit_target:
+                        t1, t2 = t2, t1
+                    if t1.is_measurement_record_target:
+                        ops.append((OP_FEEDBACK, rec(t1), t2.qubit_value, 1 if name == 'CX' else 3))
+                    elif t1.is_sweep_bit_target:
+                        # Matches `BatchVecSim.do_stim_instruction`, which applies Z for both.
+                        ops.append((OP_SWEEP, t1.value, t2.qubit_value))
+                    else:
+                        ops.append((OP_CX if name == 'CX' else OP_CZ, t1.qubit_value, t2.qubit_value))
+            elif name == 'DETECTOR':
+                ops.append((OP_DETECTOR, tuple(rec(t) for t in targets)))
+            elif name == 'OBSERVABLE_INCLUDE':
+                index = round(p)
+                num_observables = max(num_observables, index + 1)
+                ops.append((OP_OBSERVABLE, index, tuple(rec(t) for t in targets)))
+            else:
+                raise NotImplementedError(f'{inst=}')
+
+        return VecInterceptTape(
+            ops=tuple(ops),
+            num_qubits=circuit.num_qubits,
+            num_measurements=num_measurements,
+            num_observables=num_observables,
+            num_sweep_bits=circuit.num_sweep_bits,
+            noise_probabilities=np.array(noise_probabilities, dtype=np.float64),
+        )
+
+    def sample_fault_sites(
+        self,
+        *,
+        shots: int,
+        faults: Literal['any', 'none', 'some'],
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """Samples which noise sites fault in each shot.
+
+        Returns:
+            A bool array with shape (num_sites, shots).
+        """
+        p = self.noise_probabilities
+        if faults == 'none':
+            return np.zeros(shape=(len(p), shots), dtype=np.bool_)
+        hits = rng.random(size=(len(p), shots)) < p[:, None]
+        if faults == 'some':
+            if not len(p):
+                raise ValueError('Every shot is fault free, so no shot can have a fault.')
+            # Draw the first fault's site from its exact distribution given that some site
+            # faults, then leave the sites after it independent.
+            first_fault_cdf = -np.expm1(np.cumsum(np.log1p(-p)))
+            u = rng.random(size=shots) * first_fault_cdf[-1]
+            first = np.minimum(np.searchsorted(first_fault_cdf, u, side='right'), len(p) - 1)
+            hits[np.arange(len(p))[:, None] < first[None, :]] = False
+            hits[first, np.arange(shots)] = True
+        elif faults != 'any':
+            raise NotImplementedError(f'{faults=}')
+        return hits
+
+    def sample(
+        self,
+        *,
+        shots: int,
+        sweep_bit_randomization: bool,
+        faults: Literal['any', 'none', 'some'] = 'any',
+        rng: np.random.Generator | None = None,
+        opcode_seconds: dict[str, float] | None = None,
+    ) -> sinter.AnonTaskStats:
+        """Replays the tape on a batch of shots.
+
+        Shots are dropped from the batch as soon as one of their detectors fires.
+
+        Args:
+            shots: The number of shots to simulate together.
+            sweep_bit_randomization: Whether sweep bits are random or all False.
+            faults: 'any' samples the circuit's noise as usual. 'none' simulates every
+                shot without noise. 'some' samples the noise conditioned on each shot
+                having at least one fault.
+            rng: The random number generator to use. Defaults to a fresh one.
+            opcode_seconds: If not None, the time spent on each opcode is added into
+                this dictionary, keyed by the opcode's name.
+        """
+        t0 = time.monotonic()
+        sim = BatchVecSim(num_qubits=self.num_qubits, batch_size=shots, rng=rng)
+        measurements = np.zeros(shape=(self.num_measurements, shots), dtype=np.bool_)
+        observables = np.zeros(shape=(self.num_observables, shots), dtype=np.bool_)
+        if sweep_bit_randomization:
+            sweep_bits = sim.rng.random(size=(self.num_sweep_bits, shots)) < 0.5
+        else:
+            sweep_bits = np.zeros(shape=(self.num_sweep_bits, shots), dtype=np.bool_)
+        hits = self.sample_fault_sites(shots=shots, faults=faults, rng=sim.rng)
+
+        for op in self.ops:
+            if opcode_seconds is not None:
+                t_start = time.perf_counter()
+            code = op[0]
+            if code == OP_PHASE:
+                sim.do_phase(op[1], op[2])
+            elif code == OP_CX:
+                sim.do_cx(op[1], op[2])
+            elif code == OP_CZ:
+                sim.do_cz(op[1], op[2])
+            elif code == OP_PAULI:
+                sim.do_pauli(op[1], op[2], None)
+            elif code == OP_RESET_Z:
+                sim.do_rz(op[1])
+            elif code == OP_RESET_X:
+                sim.do_rx(op[1])
+            elif code == OP_MEASURE_Z or code == OP_MEASURE_X or code == OP_MEASURE_OBS:
+                _, target, inverted, site, index = op
+                if code == OP_MEASURE_Z:
+                    r = sim.do_mz(target)
+                elif code == OP_MEASURE_X:
+                    r = sim.do_mx(target)
+                else:
+                    r = sim.do_measure_obs(target)
+                if site >= 0:
+                    r ^= hits[site]
+                if inverted:
+                    r ^= True
+                measurements[index] = r
+            elif code == OP_PAULI_ERROR:
+                _, qs, pauli, site = op
+                op_hits = hits[site:site + len(qs)]
+                for k in np.flatnonzero(np.any(op_hits, axis=1)):
+                    sim.do_pauli(qs[k], pauli, op_hits[k])
+            elif code == OP_DEPOLARIZE1:
+                _, qs, site = op
+                op_hits = hits[site:site + len(qs)]
+                for k in np.flatnonzero(np.any(op_hits, axis=1)):
+                    v = sim.rng.integers(1, 4, size=sim.batch_size)
+                    for pauli in range(1, 4):
+                        sim.do_pauli(qs[k], pauli, op_hits[k] & (v == pauli))
+            elif code == OP_DEPOLARIZE2:
+                _, qs, site = op
+                op_hits = hits[site:site + len(qs) // 2]
+                for k in np.flatnonzero(np.any(op_hits, axis=1)):
+                    v = sim.rng.integers(1, 16, size=sim.batch_size)
+                    for pauli in range(1, 4):
+                        sim.do_pauli(qs[2 * k], pauli, op_hits[k] & ((v & 3) == pauli))
+                        sim.do_pauli(qs[2 * k + 1], pauli, op_hits[k] & ((v >> 2) == pauli))
+            elif code == OP_FEEDBACK:
+                _, index, q, pauli = op
+                sim.do_pauli(q, pauli, measurements[index])
+            elif code == OP_SWEEP:
+                _, index, q = op
+                sim.do_z(q, sweep_bits[index])
+            elif code == OP_DETECTOR:
+                fired = np.bitwise_xor.reduce(measurements[list(op[1])], axis=0)
+                if np.any(fired):
+                    keep = ~fired
+                    sim.keep_shots(keep)
+                    measurements = measurements[:, keep]
+                    observables = observables[:, keep]
+                    sweep_bits = sweep_bits[:, keep]
+                    hits = hits[:, keep]
+            elif code == OP_OBSERVABLE:
+                _, index, recs = op
+                observables[index] ^= np.bitwise_xor.reduce(measurements[list(recs)], axis=0)
+            else:
+                raise NotImplementedError(f'{op=}')
+            if opcode_seconds is not None:
+                name = OPCODE_NAMES[code]
+                opcode_seconds[name] = opcode_seconds.get(name, 0) + time.perf_counter() - t_start
+            if sim.batch_size == 0:
+                break
+
+        t1 = time.monotonic()
+        return sinter.AnonTaskStats(
+            shots=shots,
+            errors=int(np.count_nonzero(np.any(observables, axis=0))),
+            discards=shots - sim.batch_size,
+            seconds=t1 - t0,
+        )
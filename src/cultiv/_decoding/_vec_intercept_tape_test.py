@@ -0,0 +1,98 @@
+import numpy as np
+import sinter
+import stim
+
+import gen
+from cultiv import make_inject_and_cultivate_circuit
+from ._vec_intercept_sampler import VecInterceptSampler
+from ._vec_intercept_tape import OP_DETECTOR, OP_FEEDBACK, OP_OBSERVABLE, OP_PHASE, VecInterceptTape
+
+
+def test_from_circuit():
+    tape = VecInterceptTape.from_circuit(stim.Circuit("""
+        QUBIT_COORDS(0, 0) 0
+        R 0 1
+        S 0
+        S 0
+        S_DAG 1
+        TICK
+        M 0 !1
+        CX rec[-1] 1
+        DETECTOR rec[-2]
+        OBSERVABLE_INCLUDE(2) rec[-1] rec[-2]
+        X_ERROR(0) 0
+    """), turns=0.25)
+    assert tape.num_qubits == 2
+    assert tape.num_measurements == 2
+    assert tape.num_observables == 3
+    phases = [op for op in tape.ops if op[0] == OP_PHASE]
+    assert len(phases) == 2
+    assert phases[0][1] == 0 and abs(phases[0][2] - 1j) < 1e-6
+    assert phases[1][1] == 1 and abs(phases[1][2] - np.exp(-0.25j * np.pi)) < 1e-6
+    assert tape.ops[-3] == (OP_FEEDBACK, 1, 1, 1)
+    assert tape.ops[-2] == (OP_DETECTOR, (0,))
+    assert tape.ops[-1] == (OP_OBSERVABLE, 2, (1, 0))
+
+    stats = tape.sample(shots=5, sweep_bit_randomization=False)
+    assert stats.shots == 5
+    assert stats.discards == 0
+    assert stats.errors == 5
+
+
+def test_noisy_sampling_with_opcode_timing():
+    circuit = make_inject_and_cultivate_circuit(dcolor=3, inject_style='unitary', basis='Y')
+    circuit = gen.NoiseModel.uniform_depolarizing(5e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
+    compiled = VecInterceptSampler(
+        turns=0.25,
+        sweep_bit_randomization=True,
+        time_opcodes=True,
+    ).compiled_sampler_for_task(sinter.Task(circuit=circuit))
+    stats = compiled.sample(64)
+    assert stats.shots == 64
+    assert 0 < stats.discards < 64
+    assert stats.errors <= stats.shots - stats.discards
+    assert compiled.opcode_seconds is not None
+    assert compiled.opcode_seconds['MEASURE_OBS'] > 0
+    assert compiled.opcode_seconds['DEPOLARIZE2'] > 0
+
+
+def test_sample_fault_sites_conditioned_on_some_fault():
+    tape = VecInterceptTape.from_circuit(stim.Circuit("""
+        X_ERROR(0.1) 0 1
+        DEPOLARIZE2(0.2) 0 1
+        M(0.05) 0
+    """), turns=0)
+    np.testing.assert_allclose(tape.noise_probabilities, [0.1, 0.1, 0.2, 0.05])
+    assert abs(tape.fault_free_probability - 0.9 * 0.9 * 0.8 * 0.95) < 1e-9
+
+    rng = np.random.default_rng(3)
+    hits = tape.sample_fault_sites(shots=100_000, faults='some', rng=rng)
+    assert hits.shape == (4, 100_000)
+    assert np.all(np.any(hits, axis=0))
+    expected = tape.noise_probabilities / (1 - tape.fault_free_probability)
+    np.testing.assert_allclose(np.mean(hits, axis=1), expected, atol=0.01)
+
+    assert not np.any(tape.sample_fault_sites(shots=10, faults='none', rng=rng))
+
+
+def test_fault_free_shortcut():
+    circuit = stim.Circuit("""
+        R 0 1 2
+        X_ERROR(0.02) 0 1 2
+        CX 0 1
+        M 1
+        DETECTOR rec[-1]
+        M 0 2
+        OBSERVABLE_INCLUDE(0) rec[-1]
+    """)
+    task = sinter.Task(circuit=circuit)
+    shortcut = VecInterceptSampler(
+        turns=0,
+        sweep_bit_randomization=False,
+        fault_free_shortcut=True,
+    ).compiled_sampler_for_task(task)
+    stats = shortcut.sample(100_000)
+    assert stats.shots == 100_000
+    # Discarded when exactly one of qubits 0 and 1 flips, failed when kept and qubit 2 flips.
+    assert abs(stats.discards - 100_000 * 2 * 0.02 * 0.98) < 600
+    assert abs(stats.errors - 100_000 * (1 - 2 * 0.02 * 0.98) * 0.02) < 300
@@ -1,10 +1,12 @@
 import dataclasses
 import pathlib
+from typing import Callable
 
 import stim
 
 import gen
-from ._error_set import DemErrorSet, DemCombinedError
+from ._error_set import ConnectedSearch, DemErrorSet, DemCombinedError
+from ._logical_error_cache import LogicalErrorCache, is_text_cache_file, iter_text_cache_entries
 
 
 @dataclasses.dataclass(frozen=True)
@@ -28,28 +30,35 @@ class ErrorEnumerationReport:
 
     @staticmethod
     def read_cache_file(cache_file: str | pathlib.Path) -> dict[str, list[tuple[int, ...]]]:
-        cache = {}
-        with open(cache_file, 'r') as f:
-            entries = f.read().split('ENTRY ')
-            for entry in entries:
-                if not entry.strip():
-                    continue
-                strong_id, *terms = entry.split('\n')
-                strong_id = strong_id.strip()
-                errs = []
-                for term in terms:
-                    term = term.strip()
-                    if term:
-                        errs.append(tuple(int(e) for e in term.split(',')))
-                cache[strong_id] = errs
-        return cache
+        """Reads an `ENTRY` text cache file into memory.
+
+        For large caches, prefer a `LogicalErrorCache` (see `open_cache_file`).
+        """
+        return dict(iter_text_cache_entries(cache_file))
+
+    @staticmethod
+    def open_cache_file(cache_file: str | pathlib.Path) -> dict[str, list[tuple[int, ...]]] | LogicalErrorCache:
+        """Opens a cache file, in either the SQLite or the `ENTRY` text format.
+
+        Text files are read into a dict, whose new entries aren't saved. SQLite files are
+        opened as a `LogicalErrorCache`, which loads entries as they're used and saves
+        new entries as they're added.
+        """
+        if is_text_cache_file(cache_file):
+            if not pathlib.Path(cache_file).exists():
+                return {}
+            return ErrorEnumerationReport.read_cache_file(cache_file)
+        return LogicalErrorCache(cache_file)
 
     @staticmethod
     def from_circuit(
             circuit: stim.Circuit,
             *,
             max_weight: int, noise: None | float | gen.NoiseModel = None,
-            cache: dict[str, list[tuple[int, ...]]],
+            cache: dict[str, list[tuple[int, ...]]] | LogicalErrorCache,
+            workers: int = 1,
+            progress: Callable[[int, int], None] | None = None,
+            connected_search: ConnectedSearch | None = None,
     ) -> 'ErrorEnumerationReport':
         if isinstance(noise, float):
             noise = gen.NoiseModel.uniform_depolarizing(noise)
@@ -60,25 +69,60 @@ class ErrorEnumerationReport:
             raise ValueError("dem.num_errors == 0")
         if dem.num_observables == 0:
             raise ValueError("dem.num_observables == 0")
-        return ErrorEnumerationReport.from_dem(dem, max_weight=max_weight, cache=cache)
+        return ErrorEnumerationReport.from_dem(
+            dem,
+            max_weight=max_weight,
+            cache=cache,
+            workers=workers,
+            progress=progress,
+            connected_search=connected_search,
+        )
 
     @staticmethod
     def from_dem(
             dem: stim.DetectorErrorModel,
             *,
             max_weight: int,
-            cache: dict[str, list[tuple[int, ...]]],
+            cache: dict[str, list[tuple[int, ...]]] | LogicalErrorCache | None,
+            workers: int = 1,
+            progress: Callable[[int, int], None] | None = None,
+            connected_search: ConnectedSearch | None = None,
     ) -> 'ErrorEnumerationReport':
+        """
+        Args:
+            dem: The error model to enumerate logical errors of.
+            max_weight: The largest number of errors in an enumerated logical error.
+            cache: Previously enumerated logical errors, keyed by
+                `DemErrorSet.strong_id`. Misses are added to it. A `LogicalErrorCache`
+                saves them to its file.
+            workers: Processes to enumerate with (see `DemErrorSet.find_logical_errors`).
+            progress: Called with enumeration progress.
+            connected_search: If set, logical errors are found by growing them through
+                their symptoms (see `DemErrorSet.find_connected_logical_errors`)
+                instead of by a meet in the middle search. This can reach larger weights,
+                but only finds connected logical errors, so it's cached separately.
+        """
         err_set = DemErrorSet.from_dem(dem)
         keep_rate = 1
         for err in err_set.errors:
             keep_rate *= 1 - err.p
 
-        key = err_set.strong_id(max_weight=max_weight)
-        if key not in cache:
-            print("    cache miss", key)
-            cache[key] = err_set.find_logical_errors(max_distance=max_weight)
-        logical_errs = err_set.expand_logical_errors(cache[key])
+        def find_logical_errors() -> list[tuple[int, ...]]:
+            if connected_search is not None:
+                return connected_search.find_logical_errors(err_set, max_weight)
+            return err_set.find_logical_errors(max_distance=max_weight, workers=workers, progress=progress)
+
+        if cache is None:
+            logical_errs = find_logical_errors()
+        else:
+            key = err_set.strong_id(max_weight=max_weight, connected_search=connected_search)
+            if key in cache:
+                logical_errs = cache[key]
+            else:
+                print("    cache miss", key)
+                logical_errs = find_logical_errors()
+                cache[key] = logical_errs
+        logical_errs = err_set.expand_logical_errors(logical_errs)
 
         distance_to_involved_physical_errors = {
             d: {
@@ -1,12 +1,18 @@
 import collections
+import concurrent.futures
 import dataclasses
 import hashlib
 import math
-from typing import Iterator
+import multiprocessing
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Iterator
 
 import numpy as np
 import stim
 
+import gen
+
 
 def int_to_flipped_bits(bits: int) -> list[int]:
     v = []
@@ -45,71 +51,459 @@ def iter_triplet_chunks(errs: np.ndarray) -> Iterator[np.ndarray]:
         w ^= errs[k1]
 
 
-def iter_pair_and_triplet_chunks(errs: np.ndarray) -> Iterator[np.ndarray]:
-    buf = np.copy(errs)
-    for k1 in range(1, len(errs)):
-        w = buf[:k1]
-        yield w
-        w ^= errs[k1]
-        for k2 in range(k1 + 1, len(errs)):
-            w ^= errs[k2]
-            yield w
-            w ^= errs[k2]
-        w ^= errs[k1]
+def mask_rows(masks: np.ndarray) -> np.ndarray:
+    """Returns `DemErrorSet.masks` as a C-contiguous (num_errors, num_words) uint64 array."""
+    if len(masks.shape) == 1:
+        return masks.astype(np.uint64)[:, None]
+    return np.ascontiguousarray(masks, dtype=np.uint64)
+
+
+def rows_to_keys(rows: np.ndarray) -> np.ndarray:
+    """Views the rows of a 2d array (e.g. (n, num_words) uint64 masks) as n fixed-width void keys.
+
+    Void keys compare (and sort) bytewise, so they can be deduplicated and joined with
+    np.unique and np.searchsorted regardless of how many words the masks have.
+    """
+    rows = np.ascontiguousarray(rows)
+    return rows.view(np.dtype((np.void, rows.shape[1] * rows.itemsize))).reshape(rows.shape[0])
+
+
+def count_combos_up_to(n: int, max_w: int) -> int:
+    return sum(math.comb(n, w) for w in range(max_w + 1))
+
 
+def make_pair_table(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns the members (a, b) with a < b and the combined masks of every pair of errors.
 
-def iter_combo_chunks(errs: np.ndarray, min_w: int, max_w: int) -> Iterator[np.ndarray]:
+    Pairs are ordered by their first member, so the pairs starting after error k form a
+    suffix of the table.
+    """
+    pair_a, pair_b = np.triu_indices(len(rows), 1)
+    pair_a = pair_a.astype(np.int32)
+    pair_b = pair_b.astype(np.int32)
+    pair_masks = rows[pair_a]
+    pair_masks ^= rows[pair_b]
+    return pair_a, pair_b, pair_masks
+
+
+def iter_combo_table_chunks(
+        rows: np.ndarray,
+        *,
+        max_w: int,
+        with_indices: bool,
+        chunk_size: int = 1 << 20,
+        first_members: tuple[int, int] | None = None,
+        pairs: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+) -> Iterator[tuple[np.ndarray, np.ndarray | None]]:
+    """Yields the combined masks of every set of at most max_w errors, in chunks.
+
+    Args:
+        rows: The error masks, as returned by `mask_rows`.
+        max_w: The largest set size to include.
+        with_indices: Whether to also yield the members of each set.
+        chunk_size: The most rows to yield at once (sets with three errors sharing their
+            first member are yielded together when they fit).
+        first_members: Only yields the sets whose smallest member is in the half open
+            range [start, stop). The empty set is yielded when start is 0. Defaults to
+            every set.
+        pairs: The result of `make_pair_table(rows)`, if already computed.
+
+    Yields:
+        (masks, indices) pairs. masks is an (m, num_words) uint64 array. indices is None,
+        or an (m, max_w) int32 array of the sorted members of each set padded with -1.
+    """
     if max_w > 3:
         raise NotImplementedError(f'{max_w=} > 3')
+    n, words = rows.shape
+    first_start, first_stop = (0, n) if first_members is None else first_members
 
-    if min_w <= 0 <= max_w:
-        yield errs[:1] & 0
-    if min_w <= 1 <= max_w:
-        yield errs
+    def padded(*columns: np.ndarray) -> np.ndarray:
+        result = np.full(shape=(len(columns[0]), max_w), fill_value=-1, dtype=np.int32)
+        for k, c in enumerate(columns):
+            result[:, k] = c
+        return result
 
-    buf = np.copy(errs)
-    for k1 in range(1, len(errs)):
-        w = buf[:k1]
-        w ^= errs[k1]
-        if min_w <= 2 <= max_w:
-            yield w
-        if 3 <= max_w:
-            for k2 in range(k1 + 1, len(errs)):
-                w ^= errs[k2]
-                if min_w <= 3 <= max_w:
-                    yield w
-                w ^= errs[k2]
-        w ^= errs[k1]
+    if max_w >= 0 and first_start == 0:
+        yield np.zeros(shape=(1, words), dtype=np.uint64), np.full(shape=(1, max_w), fill_value=-1, dtype=np.int32) if with_indices else None
+    if max_w >= 1:
+        for start in range(first_start, first_stop, chunk_size):
+            ks = np.arange(start, min(first_stop, start + chunk_size), dtype=np.int32)
+            yield rows[ks], padded(ks) if with_indices else None
+    if max_w >= 2:
+        pair_a, pair_b, pair_masks = make_pair_table(rows) if pairs is None else pairs
+        suffix_starts = np.searchsorted(pair_a, np.arange(n + 1), side='left')
+        for start in range(suffix_starts[first_start], suffix_starts[first_stop], chunk_size):
+            s = slice(start, min(start + chunk_size, suffix_starts[first_stop]))
+            yield pair_masks[s], padded(pair_a[s], pair_b[s]) if with_indices else None
+    if max_w >= 3:
+        for k1 in range(first_start, min(first_stop, n - 2)):
+            for start in range(suffix_starts[k1 + 1], len(pair_a), chunk_size):
+                s = slice(start, start + chunk_size)
+                chunk = pair_masks[s] ^ rows[k1]
+                if with_indices:
+                    yield chunk, padded(np.full(shape=len(chunk), fill_value=k1, dtype=np.int32), pair_a[s], pair_b[s])
+                else:
+                    yield chunk, None
 
 
-def iter_enumerate_combo_chunks(errs: np.ndarray, max_w: int) -> Iterator[tuple[np.ndarray, list[int]]]:
-    indices = []
-    if max_w >= 4:
-        raise NotImplementedError(f'{max_w=} >= 4')
+def split_first_members(n: int, max_w: int, num_shards: int) -> list[tuple[int, int]]:
+    """Splits the errors into ranges of first members, with similar numbers of sets each."""
+    work = np.array([
+        sum(math.comb(n - 1 - k, w - 1) for w in range(1, max_w + 1))
+        for k in range(n)
+    ], dtype=np.float64)
+    cuts = np.searchsorted(np.cumsum(work), np.sum(work) * np.arange(1, num_shards) / num_shards, side='right')
+    bounds = sorted({0, n, *cuts.tolist()})
+    return list(zip(bounds[:-1], bounds[1:])) or [(0, n)]
 
-    if max_w >= 0:
-        yield errs[:1] & 0, indices
 
-    indices.append(-1)
-    if max_w >= 1:
-        yield errs, indices
+_BYTE_POPCOUNTS = np.array([bin(k).count('1') for k in range(256)], dtype=np.uint8)
+
+
+def popcount_rows(rows: np.ndarray) -> np.ndarray:
+    """Returns the number of set bits in each (num_words,) uint64 row."""
+    rows = np.ascontiguousarray(rows)
+    return _BYTE_POPCOUNTS[rows.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def lowest_set_bits(rows: np.ndarray) -> np.ndarray:
+    """Returns the position of the lowest set bit in each (num_words,) uint64 row.
+
+    Every row must have a set bit.
+    """
+    word = np.argmax(rows != 0, axis=1)
+    values = rows[np.arange(len(rows)), word]
+    lowest = values & (~values + np.uint64(1))
+    return word * 64 + np.log2(lowest.astype(np.float64)).astype(np.int64)
+
+
+def partition_of_det_masks(rows: np.ndarray, num_partitions: int) -> np.ndarray:
+    """Hashes the detector part of each mask row (ignoring the observable bit) into a partition."""
+    h = rows[:, 0] >> np.uint64(1)
+    for k in range(rows.shape[1]):
+        if k:
+            h ^= rows[:, k]
+        h *= np.uint64(0x9E3779B97F4A7C15)
+        h ^= h >> np.uint64(29)
+    return (h % np.uint64(num_partitions)).astype(np.int64)
+
+
+def iter_paired_halves(
+        keys: np.ndarray,
+        obs: np.ndarray,
+        members: np.ndarray,
+        *,
+        max_distance: int,
+        chunk_size: int,
+) -> Iterator[np.ndarray]:
+    """Pairs up the halves meeting at each midpoint, yielding the sets they combine into.
+
+    A set of errors can be split into halves in many ways, so only its canonical split
+    is kept: the lower half holds the smallest len(set) // 2 members and the upper half
+    holds the rest. Every set of at most max_distance errors is then yielded exactly
+    once, as long as the halves of its canonical split are present.
+
+    Args:
+        keys: The midpoint of each half, sorted so equal midpoints are adjacent.
+        obs: Whether each half flips the observable. Within a midpoint, the halves that
+            don't flip it must come first.
+        members: The padded members of each half, as from `iter_combo_table_chunks`.
+        max_distance: The largest set to yield.
+        chunk_size: Roughly the most pairs to consider at once.
+
+    Yields:
+        Arrays of combined sets, one per row, with members in increasing order after
+        padding of -1.
+    """
+    if len(keys) == 0:
+        return
+    sizes = np.count_nonzero(members >= 0, axis=1)
+    lowest = np.where(sizes > 0, members[:, 0], np.iinfo(members.dtype).max)
+    highest = members[np.arange(len(members)), np.maximum(sizes - 1, 0)]
+    highest[sizes == 0] = -1
+
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    stops = np.concatenate([starts[1:], [len(keys)]])
+    splits = starts + np.add.reduceat(~obs, starts)
+    num_pairs = (splits - starts) * (stops - splits)
+    has_pairs = np.flatnonzero(num_pairs)
+    starts, splits, num_pairs = starts[has_pairs], splits[has_pairs], num_pairs[has_pairs]
+    num_right = num_pairs // (splits - starts)
+
+    batch_ends = np.cumsum(num_pairs)
+    g0 = 0
+    while g0 < len(starts):
+        done = batch_ends[g0 - 1] if g0 else 0
+        g1 = max(g0 + 1, int(np.searchsorted(batch_ends, done + chunk_size, side='right')))
+        counts = num_pairs[g0:g1]
+        group = np.repeat(np.arange(g0, g1), counts)
+        offset = np.arange(int(np.sum(counts))) - np.repeat(np.cumsum(counts) - counts, counts)
+        left = starts[group] + offset // num_right[group]
+        right = splits[group] + offset % num_right[group]
+        total = sizes[left] + sizes[right]
+        left_lower = (highest[left] < lowest[right]) & (sizes[left] == total // 2)
+        right_lower = (highest[right] < lowest[left]) & (sizes[right] == total // 2)
+        keep = (left_lower | right_lower) & (total <= max_distance)
+        combined = np.concatenate([members[left[keep]], members[right[keep]]], axis=1)
+        combined.sort(axis=1)
+        yield combined
+        g0 = g1
+
+
+def unique_keys(parts: list[np.ndarray], *, num_words: int) -> np.ndarray:
+    """Merges arrays of void keys into one sorted array without duplicates."""
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return np.zeros(shape=0, dtype=np.dtype((np.void, num_words * 8)))
+    return np.unique(np.concatenate(parts))
+
+
+def sorted_contains(table: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Returns which keys are in the sorted table."""
+    if len(table) == 0:
+        return np.zeros(shape=len(keys), dtype=np.bool_)
+    found = np.searchsorted(table, keys)
+    found[found == len(table)] = 0
+    return table[found] == keys
+
+
+class ShardScanner:
+    """Runs the steps of the meet in the middle search over one shard of error sets.
+
+    A shard is the error sets whose smallest member is in a range (see
+    `iter_combo_table_chunks`), restricted to one partition of the detector masks.
+    """
+    def __init__(
+            self,
+            rows: np.ndarray,
+            *,
+            pairs: tuple[np.ndarray, np.ndarray, np.ndarray] | None,
+            chunk_size: int,
+            num_partitions: int,
+    ):
+        self.rows = rows
+        self.pairs = pairs
+        self.chunk_size = chunk_size
+        self.num_partitions = num_partitions
+
+    def iter_chunks(
+            self,
+            *,
+            max_w: int,
+            partition: int,
+            shard: tuple[int, int],
+            with_indices: bool,
+    ) -> Iterator[tuple[np.ndarray, np.ndarray | None]]:
+        for chunk, indices in iter_combo_table_chunks(
+                self.rows,
+                max_w=max_w,
+                with_indices=with_indices,
+                chunk_size=self.chunk_size,
+                first_members=shard,
+                pairs=self.pairs):
+            if self.num_partitions > 1:
+                keep = partition_of_det_masks(chunk, self.num_partitions) == partition
+                chunk = chunk[keep]
+                if indices is not None:
+                    indices = indices[keep]
+            yield chunk, indices
+
+    def stored_keys(self, *, max_w: int, partition: int, shard: tuple[int, int], table: None) -> np.ndarray:
+        """Returns the masks reached by the shard's sets, as sorted void keys."""
+        return unique_keys([
+            np.unique(rows_to_keys(chunk))
+            for chunk, _ in self.iter_chunks(max_w=max_w, partition=partition, shard=shard, with_indices=False)
+        ], num_words=self.rows.shape[1])
+
+    def midpoint_keys(self, *, max_w: int, partition: int, shard: tuple[int, int], table: np.ndarray) -> np.ndarray:
+        """Returns the masks (with the observable bit set) of the shard's sets that are one
+        observable flip away from a stored mask."""
+        midpoints = []
+        for chunk, _ in self.iter_chunks(max_w=max_w, partition=partition, shard=shard, with_indices=False):
+            flipped = chunk.copy()
+            flipped[:, 0] ^= np.uint64(1)
+            hits = chunk[sorted_contains(table, rows_to_keys(flipped))]
+            hits[:, 0] |= np.uint64(1)
+            midpoints.append(np.unique(rows_to_keys(hits)))
+        return unique_keys(midpoints, num_words=self.rows.shape[1])
+
+    def halves(
+            self,
+            *,
+            max_w: int,
+            partition: int,
+            shard: tuple[int, int],
+            table: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the midpoint, observable flip, and members of the shard's sets that
+        reach a midpoint."""
+        group_keys = []
+        group_obs = []
+        group_members = []
+        for chunk, indices in self.iter_chunks(max_w=max_w, partition=partition, shard=shard, with_indices=True):
+            marked = chunk.copy()
+            marked[:, 0] |= np.uint64(1)
+            keys = rows_to_keys(marked)
+            hit = sorted_contains(table, keys)
+            group_keys.append(keys[hit])
+            group_obs.append((chunk[hit, 0] & np.uint64(1)).astype(np.bool_))
+            group_members.append(indices[hit])
+        return np.concatenate(group_keys), np.concatenate(group_obs), np.concatenate(group_members)
+
+
+SharedArraySpec = tuple[str, tuple[int, ...], str]
+
+
+def share_array(array: np.ndarray) -> tuple[SharedMemory, SharedArraySpec]:
+    """Copies an array into new shared memory, returning the memory and how to attach it."""
+    shm = SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(shape=array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
 
-    if max_w >= 2:
-        buf = np.copy(errs)
-        for k1 in range(1, len(errs)):
-            indices.append(k1)
-            w = buf[:k1]
-            w ^= errs[k1]
-            yield w, indices
-            if max_w >= 3:
-                for k2 in range(k1 + 1, len(errs)):
-                    indices.append(k2)
-                    w ^= errs[k2]
-                    yield w, indices
-                    w ^= errs[k2]
-                    indices.pop()
-            w ^= errs[k1]
-            indices.pop()
+
+def attach_array(spec: SharedArraySpec) -> tuple[SharedMemory, np.ndarray]:
+    name, shape, dtype = spec
+    shm = SharedMemory(name=name)
+    return shm, np.ndarray(shape=shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+_worker_scanner: ShardScanner | None = None
+_worker_memory: list[SharedMemory] = []
+
+
+def _init_scan_worker(
+        rows: SharedArraySpec,
+        pairs: tuple[SharedArraySpec, SharedArraySpec, SharedArraySpec] | None,
+        chunk_size: int,
+        num_partitions: int,
+) -> None:
+    global _worker_scanner
+    shm, rows = attach_array(rows)
+    _worker_memory.append(shm)
+    if pairs is not None:
+        attached = [attach_array(spec) for spec in pairs]
+        _worker_memory.extend(shm for shm, _ in attached)
+        pairs = tuple(array for _, array in attached)
+    _worker_scanner = ShardScanner(rows, pairs=pairs, chunk_size=chunk_size, num_partitions=num_partitions)
+
+
+def _run_scan_task(task: tuple[str, int, int, tuple[int, int], SharedArraySpec | None]) -> Any:
+    step, max_w, partition, shard, table = task
+    if table is None:
+        return getattr(_worker_scanner, step)(max_w=max_w, partition=partition, shard=shard, table=None)
+    shm, table = attach_array(table)
+    try:
+        return getattr(_worker_scanner, step)(max_w=max_w, partition=partition, shard=shard, table=table)
+    finally:
+        del table
+        shm.close()
+
+
+class ShardRunner:
+    """Runs the steps of the search over every shard, in this process or a process pool.
+
+    The error masks (and pair table) are placed in shared memory once, and the table
+    each step joins against is shared for the duration of the step, so workers don't
+    receive copies of them with every task.
+
+    After each finished shard, reports progress and checks for cancellation.
+    """
+    def __init__(
+            self,
+            scanner: ShardScanner,
+            *,
+            workers: int,
+            total_tasks: int,
+            progress: Callable[[int, int], None] | None,
+            cancel: threading.Event | None,
+    ):
+        self.scanner = scanner
+        self.workers = workers
+        self.total_tasks = total_tasks
+        self.done_tasks = 0
+        self.progress = progress
+        self.cancel = cancel
+        self.pool = None
+        self.memory: list[SharedMemory] = []
+
+    def __enter__(self) -> 'ShardRunner':
+        if self.workers > 1:
+            rows_shm, rows_spec = share_array(self.scanner.rows)
+            self.memory.append(rows_shm)
+            pairs_specs = None
+            if self.scanner.pairs is not None:
+                shared = [share_array(array) for array in self.scanner.pairs]
+                self.memory.extend(shm for shm, _ in shared)
+                pairs_specs = tuple(spec for _, spec in shared)
+            self.pool = multiprocessing.Pool(
+                self.workers,
+                initializer=_init_scan_worker,
+                initargs=(rows_spec, pairs_specs, self.scanner.chunk_size, self.scanner.num_partitions),
+            )
+        return self
+
+    def __exit__(self, *args) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        for shm in self.memory:
+            shm.close()
+            shm.unlink()
+
+    def finish_tasks(self, count: int) -> None:
+        self.done_tasks += count
+        if self.progress is not None:
+            self.progress(self.done_tasks, self.total_tasks)
+        if self.cancel is not None and self.cancel.is_set():
+            raise concurrent.futures.CancelledError()
+
+    def run(
+            self,
+            step: str,
+            *,
+            max_w: int,
+            partition: int,
+            shards: list[tuple[int, int]],
+            table: np.ndarray | None,
+    ) -> list[Any]:
+        results = []
+        if self.pool is None:
+            method = getattr(self.scanner, step)
+            for shard in shards:
+                results.append(method(max_w=max_w, partition=partition, shard=shard, table=table))
+                self.finish_tasks(1)
+            return results
+
+        table_shm = None
+        table_spec = None
+        if table is not None:
+            table_shm, table_spec = share_array(table)
+        try:
+            tasks = [(step, max_w, partition, shard, table_spec) for shard in shards]
+            for result in self.pool.imap_unordered(_run_scan_task, tasks):
+                results.append(result)
+                self.finish_tasks(1)
+        finally:
+            if table_shm is not None:
+                table_shm.close()
+                table_shm.unlink()
+        return results
+
+
+@dataclasses.dataclass(frozen=True)
+class ConnectedSearch:
+    """Settings for `DemErrorSet.find_connected_logical_errors`."""
+    max_symptom_size: int | None = None
+    max_error_size: int | None = None
+    lookup_weight: int = 2
+
+    def find_logical_errors(self, error_set: 'DemErrorSet', max_distance: int) -> list[tuple[int, ...]]:
+        return error_set.find_connected_logical_errors(
+            max_distance,
+            max_symptom_size=self.max_symptom_size,
+            max_error_size=self.max_error_size,
+            lookup_weight=self.lookup_weight,
+        )
 
 
 @dataclasses.dataclass
@@ -118,11 +512,13 @@ class DemErrorSet:
     probs: np.ndarray
     masks: np.ndarray
 
-    def strong_id(self, max_weight: int) -> str:
+    def strong_id(self, max_weight: int, connected_search: 'ConnectedSearch | None' = None) -> str:
         lines = []
         for err in sorted(self.errors):
             lines.append(f'{err.det}:{err.obs}')
         lines.append(f'w={max_weight}')
+        if connected_search is not None:
+            lines.append(f'connected={connected_search.max_symptom_size}:{connected_search.max_error_size}')
         return hashlib.sha1('\n'.join(lines).encode('utf8')).hexdigest()
 
     @staticmethod
@@ -130,12 +526,14 @@ class DemErrorSet:
         if dem.num_observables > 1:
             raise NotImplementedError(f'{dem.num_observables=} > 1')
         num_dets = dem.num_detectors
+        arrays = gen.DemArrays.from_dem(dem)
+        det_bytes = arrays.detector_masks().tobytes()
+        row_width = len(det_bytes) // max(arrays.num_errors, 1)
         acc = collections.defaultdict(float)
-        for instruction in dem.flattened():
-            if instruction.type == 'error':
-                err = DemError.from_error_instruction(instruction)
-                key = (err.det, err.obs)
-                acc[key] = bernoulli_sum(acc[key], err.p)
+        for k, (p, obs) in enumerate(zip(arrays.probabilities.tolist(), arrays.obs_masks.tolist())):
+            det = int.from_bytes(det_bytes[k * row_width:(k + 1) * row_width], 'little')
+            key = (det, obs)
+            acc[key] = bernoulli_sum(acc[key], p)
         words = math.ceil((num_dets + 1) / 64)
         shape = (len(acc),)
         if num_dets < 8:
@@ -164,88 +562,297 @@ class DemErrorSet:
             errors.append(DemError(p=p, det=det, obs=obs))
         return DemErrorSet(masks=masks, probs=probs, errors=errors)
 
-    def find_masks_reached_by_errors_up_to(self, *, max_distance: int, opposing_masks: set[int] | None = None) -> set[int]:
-        if max_distance > 3:
-            raise NotImplementedError(f'{max_distance=} > 3')
+    def find_logical_errors(
+            self,
+            max_distance: int,
+            *,
+            chunk_size: int = 1 << 20,
+            max_table_size: int = 1 << 25,
+            workers: int = 1,
+            progress: Callable[[int, int], None] | None = None,
+            cancel: threading.Event | None = None,
+    ) -> list[tuple[int, ...]]:
+        """Finds every set of at most max_distance errors that only flips the observable.
 
-        result: set[int] = set()
-        if opposing_masks is None:
-            if len(self.masks.shape) == 1:
-                for chunk in iter_combo_chunks(self.masks, min_w=0, max_w=max_distance):
-                    result.update(chunk)
-            else:
-                for chunk in iter_combo_chunks(self.masks, min_w=0, max_w=max_distance):
-                    for e in chunk:
-                        val = 0
-                        for ke in range(len(e)):
-                            val ^= int(e[ke]) << (ke * 64)
-                        result.add(val)
-        else:
-            if len(self.masks.shape) == 1:
-                for chunk in iter_combo_chunks(self.masks, min_w=0, max_w=max_distance):
-                    for e in chunk:
-                        val = int(e)
-                        if val ^ 1 in opposing_masks:
-                            result.add(val | 1)
-            else:
-                for chunk in iter_combo_chunks(self.masks, min_w=0, max_w=max_distance):
-                    for e in chunk:
-                        val = 0
-                        for ke in range(len(e)):
-                            val ^= int(e[ke]) << (ke * 64)
-                        if val ^ 1 in opposing_masks:
-                            result.add(val | 1)
-        return result
+        Meets in the middle: a set with that symptom splits into two halves whose masks
+        differ only in the observable bit. The masks reachable from the smaller halves
+        are stored as a sorted table of void keys, the larger halves are joined against
+        it with np.searchsorted to find the midpoint masks, and then the halves reaching
+        each midpoint are paired up.
 
-    def find_errors_for_midpoint_masks(self, midpoints: set[int], max_distance: int) -> dict[int, set[frozenset[int, ...]]]:
-        result: dict[int, set[frozenset[int, ...]]] = {}
-        if len(self.masks.shape) == 1:
-            for chunk, indices in iter_enumerate_combo_chunks(self.masks, max_w=max_distance):
-                for k in range(len(chunk)):
-                    e = chunk[k]
-                    val = int(e)
-                    if val | 1 in midpoints:
-                        if val not in result:
-                            result[val] = set()
-                        if indices:
-                            indices[0] = k
-                        result[val].add(frozenset(indices))
-        else:
-            for chunk, indices in iter_enumerate_combo_chunks(self.masks, max_w=max_distance):
-                for k in range(len(chunk)):
-                    e = chunk[k]
-                    val = 0
-                    for ke in range(len(e)):
-                        val ^= int(e[ke]) << (ke * 64)
-                    if val | 1 in midpoints:
-                        if val not in result:
-                            result[val] = set()
-                        if indices:
-                            indices[0] = k
-                        result[val].add(frozenset(indices))
-        return result
+        Each of those steps is split into shards by the smallest member of the halves,
+        which can be run in parallel.
 
-    def combine_midpoint_errors(self, midpoint_errors: dict[int, set[frozenset[int, ...]]]) -> set[frozenset[int, ...]]:
-        result = set()
-        for k, vs0 in midpoint_errors.items():
-            vs1 = midpoint_errors.get(int(k) ^ 1, ())
-            for v1 in vs1:
-                for v0 in vs0:
-                    result.add(v0 ^ v1)
-        return result
+        Args:
+            max_distance: The largest number of errors in a logical error.
+            chunk_size: The most error sets to hold in one chunk while scanning.
+            max_table_size: The most error sets to store in one table. When the smaller
+                halves don't fit, they're split into partitions by a hash of their
+                detector masks, and each partition is joined separately.
+            workers: The number of processes to scan shards with. With more than one,
+                the error masks are placed in shared memory for a process pool.
+            progress: Called with (finished shards, total shards) after each shard.
+            cancel: Checked after each shard. If it's set, the workers are stopped and
+                concurrent.futures.CancelledError is raised.
 
-    def find_logical_errors(self, max_distance: int) -> list[tuple[int, ...]]:
+        Returns:
+            The sorted members of each logical error, ordered by size and then members.
+        """
         if max_distance > 6:
             raise NotImplementedError(f'{max_distance} > 6')
+        if workers < 1:
+            raise ValueError(f'{workers=} < 1')
         store_w = max_distance // 2
         search_w = max_distance - store_w
-        potential_midpoints = self.find_masks_reached_by_errors_up_to(max_distance=store_w)
-        actual_midpoints = self.find_masks_reached_by_errors_up_to(max_distance=search_w, opposing_masks=potential_midpoints)
-        groups = self.find_errors_for_midpoint_masks(actual_midpoints, max(store_w, search_w))
-        logical_errors = self.combine_midpoint_errors(groups)
-        logical_errors = [tuple(sorted(e)) for e in logical_errors if len(e) <= max_distance]
-        logical_errors = sorted(logical_errors, key=lambda e: (len(e), e))
-        return logical_errors
+        half_w = max(store_w, search_w)
+        rows = mask_rows(self.masks)
+        num_partitions = max(1, -(-count_combos_up_to(len(rows), store_w) // max_table_size))
+        shards = split_first_members(len(rows), half_w, 8 * workers)
+        scanner = ShardScanner(
+            rows,
+            pairs=make_pair_table(rows) if half_w >= 2 else None,
+            chunk_size=chunk_size,
+            num_partitions=num_partitions,
+        )
+
+        logical_errors = []
+        with ShardRunner(
+                scanner,
+                workers=workers,
+                total_tasks=3 * num_partitions * len(shards),
+                progress=progress,
+                cancel=cancel) as runner:
+            for partition in range(num_partitions):
+                stored = unique_keys(
+                    runner.run('stored_keys', max_w=store_w, partition=partition, shards=shards, table=None),
+                    num_words=rows.shape[1],
+                )
+                midpoints = unique_keys(
+                    runner.run('midpoint_keys', max_w=search_w, partition=partition, shards=shards, table=stored),
+                    num_words=rows.shape[1],
+                )
+                del stored
+                if len(midpoints) == 0:
+                    runner.finish_tasks(len(shards))
+                    continue
+
+                # Every half (of either size) reaching a midpoint, grouped by midpoint.
+                halves = runner.run('halves', max_w=half_w, partition=partition, shards=shards, table=midpoints)
+                group_keys = np.concatenate([keys for keys, _, _ in halves])
+                group_obs = np.concatenate([obs for _, obs, _ in halves])
+                group_members = np.concatenate([members for _, _, members in halves])
+                # Within each midpoint's group, halves not flipping the observable come first.
+                order = np.lexsort((group_obs, group_keys))
+                for combined in iter_paired_halves(
+                        group_keys[order],
+                        group_obs[order],
+                        group_members[order],
+                        max_distance=max_distance,
+                        chunk_size=chunk_size):
+                    for row in combined.tolist():
+                        logical_errors.append(tuple(e for e in row if e >= 0))
+
+        return sorted(logical_errors, key=lambda e: (len(e), e))
+
+    def find_connected_logical_errors(
+            self,
+            max_distance: int,
+            *,
+            max_symptom_size: int | None = None,
+            max_error_size: int | None = None,
+            lookup_weight: int = 2,
+            chunk_size: int = 1 << 20,
+    ) -> list[tuple[int, ...]]:
+        """Same as `find_connected_logical_error_tables`, but returns a list of tuples.
+
+        Returns:
+            The sorted members of each logical error, ordered by size and then members.
+        """
+        tables = self.find_connected_logical_error_tables(
+            max_distance,
+            max_symptom_size=max_symptom_size,
+            max_error_size=max_error_size,
+            lookup_weight=lookup_weight,
+            chunk_size=chunk_size,
+        )
+        result = []
+        for w in sorted(tables):
+            result.extend(map(tuple, tables[w].tolist()))
+        return result
+
+    def find_connected_logical_error_tables(
+            self,
+            max_distance: int,
+            *,
+            max_symptom_size: int | None = None,
+            max_error_size: int | None = None,
+            lookup_weight: int = 2,
+            chunk_size: int = 1 << 20,
+    ) -> dict[int, np.ndarray]:
+        """Finds logical errors by growing sets of errors through their symptoms.
+
+        Every logical error contains an error that flips the observable, so the search
+        starts from those. A partial set whose symptom includes detection events is then
+        only extended by errors touching one of those detectors (the one touched by the
+        fewest errors), since some error in the rest of the logical error has to cancel
+        it. The partial sets are grown one error at a time, as deduplicated NumPy tables,
+        and dropped when the remaining errors couldn't cancel their symptom. The last
+        few errors are found by looking the symptom up in a sorted table of every set of
+        at most lookup_weight errors, instead of by growing.
+
+        Unlike `find_logical_errors` this never combines unrelated errors with the
+        partial sets, so it can reach larger weights. But it only finds the logical
+        errors that can be grown this way. That includes every minimal logical error
+        (one with no proper subset whose detection events all cancel), but not e.g. a
+        logical error combined with a far away undetectable set of errors.
+
+        Args:
+            max_distance: The largest number of errors in a logical error.
+            max_symptom_size: Partial sets with more detection events than this are
+                dropped (like detection_event_cutoff in `latte.dem_util.bernoulli_combo`).
+                Logical errors passing through larger symptoms are then missed.
+            max_error_size: Errors with more detectors than this are ignored (like
+                error_size_cutoff in `latte.dem_util.bernoulli_combo`).
+            lookup_weight: The size of the largest sets in the lookup table (at most 3).
+            chunk_size: The most partial sets to extend at once.
+
+        Returns:
+            A dictionary mapping each size w to a (num_logical_errors, w) int32 array of
+            the logical errors with w members. Each row is sorted, and the rows are in
+            lexicographic order. Keeping the members as arrays (instead of e.g. a set of
+            tuples) is what keeps the memory of large enumerations manageable.
+        """
+        rows = mask_rows(self.masks)
+        n, words = rows.shape
+        bits = np.unpackbits(rows.view(np.uint8), axis=1, bitorder='little').astype(np.bool_)
+        det_sizes = np.count_nonzero(bits[:, 1:], axis=1)
+        allowed = np.ones(shape=n, dtype=np.bool_)
+        if max_error_size is not None:
+            allowed &= det_sizes <= max_error_size
+        allowed_errors = np.flatnonzero(allowed).astype(np.int32)
+        if len(allowed_errors) == 0 or max_distance < 1:
+            return {}
+        max_cancelled = max(1, int(np.max(det_sizes[allowed])))
+
+        # Renumber the detectors by how many errors touch them, so that the lowest
+        # detection event of a symptom is the one with the fewest ways to cancel it.
+        degrees = np.count_nonzero(bits[allowed, 1:], axis=0)
+        order = np.argsort(degrees, kind='stable')
+        bits = np.concatenate([bits[:, :1], bits[:, 1:][:, order]], axis=1)
+        rows = np.ascontiguousarray(np.packbits(bits, axis=1, bitorder='little')).view(np.uint64)
+        touching = [np.flatnonzero(bits[:, 1 + k] & allowed).astype(np.int32) for k in range(bits.shape[1] - 1)]
+        touching_starts = np.cumsum([0] + [len(t) for t in touching])
+        touching = np.concatenate(touching) if touching else np.zeros(shape=0, dtype=np.int32)
+
+        # The symptoms of every small set of errors, sorted.
+        lookup_weight = min(lookup_weight, max_distance - 1)
+        table_masks = []
+        table_members = []
+        for chunk, indices in iter_combo_table_chunks(rows[allowed_errors], max_w=lookup_weight, with_indices=True, chunk_size=chunk_size):
+            table_masks.append(chunk)
+            table_members.append(np.where(indices >= 0, allowed_errors[indices], -1))
+        table_keys = rows_to_keys(np.concatenate(table_masks))
+        table_members = np.concatenate(table_members)
+        table_order = np.argsort(table_keys, kind='stable')
+        table_keys = table_keys[table_order]
+        table_members = table_members[table_order]
+        table_sizes = np.count_nonzero(table_members >= 0, axis=1)
+
+        # Found logical errors, by size. The same logical error is found many times (from
+        # each of its observable flipping members, and split differently between grown
+        # and looked up members), so the tables are deduplicated whenever they've
+        # doubled. The members are stored big endian, so that the bytewise order of the
+        # void keys is the lexicographic order of the (non-negative) members.
+        found: dict[int, list[np.ndarray]] = collections.defaultdict(list)
+        found_rows: dict[int, int] = collections.defaultdict(int)
+        unique_rows: dict[int, int] = collections.defaultdict(int)
+
+        def deduplicate(w: int) -> None:
+            keys = np.unique(rows_to_keys(np.concatenate(found.pop(w), dtype='>i4')))
+            found[w] = [keys.view('>i4').reshape(len(keys), w)]
+            found_rows[w] = unique_rows[w] = len(keys)
+
+        def complete(members: np.ndarray, masks: np.ndarray) -> None:
+            """Records the partial sets combined with table sets cancelling their symptoms."""
+            wanted = masks.copy()
+            wanted[:, 0] ^= np.uint64(1)
+            wanted = rows_to_keys(wanted)
+            lo = np.searchsorted(table_keys, wanted, side='left')
+            hi = np.searchsorted(table_keys, wanted, side='right')
+            counts = hi - lo
+            parent = np.repeat(np.arange(len(counts)), counts)
+            entry = np.arange(len(parent)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+            fits = table_sizes[entry] <= max_distance - members.shape[1]
+            parent = parent[fits]
+            entry = entry[fits]
+            combined = np.concatenate([members[parent], table_members[entry]], axis=1)
+            combined.sort(axis=1)
+            overlapping = np.any((combined[:, 1:] == combined[:, :-1]) & (combined[:, 1:] >= 0), axis=1)
+            combined = combined[~overlapping]
+            # Sorting put the -1 padding first, so the members are at the end of each row.
+            sizes = np.count_nonzero(combined >= 0, axis=1)
+            for w in np.unique(sizes).tolist():
+                found[w].append(combined[sizes == w, combined.shape[1] - w:].astype('>i4'))
+                found_rows[w] += len(found[w][-1])
+                if found_rows[w] > max(chunk_size, 2 * unique_rows[w]):
+                    deduplicate(w)
+
+        def iter_grown(members: np.ndarray, masks: np.ndarray) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+            """Yields the partial sets extended by each error touching their pivot detector."""
+            dets = masks.copy()
+            dets[:, 0] &= ~np.uint64(1)
+            sizes = popcount_rows(dets)
+            keep = (sizes > 0) & (sizes <= max_cancelled * (max_distance - members.shape[1]))
+            if max_symptom_size is not None:
+                keep &= sizes <= max_symptom_size
+            members = members[keep]
+            masks = masks[keep]
+            pivots = lowest_set_bits(dets[keep]) - 1
+            all_counts = touching_starts[pivots + 1] - touching_starts[pivots]
+            batch_ends = np.cumsum(all_counts)
+            p0 = 0
+            while p0 < len(members):
+                done = batch_ends[p0 - 1] if p0 else 0
+                p1 = max(p0 + 1, int(np.searchsorted(batch_ends, done + chunk_size, side='right')))
+                counts = all_counts[p0:p1]
+                parent = np.repeat(np.arange(p0, p1), counts)
+                offset = np.arange(len(parent)) - np.repeat(np.cumsum(counts) - counts, counts)
+                added = touching[np.repeat(touching_starts[pivots[p0:p1]], counts) + offset]
+                new = ~np.any(members[parent] == added[:, None], axis=1)
+                parent = parent[new]
+                added = added[new]
+                grown = np.concatenate([members[parent], added[:, None]], axis=1)
+                grown.sort(axis=1)
+                _, unique = np.unique(rows_to_keys(grown), return_index=True)
+                yield grown[unique], masks[parent[unique]] ^ rows[added[unique]]
+                p0 = p1
+
+        members = allowed_errors[(rows[allowed_errors, 0] & np.uint64(1)).astype(np.bool_)][:, None]
+        masks = rows[members[:, 0]]
+        complete(members, masks)
+        for k in range(2, max_distance - lookup_weight + 1):
+            if k + lookup_weight == max_distance:
+                # The last level is the largest. Complete it as it's grown instead of storing it.
+                for grown_members, grown_masks in iter_grown(members, masks):
+                    complete(grown_members, grown_masks)
+                break
+            grown = list(iter_grown(members, masks))
+            if not grown:
+                break
+            members = np.concatenate([m for m, _ in grown])
+            masks = np.concatenate([m for _, m in grown])
+            del grown
+            _, unique = np.unique(rows_to_keys(members), return_index=True)
+            members = members[unique]
+            masks = masks[unique]
+            complete(members, masks)
+
+        result = {}
+        for w in sorted(found):
+            deduplicate(w)
+            table, = found.pop(w)
+            result[w] = table.astype(np.int32)
+        return result
 
     def expand_logical_errors(self, logical_errors: list[tuple[int, ...]]) -> list['DemCombinedError']:
         result = []
@@ -298,35 +905,95 @@ def chance_of_exactly_1(ps: list[float]) -> float:
 
 
 def analyze_solerr_discard_vs_error_rate(error_set: DemErrorSet, logical_errors: list['DemCombinedError']):
-    e2f = {}
-    for k_cond in range(len(error_set.errors)):
-        p = 0
-        for logical_err in logical_errors:
-            p += math.prod(error_set.probs[k] for k in logical_err.src_errors if k_cond != k)
-        e2f[k_cond] = p
+    """Computes the discard rate vs error rate curve from allowing solo errors.
+
+    Errors are allowed to happen alone (without causing a discard) one at a time, in
+    order of how much they contribute to the logical error rate. After each error is
+    allowed, the discard rate and the logical error rate (from the given logical errors,
+    now missing any allowed error) are recorded.
+
+    The curve is built incrementally. The keep rate only needs running sums over the
+    allowed errors (with the no-error chance kept in log space), and allowing an error
+    only changes the fail sets of the logical errors containing it. So the whole curve
+    takes time proportional to the total size of the logical errors instead of
+    recomputing everything for every allowed error.
+
+    Returns:
+        A tuple (discard_rates, error_rates) with one entry per error.
+    """
+    probs = [float(p) for p in error_set.probs]
+    n = len(probs)
+    logical_sets = [frozenset(err.src_errors) for err in logical_errors]
+    logical_probs = [math.prod(probs[k] for k in err) for err in logical_sets]
+    error_to_logicals: list[list[int]] = [[] for _ in range(n)]
+    for i, err in enumerate(logical_sets):
+        for k in err:
+            error_to_logicals[k].append(i)
+
+    def prod_without(i: int, k: int) -> float:
+        return math.prod(probs[e] for e in logical_sets[i] if e != k)
+
+    # How much each error contributes, if it were removed from the logical errors.
+    total = sum(logical_probs)
+    e2f = [total] * n
+    for k in range(n):
+        for i in error_to_logicals[k]:
+            e2f[k] += prod_without(i, k) - logical_probs[i]
+
+    # A logical error L produces the fail set L for each of its errors that isn't
+    # allowed, and L - {k} for each allowed error k in it. Count how many times each
+    # fail set is produced, and sum the chances of the ones produced at least once.
+    fail_set_counts: collections.Counter[frozenset[int]] = collections.Counter()
+    fail_rate = 0.0
+
+    def adjust(fail_set: frozenset[int], p: float, delta: int):
+        nonlocal fail_rate
+        before = fail_set_counts[fail_set]
+        after = before + delta
+        fail_set_counts[fail_set] = after
+        if before == 0 and after > 0:
+            fail_rate += p
+        elif before > 0 and after == 0:
+            fail_rate -= p
+            del fail_set_counts[fail_set]
+
+    for i, err in enumerate(logical_sets):
+        adjust(err, logical_probs[i], len(err))
+
+    # The chance of no errors, split into the selected and the allowed errors. Errors
+    # with probability 1 are counted instead of being put into the log sums.
+    log_no_error_selected = math.fsum(math.log1p(-p) for p in probs if p != 1)
+    ones_selected = sum(p == 1 for p in probs)
+    log_no_error_allowed = 0.0
+    ones_allowed = 0
+    allowed_odds = 0.0
 
     xs = []
     ys = []
-    allowed_singleton_errors = set()
-    selected_errors = set(range(len(error_set.errors)))
-    for k, v in sorted(e2f.items(), key=lambda e: (e[1], e[0])):
-        allowed_singleton_errors.add(k)
-        selected_errors.remove(k)
-        p0a = chance_of_exactly_0([error_set.probs[k] for k in selected_errors])
-        p0b = chance_of_exactly_0([error_set.probs[k] for k in allowed_singleton_errors])
-        p1b = chance_of_exactly_1([error_set.probs[k] for k in allowed_singleton_errors])
+    for k in sorted(range(n), key=lambda k: (e2f[k], k)):
+        p = probs[k]
+        if p == 1:
+            ones_selected -= 1
+            ones_allowed += 1
+        else:
+            log_no_error_selected -= math.log1p(-p)
+            log_no_error_allowed += math.log1p(-p)
+            allowed_odds += p / (1 - p)
+
+        p0a = 0 if ones_selected else math.exp(log_no_error_selected)
+        prod_allowed = math.exp(log_no_error_allowed)
+        p0b = 0 if ones_allowed else prod_allowed
+        if ones_allowed >= 2:
+            p1b = 0
+        elif ones_allowed == 1:
+            p1b = prod_allowed
+        else:
+            p1b = prod_allowed * allowed_odds
         keep_rate = p0a * (p0b + p1b)
 
-        fail_sets = set()
-        for logical_err in logical_errors:
-            for k_cond in logical_err.src_errors:
-                if k_cond in allowed_singleton_errors:
-                    fail_sets.add(frozenset(e for e in logical_err.src_errors if e != k_cond))
-                else:
-                    fail_sets.add(frozenset(logical_err.src_errors))
-        fail_rate = 0
-        for fail_set in fail_sets:
-            fail_rate += math.prod(error_set.probs[e] for e in fail_set)
+        for i in error_to_logicals[k]:
+            adjust(logical_sets[i], logical_probs[i], -1)
+            adjust(logical_sets[i] - {k}, prod_without(i, k), +1)
 
         xs.append(1 - keep_rate)
         ys.append(fail_rate)
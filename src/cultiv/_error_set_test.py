@@ -1,8 +1,15 @@
+import concurrent.futures
+import itertools
+import threading
+
 import numpy as np
+import pytest
 import stim
 
+from ._error_enumeration_report import ErrorEnumerationReport
 from ._error_set import DemError, \
-    int_to_flipped_bits, iter_pair_chunks, iter_triplet_chunks, DemErrorSet, chance_of_exactly_1, chance_of_exactly_0
+    int_to_flipped_bits, iter_pair_chunks, iter_triplet_chunks, DemErrorSet, chance_of_exactly_1, chance_of_exactly_0, \
+    iter_combo_table_chunks, mask_rows, analyze_solerr_discard_vs_error_rate, DemCombinedError
 
 
 def test_int_to_flipped_bits():
@@ -139,56 +146,6 @@ def test_find_errors():
         0b11000000000000,
     ])
     assert np.array_equal(ds.probs, [0.125, 0.375, 0.125, 0.125, 0.125, 0.25 , 0.25 , 0.25])
-    assert ds.find_masks_reached_by_errors_up_to(max_distance=0) == {0}
-    assert ds.find_masks_reached_by_errors_up_to(max_distance=1) == {
-        0,
-        *ds.masks,
-    }
-    stored2 = ds.find_masks_reached_by_errors_up_to(max_distance=2)
-    assert stored2 == {
-        0,
-        *ds.masks,
-        *[a ^ b for a in ds.masks for b in ds.masks],
-    }
-    stored3 = ds.find_masks_reached_by_errors_up_to(max_distance=3)
-    assert stored3 == {
-        0,
-        *ds.masks,
-        *[a ^ b for a in ds.masks for b in ds.masks],
-        *[a ^ b ^ c for a in ds.masks for b in ds.masks for c in ds.masks],
-    }
-
-    assert ds.find_masks_reached_by_errors_up_to(max_distance=2, opposing_masks=stored2) == set()
-    mids = ds.find_masks_reached_by_errors_up_to(max_distance=3, opposing_masks=stored2)
-    assert mids == {
-        (0b00000000000110 ^ 0b00000000000010) | 1,
-        (0b00000000001100 ^ 0b00000000000010) | 1,
-        (0b00000000011000 ^ 0b00000000000010) | 1,
-        (0b00000000010000 ^ 0b00000000000010) | 1,
-        (0b00000000001100 ^ 0b00000000000110) | 1,
-        (0b00000000011000 ^ 0b00000000000110) | 1,
-        (0b00000000010000 ^ 0b00000000000110) | 1,
-        (0b00000000011000 ^ 0b00000000001100) | 1,
-        (0b00000000010000 ^ 0b00000000001100) | 1,
-        (0b00000000010000 ^ 0b00000000011000) | 1,
-        (0b01000000000010 ^ 0b00000000000010) | 1,
-        (0b11000000000000 ^ 0b00000000000010) | 1,
-        (0b10000000010000 ^ 0b00000000000010) | 1,
-        (0b11000000000000 ^ 0b01000000000010) | 1,
-        (0b10000000010000 ^ 0b01000000000010) | 1,
-        (0b00000000010000 ^ 0b01000000000010) | 1,
-        (0b10000000010000 ^ 0b11000000000000) | 1,
-        (0b00000000010000 ^ 0b11000000000000) | 1,
-        (0b00000000010000 ^ 0b10000000010000) | 1,
-    }
-
-    errs = ds.find_errors_for_midpoint_masks(mids, max_distance=3)
-    for k, combos in errs.items():
-        for combo in combos:
-            acc = 0
-            for v in combo:
-                acc ^= ds.masks[v]
-            assert acc == k
 
 
 def test_find_errors_multi_word_det_masks():
@@ -219,6 +176,102 @@ def test_find_errors_multi_word_det_masks():
     assert len(r) == 2
 
 
+def test_iter_combo_table_chunks():
+    rows = np.array([[1 << k, 1 << (k + 10)] for k in range(6)], dtype=np.uint64)
+    seen = []
+    for chunk, indices in iter_combo_table_chunks(rows, max_w=3, with_indices=True, chunk_size=4):
+        assert len(chunk) <= 4
+        for mask, members in zip(chunk, indices):
+            members = tuple(int(e) for e in members if e >= 0)
+            expected = np.zeros(2, dtype=np.uint64)
+            for e in members:
+                expected ^= rows[e]
+            assert np.array_equal(mask, expected)
+            seen.append(members)
+    assert sorted(seen) == sorted(c for w in range(4) for c in itertools.combinations(range(6), w))
+
+
+def test_find_logical_errors_matches_brute_force():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=3,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.01,
+    )
+    ds = DemErrorSet.from_dem(circuit.detector_error_model())
+    rows = mask_rows(ds.masks)
+    expected = []
+    for w in range(6):
+        for combo in itertools.combinations(range(len(rows)), w):
+            mask = np.bitwise_xor.reduce(rows[list(combo)], axis=0) if combo else rows[0] * 0
+            if mask[0] == 1 and not np.any(mask[1:]):
+                expected.append(combo)
+    assert ds.find_logical_errors(max_distance=5) == expected
+    assert ds.find_logical_errors(max_distance=5, chunk_size=7, max_table_size=20) == expected
+    assert ds.find_logical_errors(max_distance=4) == [e for e in expected if len(e) <= 4]
+
+
+def test_find_logical_errors_with_workers():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=5,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.01,
+    )
+    ds = DemErrorSet.from_dem(circuit.detector_error_model())
+    expected = ds.find_logical_errors(max_distance=5)
+    reports = []
+    actual = ds.find_logical_errors(max_distance=5, workers=2, max_table_size=100, progress=lambda *e: reports.append(e))
+    assert actual == expected
+    assert reports[-1][0] == reports[-1][1]
+    assert [done for done, _ in reports] == list(range(1, len(reports) + 1))
+
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(concurrent.futures.CancelledError):
+        ds.find_logical_errors(max_distance=5, workers=2, cancel=cancel)
+
+
+def test_find_connected_logical_errors():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=4,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.01,
+    )
+    ds = DemErrorSet.from_dem(circuit.detector_error_model())
+    # The code is too small for a logical error to have an undetectable subset below
+    # weight 6, so every logical error up to weight 5 is found by growing.
+    expected = ds.find_logical_errors(max_distance=5)
+    assert ds.find_connected_logical_errors(max_distance=5) == expected
+    assert ds.find_connected_logical_errors(max_distance=5, lookup_weight=1, chunk_size=50) == expected
+    assert ds.find_connected_logical_errors(max_distance=5, lookup_weight=3) == expected
+    assert ds.find_connected_logical_errors(max_distance=4) == [e for e in expected if len(e) <= 4]
+    tables = ds.find_connected_logical_error_tables(max_distance=5, chunk_size=50)
+    assert sorted(tables) == sorted({len(e) for e in expected})
+    for w, table in tables.items():
+        assert table.dtype == np.int32 and table.shape[1] == w
+        assert list(map(tuple, table.tolist())) == [e for e in expected if len(e) == w]
+
+    circuit = stim.Circuit.generated(
+        'color_code:memory_xyz',
+        distance=3,
+        rounds=2,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.01,
+    )
+    ds = DemErrorSet.from_dem(circuit.detector_error_model())
+    expected = ds.find_logical_errors(max_distance=4)
+    assert ds.find_connected_logical_errors(max_distance=4) == expected
+    pruned = ds.find_connected_logical_errors(max_distance=4, max_symptom_size=3, max_error_size=2)
+    assert set(pruned) < set(expected)
+    for err in pruned:
+        assert all(len(int_to_flipped_bits(ds.errors[e].det)) <= 2 for e in err)
+
+
 def test_chance_of_exactly_0():
     assert chance_of_exactly_0([]) == 1
     assert chance_of_exactly_0([0.25]) == 0.75
@@ -257,3 +310,66 @@ def test_chance_of_exactly_1():
     assert chance_of_exactly_1([0.5, 0.5, 0.5, 0.5]) == 4 / 16
     assert chance_of_exactly_1([0.5, 0.5, 0.5, 0.5, 0.5]) == 5 / 32
     assert chance_of_exactly_1([0.25, 0.5, 0.5, 0.5, 0.5]) == 13 / 64
+
+
+def _recomputed_solerr_discard_vs_error_rate(error_set: DemErrorSet, logical_errors: list[DemCombinedError]):
+    e2f = {}
+    for k_cond in range(len(error_set.errors)):
+        e2f[k_cond] = sum(
+            np.prod([error_set.probs[k] for k in logical_err.src_errors if k_cond != k])
+            for logical_err in logical_errors
+        )
+
+    xs = []
+    ys = []
+    allowed = set()
+    selected = set(range(len(error_set.errors)))
+    for k, _ in sorted(e2f.items(), key=lambda e: (e[1], e[0])):
+        allowed.add(k)
+        selected.remove(k)
+        p0a = chance_of_exactly_0([error_set.probs[k] for k in selected])
+        p0b = chance_of_exactly_0([error_set.probs[k] for k in allowed])
+        p1b = chance_of_exactly_1([error_set.probs[k] for k in allowed])
+        fail_sets = set()
+        for logical_err in logical_errors:
+            for k_cond in logical_err.src_errors:
+                if k_cond in allowed:
+                    fail_sets.add(frozenset(e for e in logical_err.src_errors if e != k_cond))
+                else:
+                    fail_sets.add(frozenset(logical_err.src_errors))
+        xs.append(1 - p0a * (p0b + p1b))
+        ys.append(sum(np.prod([error_set.probs[e] for e in fail_set]) for fail_set in fail_sets))
+    return xs, ys
+
+
+def test_analyze_solerr_discard_vs_error_rate():
+    circuit = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=3,
+        after_clifford_depolarization=0.01,
+        before_measure_flip_probability=0.02,
+    )
+    report = ErrorEnumerationReport.from_dem(circuit.detector_error_model(), max_weight=4, cache=None)
+    xs, ys = analyze_solerr_discard_vs_error_rate(report.error_set, report.logical_errs)
+    xs2, ys2 = _recomputed_solerr_discard_vs_error_rate(report.error_set, report.logical_errs)
+    assert len(xs) == len(report.error_set.errors)
+    np.testing.assert_allclose(xs, xs2, rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose(ys, ys2, rtol=1e-9, atol=1e-15)
+
+    # Certain errors, and logical errors that become empty.
+    error_set = DemErrorSet.from_dem(stim.DetectorErrorModel("""
+        error(1) D0
+        error(0.25) D1
+        error(0.125) D0 D1 L0
+        error(1) D2
+        error(0.5) L0
+    """))
+    logical_errors = [
+        DemCombinedError(src_errors=src_errors, det_mask=0, obs_mask=1, p=0)
+        for src_errors in [(0, 1, 2), (4,), (3, 4)]
+    ]
+    xs, ys = analyze_solerr_discard_vs_error_rate(error_set, logical_errors)
+    xs2, ys2 = _recomputed_solerr_discard_vs_error_rate(error_set, logical_errors)
+    np.testing.assert_allclose(xs, xs2, rtol=1e-9, atol=1e-15)
+    np.testing.assert_allclose(ys, ys2, rtol=1e-9, atol=1e-15)
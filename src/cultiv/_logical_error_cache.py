@@ -0,0 +1,180 @@
+import collections.abc
+import pathlib
+import sqlite3
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+class LogicalErrorCache(collections.abc.MutableMapping):
+    """An SQLite file of enumerated logical errors, keyed by `DemErrorSet.strong_id`.
+
+    Can be passed as the `cache` of `ErrorEnumerationReport.from_dem`. Unlike the text
+    cache read by `ErrorEnumerationReport.read_cache_file`, opening the file reads
+    nothing: an entry's logical errors are only loaded (and kept) when it's looked up,
+    and assigning an entry immediately writes it to the file.
+
+    Each entry is stored as two packed arrays: the size of each logical error and all of
+    their error indices. Several processes can open the same file and add entries at
+    once. When two of them add the same key, the first write is kept (the values are
+    the same anyway, since the key identifies the enumeration).
+
+    Instances can be pickled (e.g. passed to multiprocessing workers); the copy reopens
+    the file.
+    """
+    def __init__(self, path: str | pathlib.Path, *, timeout: float = 600):
+        self.path = pathlib.Path(path)
+        self.timeout = timeout
+        self._connection: sqlite3.Connection | None = None
+        self._loaded: dict[str, list[tuple[int, ...]]] = {}
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                connection.execute('''
+                    CREATE TABLE IF NOT EXISTS logical_errors (
+                        strong_id TEXT PRIMARY KEY,
+                        sizes BLOB NOT NULL,
+                        members BLOB NOT NULL
+                    )
+                ''')
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> 'LogicalErrorCache':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        return {'path': self.path, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], timeout=state['timeout'])
+
+    def __getitem__(self, strong_id: str) -> list[tuple[int, ...]]:
+        result = self._loaded.get(strong_id)
+        if result is None:
+            row = self.connection.execute(
+                'SELECT sizes, members FROM logical_errors WHERE strong_id = ?',
+                (strong_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(strong_id)
+            result = unpack_logical_errors(*row)
+            self._loaded[strong_id] = result
+        return result
+
+    def __contains__(self, strong_id: object) -> bool:
+        if strong_id in self._loaded:
+            return True
+        row = self.connection.execute(
+            'SELECT 1 FROM logical_errors WHERE strong_id = ?',
+            (strong_id,),
+        ).fetchone()
+        return row is not None
+
+    def __setitem__(self, strong_id: str, logical_errors: list[tuple[int, ...]]):
+        self.update_many([(strong_id, logical_errors)])
+
+    def update_many(self, entries: Iterable[tuple[str, list[tuple[int, ...]]]]):
+        """Writes several entries in one transaction. Existing keys are left alone."""
+        entries = list(entries)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO logical_errors (strong_id, sizes, members) VALUES (?, ?, ?)',
+                [(strong_id, *pack_logical_errors(errs)) for strong_id, errs in entries],
+            )
+        for strong_id, errs in entries:
+            self._loaded.pop(strong_id, None)
+
+    def __delitem__(self, strong_id: str):
+        with self.connection:
+            cursor = self.connection.execute('DELETE FROM logical_errors WHERE strong_id = ?', (strong_id,))
+        self._loaded.pop(strong_id, None)
+        if cursor.rowcount == 0:
+            raise KeyError(strong_id)
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self.connection.execute('SELECT strong_id FROM logical_errors ORDER BY strong_id').fetchall()
+        return iter([strong_id for strong_id, in rows])
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM logical_errors').fetchone()[0]
+
+    def __repr__(self) -> str:
+        return f'cultiv.LogicalErrorCache({str(self.path)!r})'
+
+
+def pack_logical_errors(logical_errors: list[tuple[int, ...]]) -> tuple[bytes, bytes]:
+    """Packs logical errors into the (sizes, members) blobs used by `LogicalErrorCache`."""
+    sizes = np.array([len(err) for err in logical_errors], dtype=np.int64)
+    if len(sizes) and sizes.max() > 0xFFFF:
+        raise ValueError(f'A logical error is too large to pack: {sizes.max()} errors.')
+    members = np.fromiter((e for err in logical_errors for e in err), dtype=np.int64, count=int(sizes.sum()))
+    if len(members) and (members.min() < 0 or members.max() > 0xFFFFFFFF):
+        raise ValueError('Logical error members must fit in an unsigned 32 bit integer.')
+    return sizes.astype('<u2').tobytes(), members.astype('<u4').tobytes()
+
+
+def unpack_logical_errors(sizes: bytes, members: bytes) -> list[tuple[int, ...]]:
+    """Inverse of `pack_logical_errors`."""
+    sizes = np.frombuffer(sizes, dtype='<u2').astype(np.int64)
+    members = np.frombuffer(members, dtype='<u4').astype(np.int64)
+    if len(sizes) == 0:
+        return []
+
+    # Enumerations list errors sorted by size, so each run of equal sizes can be
+    # reshaped into a table instead of being split one error at a time.
+    result = []
+    run_starts = np.flatnonzero(np.diff(sizes, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(sizes))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    for start, end in zip(run_starts, run_ends):
+        size = int(sizes[start])
+        table = members[offsets[start]:offsets[end]].reshape(end - start, size)
+        result.extend(map(tuple, table.tolist()))
+    return result
+
+
+def iter_text_cache_entries(path: str | pathlib.Path) -> Iterator[tuple[str, list[tuple[int, ...]]]]:
+    """Yields the (strong_id, logical errors) entries of an `ENTRY` text cache file.
+
+    The file is read one line at a time, so entries can be migrated out of large files.
+    """
+    strong_id = None
+    errs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('ENTRY '):
+                if strong_id is not None:
+                    yield strong_id, errs
+                strong_id = line[len('ENTRY '):].strip()
+                errs = []
+            elif line:
+                errs.append(tuple(int(e) for e in line.split(',')))
+    if strong_id is not None:
+        yield strong_id, errs
+
+
+def is_text_cache_file(path: str | pathlib.Path) -> bool:
+    """Determines if a cache file uses the `ENTRY` text format instead of SQLite.
+
+    Existing files are recognized by their header. New files are text files if they
+    have a '.txt' suffix.
+    """
+    path = pathlib.Path(path)
+    if path.exists() and path.stat().st_size > 0:
+        with open(path, 'rb') as f:
+            return f.read(16) != b'SQLite format 3\x00'
+    return path.suffix == '.txt'
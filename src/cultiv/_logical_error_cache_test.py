@@ -0,0 +1,104 @@
+import multiprocessing
+import pathlib
+import pickle
+
+import stim
+
+from ._error_enumeration_report import ErrorEnumerationReport
+from ._logical_error_cache import (
+    LogicalErrorCache,
+    is_text_cache_file,
+    iter_text_cache_entries,
+    pack_logical_errors,
+    unpack_logical_errors,
+)
+
+
+def test_pack_logical_errors():
+    for errs in [[], [()], [(5,)], [(1, 2), (3, 4), (0, 1, 2)], [(1, 2, 3), (4,), (5, 6, 7), (2**32 - 1, 0)]]:
+        assert unpack_logical_errors(*pack_logical_errors(errs)) == errs
+
+
+def test_logical_error_cache(tmp_path: pathlib.Path):
+    path = tmp_path / 'cache.db'
+    with LogicalErrorCache(path) as cache:
+        assert len(cache) == 0
+        assert 'a' not in cache
+        cache['a'] = [(1, 2), (3, 4, 5)]
+        cache['b'] = []
+        assert cache['a'] == [(1, 2), (3, 4, 5)]
+        cache['a'] = [(6,)]
+        assert cache['a'] == [(1, 2), (3, 4, 5)]
+
+    cache = LogicalErrorCache(path)
+    assert sorted(cache) == ['a', 'b']
+    assert 'a' in cache
+    assert cache['b'] == []
+    copy = pickle.loads(pickle.dumps(cache))
+    del cache['b']
+    assert 'b' not in copy
+    assert dict(copy) == {'a': [(1, 2), (3, 4, 5)]}
+    assert not is_text_cache_file(path)
+    assert not is_text_cache_file(tmp_path / 'new.db')
+    assert is_text_cache_file(tmp_path / 'new.txt')
+
+
+def test_text_cache_entries(tmp_path: pathlib.Path):
+    path = tmp_path / 'cache.txt'
+    path.write_text('ENTRY abc\n    1,2\n    3,4,5\nENTRY def\nENTRY ghi\n    7\n')
+    assert list(iter_text_cache_entries(path)) == [
+        ('abc', [(1, 2), (3, 4, 5)]),
+        ('def', []),
+        ('ghi', [(7,)]),
+    ]
+    assert ErrorEnumerationReport.read_cache_file(path) == {
+        'abc': [(1, 2), (3, 4, 5)],
+        'def': [],
+        'ghi': [(7,)],
+    }
+    assert is_text_cache_file(path)
+    assert ErrorEnumerationReport.open_cache_file(path) == ErrorEnumerationReport.read_cache_file(path)
+
+
+def _add_entries(path: pathlib.Path, worker: int):
+    cache = LogicalErrorCache(path)
+    for k in range(20):
+        cache[f'{k}'] = [(k, worker)] * (k + 1)
+        cache[f'w{worker}_{k}'] = [(worker, k)]
+
+
+def test_logical_error_cache_concurrent_writes(tmp_path: pathlib.Path):
+    path = tmp_path / 'cache.db'
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=_add_entries, args=(path, worker)) for worker in range(3)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0
+
+    cache = LogicalErrorCache(path)
+    assert len(cache) == 20 + 3 * 20
+    for k in range(20):
+        errs = cache[f'{k}']
+        assert len(errs) == k + 1 and errs[0][0] == k
+        for worker in range(3):
+            assert cache[f'w{worker}_{k}'] == [(worker, k)]
+
+
+def test_report_uses_logical_error_cache(tmp_path: pathlib.Path):
+    dem = stim.Circuit.generated(
+        'repetition_code:memory',
+        distance=3,
+        rounds=3,
+        after_clifford_depolarization=0.01,
+    ).detector_error_model()
+    path = tmp_path / 'cache.db'
+    expected = ErrorEnumerationReport.from_dem(dem, max_weight=4, cache=None)
+    report = ErrorEnumerationReport.from_dem(dem, max_weight=4, cache=ErrorEnumerationReport.open_cache_file(path))
+    assert report.logical_errs == expected.logical_errs
+
+    cache = LogicalErrorCache(path)
+    key = expected.error_set.strong_id(max_weight=4)
+    assert list(cache) == [key]
+    assert LogicalErrorCache(path)[key] == expected.error_set.find_logical_errors(max_distance=4)
@@ -5,6 +5,7 @@ import dataclasses
 import math
 from typing import Callable
 
+import numpy as np
 import sinter
 import stim
 
@@ -20,6 +21,52 @@ class GapArg:
     at_most: sinter.AnonTaskStats
 
 
+@dataclasses.dataclass(frozen=True)
+class GapHistogram:
+    """The `C{gap}`/`E{gap}` custom counts of a stat, binned by rounded gap.
+
+    `gaps` is sorted and distinct. `shots[k]` counts the kept shots with gap
+    `gaps[k]`, and `errors[k]` counts how many of those shots were logical errors.
+    """
+    gaps: np.ndarray
+    shots: np.ndarray
+    errors: np.ndarray
+
+    @staticmethod
+    def from_custom_counts(custom_counts: dict[str, int], *, rounding: int) -> 'GapHistogram':
+        keys = list(custom_counts.keys())
+        for key in keys:
+            if not key.startswith('C') and not key.startswith('E'):
+                raise NotImplementedError(f'{key=}')
+        hits = np.array([custom_counts[key] for key in keys], dtype=np.int64)
+        is_error = np.array([key.startswith('E') for key in keys], dtype=np.bool_)
+        raw_gaps = np.array([key[1:] for key in keys]).astype(np.int64)
+
+        # Round to the nearest multiple (ties to even, like `round`), except for the
+        # largest gap which is kept exactly.
+        max_gap = raw_gaps.max()
+        gaps = np.minimum(max_gap, np.round(raw_gaps / rounding).astype(np.int64) * rounding)
+        gaps[raw_gaps == max_gap] = max_gap
+        assert np.all(gaps >= 0)
+
+        gaps, bins = np.unique(gaps, return_inverse=True)
+        shots = np.zeros(len(gaps), dtype=np.int64)
+        errors = np.zeros(len(gaps), dtype=np.int64)
+        np.add.at(shots, bins, hits)
+        np.add.at(errors, bins[is_error], hits[is_error])
+        return GapHistogram(gaps=gaps, shots=shots, errors=errors)
+
+    @property
+    def shots_below(self) -> np.ndarray:
+        """`shots_below[k]` counts the shots with a gap less than `gaps[k]`."""
+        return np.cumsum(self.shots) - self.shots
+
+    @property
+    def errors_below(self) -> np.ndarray:
+        """`errors_below[k]` counts the errors with a gap less than `gaps[k]`."""
+        return np.cumsum(self.errors) - self.errors
+
+
 def compute_expected_injection_growth_volume(
         circuit: stim.Circuit,
         *,
@@ -96,32 +143,29 @@ def stat_to_gap_stats(
 
 
 def split_by_gap_threshold(stats: list[sinter.TaskStats], *, gap_rounding: int, keep_zero: bool = False) -> list[sinter.TaskStats]:
-    stats = stat_to_gap_stats(
-        stats,
-        rounding=gap_rounding,
-        func=lambda arg: sinter.AnonTaskStats(
-            shots=arg.source.shots,
-            discards=arg.at_least.discards + arg.less.shots,
-            errors=arg.at_least.errors,
-        ),
-    )
-    return [
-        stat
-        for stat in stats
-        if keep_zero or stat.json_metadata.get('gap', 1) > 0
-    ]
+    """For each gap, the stat that results from discarding shots with a smaller gap."""
+    result = []
+    for stat in stats:
+        if not stat.custom_counts:
+            result.append(stat)
+            continue
+        hist = GapHistogram.from_custom_counts(stat.custom_counts, rounding=gap_rounding)
+        for gap, less_shots, less_errors in zip(
+                hist.gaps.tolist(),
+                hist.shots_below.tolist(),
+                hist.errors_below.tolist()):
+            if keep_zero or gap > 0:
+                result.append(_gap_task_stat(
+                    stat,
+                    gap=gap,
+                    shots=stat.shots,
+                    errors=stat.errors - less_errors,
+                    discards=less_shots,
+                ))
+    return result
 
 
 def split_into_gap_distribution(stats: list[sinter.TaskStats], *, gap_rounding: int) -> list[sinter.TaskStats]:
-    stats = stat_to_gap_stats(
-        stats,
-        rounding=gap_rounding,
-        func=lambda arg: sinter.AnonTaskStats(
-            shots=arg.cur.shots,
-            discards=arg.cur.discards,
-            errors=arg.cur.errors,
-        ),
-    )
     return [
         stat.with_edits(
             errors=stat.errors if e else stat.shots - stat.errors,
@@ -133,25 +177,22 @@ def split_into_gap_distribution(stats: list[sinter.TaskStats], *, gap_rounding:
                 'gap': stat.json_metadata['gap'] * (-1 if e else +1),
             }
         )
-        for stat in stats
+        for stat in split_by_gap(stats, gap_rounding=gap_rounding)
         for e in [False, True]
     ]
 
 
 def split_by_gap(stats: list[sinter.TaskStats], *, gap_rounding: int) -> list[sinter.TaskStats]:
-    stats = stat_to_gap_stats(
-        stats,
-        rounding=gap_rounding,
-        func=lambda arg: sinter.AnonTaskStats(
-            shots=arg.cur.shots,
-            discards=arg.cur.discards,
-            errors=arg.cur.errors,
-        ),
-    )
-    return [
-        stat
-        for stat in stats
-    ]
+    """For each gap, the stat made up of only the shots with that gap."""
+    result = []
+    for stat in stats:
+        if not stat.custom_counts:
+            result.append(stat)
+            continue
+        hist = GapHistogram.from_custom_counts(stat.custom_counts, rounding=gap_rounding)
+        for gap, shots, errors in zip(hist.gaps.tolist(), hist.shots.tolist(), hist.errors.tolist()):
+            result.append(_gap_task_stat(stat, gap=gap, shots=shots, errors=errors, discards=0))
+    return result
 
 
 def split_by_custom_count(
@@ -182,6 +223,34 @@ def sub_anon(a: sinter.AnonTaskStats, b: sinter.AnonTaskStats) -> sinter.AnonTas
     )
 
 
+def _gap_task_stat(
+        stat: sinter.TaskStats,
+        *,
+        gap: int,
+        shots: int,
+        errors: int,
+        discards: int,
+        seconds: float = 0,
+        custom_counts: collections.Counter | None = None,
+) -> sinter.TaskStats:
+    return sinter.TaskStats(
+        strong_id=stat.strong_id + f':gap{gap}',
+        decoder=stat.decoder,
+        json_metadata={
+            **stat.json_metadata,
+            'gap': gap,
+            'src_errors': stat.errors,
+            'src_discards': stat.discards,
+            'src_shots': stat.shots,
+        },
+        shots=shots,
+        errors=errors,
+        discards=discards + stat.discards,
+        seconds=seconds,
+        custom_counts=collections.Counter() if custom_counts is None else custom_counts,
+    )
+
+
 def _stat_to_gap_stats_single(
         stat: sinter.TaskStats,
         rounding: int,
@@ -189,47 +258,47 @@ def _stat_to_gap_stats_single(
 ) -> list[sinter.TaskStats]:
     if not stat.custom_counts:
         return [stat]
-    global_discards = stat.discards
-    anon_stat = stat.to_anon_stats()
-    anon_stat = sinter.AnonTaskStats(shots=anon_stat.shots, errors=anon_stat.errors, discards=0, seconds=anon_stat.seconds, custom_counts=anon_stat.custom_counts)
-    gap_stats = collections.defaultdict(sinter.AnonTaskStats)
-    max_gap = max(int(k[1:]) for k in anon_stat.custom_counts.keys() if k.startswith('C') or k.startswith('E'))
-    for cor_gap, hits in anon_stat.custom_counts.items():
-        if cor_gap.startswith('C'):
-            is_error = False
-        elif cor_gap.startswith('E'):
-            is_error = True
-        else:
-            raise NotImplementedError(f'{cor_gap=}')
-        gap = int(cor_gap[1:])
-        gap = max_gap if gap == max_gap else min(max_gap, round(gap / rounding) * rounding)
-        assert gap >= 0
-        gap_stats[gap] += sinter.AnonTaskStats(shots=hits, errors=hits * is_error)
-    if not gap_stats:
-        gap_stats[0] = anon_stat
+    hist = GapHistogram.from_custom_counts(stat.custom_counts, rounding=rounding)
+
+    # Every `more` and `at_least` covers all of the (kept) custom counts, so they
+    # share one counter instead of rebuilding it at each gap.
+    all_counts = collections.Counter(stat.custom_counts) + collections.Counter()
 
     result = []
-    less = sinter.AnonTaskStats()
-    more = anon_stat
-    more += sinter.AnonTaskStats(discards=-more.discards)
-    for gap in sorted(gap_stats.keys()):
-        gap_stat = gap_stats[gap]
-        more = sub_anon(more, gap_stat)
-        choice = func(GapArg(source=stat, gap=gap, cur=gap_stat, less=less, more=more, at_least=gap_stat + more, at_most=gap_stat + less))
-        less += gap_stat
-        result.append(sinter.TaskStats(
-            strong_id=stat.strong_id + f':gap{gap}',
-            decoder=stat.decoder,
-            json_metadata={
-                **stat.json_metadata,
-                'gap': gap,
-                'src_errors': stat.errors,
-                'src_discards': stat.discards,
-                'src_shots': stat.shots,
-            },
+    for gap, shots, errors, less_shots, less_errors in zip(
+            hist.gaps.tolist(),
+            hist.shots.tolist(),
+            hist.errors.tolist(),
+            hist.shots_below.tolist(),
+            hist.errors_below.tolist()):
+        cur = sinter.AnonTaskStats(shots=shots, errors=errors)
+        less = sinter.AnonTaskStats(shots=less_shots, errors=less_errors)
+        more = sinter.AnonTaskStats(
+            shots=stat.shots - less_shots - shots,
+            errors=stat.errors - less_errors - errors,
+            seconds=stat.seconds,
+            custom_counts=all_counts,
+        )
+        choice = func(GapArg(
+            source=stat,
+            gap=gap,
+            cur=cur,
+            less=less,
+            more=more,
+            at_least=sinter.AnonTaskStats(
+                shots=stat.shots - less_shots,
+                errors=stat.errors - less_errors,
+                seconds=stat.seconds,
+                custom_counts=all_counts,
+            ),
+            at_most=sinter.AnonTaskStats(shots=less_shots + shots, errors=less_errors + errors),
+        ))
+        result.append(_gap_task_stat(
+            stat,
+            gap=gap,
             shots=choice.shots,
             errors=choice.errors,
-            discards=choice.discards + global_discards,
+            discards=choice.discards,
             seconds=choice.seconds,
             custom_counts=choice.custom_counts,
         ))
@@ -247,15 +316,17 @@ def preprocess_intercepted_simulation_stats(stats: list[sinter.TaskStats]) -> li
     for stat in stats:
         if 'intercept' not in stat.decoder:
             continue
-        if stat.decoder == 'twirl_intercept_t' or stat.decoder == 'vec_intercept_t':
+        # The fault free shortcut samples the same distribution, so it's plotted as the same simulator.
+        decoder = stat.decoder.removesuffix('_shortcut')
+        if decoder == 'twirl_intercept_t' or decoder == 'vec_intercept_t':
             continue
         result.append(stat.with_edits(
             json_metadata={
                 **stat.json_metadata,
-                'b': stat.decoder[-1].upper(),
-                'sim': 'Vector' if 'vec' in stat.decoder else 'Stabilizer',
+                'b': decoder[-1].upper(),
+                'sim': 'Vector' if 'vec' in decoder else 'Stabilizer',
             },
-            decoder=stat.decoder[:-2].replace('vec_intercept', 'Vector Sim').replace('twirl_intercept', 'Stabilizer Sim'),
+            decoder=decoder[:-2].replace('vec_intercept', 'Vector Sim').replace('twirl_intercept', 'Stabilizer Sim'),
         ))
 
     # Add synthetic S+Z data point
@@ -1,6 +1,20 @@
+import collections
+import random
+
+import pytest
+import sinter
+
 import gen
 import cultiv
-from ._stats_util import compute_expected_injection_growth_volume
+from ._stats_util import (
+    GapHistogram,
+    compute_expected_injection_growth_volume,
+    split_by_gap,
+    split_by_gap_threshold,
+    split_into_gap_distribution,
+    stat_to_gap_stats,
+    sub_anon,
+)
 
 
 def test_compute_expected_injection_growth_volume():
@@ -13,3 +27,117 @@ def test_compute_expected_injection_growth_volume():
     circuit = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
     v = compute_expected_injection_growth_volume(circuit)
     assert 1550 <= v <= 1650
+
+
+def _looped_gap_counts(stat: sinter.TaskStats, rounding: int) -> dict[int, tuple[int, int]]:
+    max_gap = max(int(k[1:]) for k in stat.custom_counts)
+    result = collections.defaultdict(lambda: (0, 0))
+    for key, hits in stat.custom_counts.items():
+        gap = int(key[1:])
+        gap = max_gap if gap == max_gap else min(max_gap, round(gap / rounding) * rounding)
+        shots, errors = result[gap]
+        result[gap] = (shots + hits, errors + hits * key.startswith('E'))
+    return dict(sorted(result.items()))
+
+
+def _random_gap_stat(seed: int, *, with_discards: bool = True) -> sinter.TaskStats:
+    rng = random.Random(seed)
+    counts = collections.Counter()
+    for _ in range(rng.randrange(1, 200)):
+        counts[f'{rng.choice("CE")}{rng.randrange(0, 300)}'] += rng.randrange(1, 1000)
+    kept = sum(counts.values())
+    errors = sum(v for k, v in counts.items() if k.startswith('E'))
+    discards = rng.randrange(0, 1000) if with_discards else 0
+    return sinter.TaskStats(
+        strong_id=f'stat{seed}',
+        decoder='pymatching-gap',
+        json_metadata={'seed': seed},
+        shots=kept + discards,
+        errors=errors,
+        discards=discards,
+        seconds=2.5,
+        custom_counts=counts,
+    )
+
+
+def test_gap_histogram():
+    hist = GapHistogram.from_custom_counts({'C0': 5, 'E2': 1, 'C3': 2, 'E7': 3, 'C8': 4, 'C12': 6, 'E11': 1}, rounding=5)
+    assert hist.gaps.tolist() == [0, 5, 10, 12]
+    assert hist.shots.tolist() == [6, 5, 5, 6]
+    assert hist.errors.tolist() == [1, 3, 1, 0]
+    assert hist.shots_below.tolist() == [0, 6, 11, 16]
+    assert hist.errors_below.tolist() == [0, 1, 4, 5]
+
+    with pytest.raises(NotImplementedError):
+        GapHistogram.from_custom_counts({'C0': 5, 'X2': 1}, rounding=1)
+
+    for seed in range(20):
+        stat = _random_gap_stat(seed)
+        for rounding in [1, 5, 7]:
+            expected = _looped_gap_counts(stat, rounding)
+            hist = GapHistogram.from_custom_counts(stat.custom_counts, rounding=rounding)
+            assert dict(zip(hist.gaps.tolist(), zip(hist.shots.tolist(), hist.errors.tolist()))) == expected
+
+
+def test_split_by_gap_threshold():
+    stats = [_random_gap_stat(seed) for seed in range(10)]
+    no_counts = stats[0].with_edits(strong_id='plain', custom_counts=collections.Counter())
+    results = split_by_gap_threshold(stats + [no_counts], gap_rounding=5, keep_zero=True)
+    assert results[-1] is no_counts
+    assert len(split_by_gap_threshold(stats, gap_rounding=5)) == len(results) - 1 - sum(
+        0 in _looped_gap_counts(stat, 5) for stat in stats
+    )
+
+    k = 0
+    for stat in stats:
+        less_shots = less_errors = 0
+        for gap, (shots, errors) in _looped_gap_counts(stat, 5).items():
+            r = results[k]
+            k += 1
+            assert r.strong_id == f'{stat.strong_id}:gap{gap}'
+            assert r.json_metadata == {'seed': stat.json_metadata['seed'], 'gap': gap, 'src_errors': stat.errors, 'src_discards': stat.discards, 'src_shots': stat.shots}
+            assert (r.shots, r.errors, r.discards) == (stat.shots, stat.errors - less_errors, stat.discards + less_shots)
+            less_shots += shots
+            less_errors += errors
+
+    generic = stat_to_gap_stats(stats, rounding=5, func=lambda arg: sinter.AnonTaskStats(
+        shots=arg.source.shots,
+        discards=arg.at_least.discards + arg.less.shots,
+        errors=arg.at_least.errors,
+    ))
+    assert generic == results[:-1]
+
+
+def test_split_by_gap():
+    stats = [_random_gap_stat(seed, with_discards=False) for seed in range(10)]
+    results = split_by_gap(stats, gap_rounding=5)
+    distribution = split_into_gap_distribution(stats, gap_rounding=5)
+    assert len(distribution) == 2 * len(results)
+    k = 0
+    for stat in stats:
+        for gap, (shots, errors) in _looped_gap_counts(stat, 5).items():
+            r = results[k]
+            assert r.strong_id == f'{stat.strong_id}:gap{gap}'
+            assert (r.shots, r.errors, r.discards) == (shots, errors, stat.discards)
+            assert (distribution[2 * k].json_metadata['gap'], distribution[2 * k].errors) == (gap, shots - errors)
+            assert (distribution[2 * k + 1].json_metadata['gap'], distribution[2 * k + 1].errors) == (-gap, errors)
+            k += 1
+
+
+def test_stat_to_gap_stats():
+    stat = _random_gap_stat(5, with_discards=False)
+    args = []
+    stat_to_gap_stats([stat], rounding=5, func=lambda arg: args.append(arg) or arg.cur)
+    less = sinter.AnonTaskStats()
+    more = sinter.AnonTaskStats(shots=stat.shots, errors=stat.errors, seconds=stat.seconds, custom_counts=stat.custom_counts)
+    for arg, (gap, (shots, errors)) in zip(args, _looped_gap_counts(stat, 5).items(), strict=True):
+        cur = sinter.AnonTaskStats(shots=shots, errors=errors)
+        more = sub_anon(more, cur)
+        assert arg.source is stat
+        assert arg.gap == gap
+        assert arg.cur == cur
+        assert arg.less == less
+        assert arg.more == more
+        assert arg.at_least == cur + more
+        assert arg.at_most == cur + less
+        less += cur
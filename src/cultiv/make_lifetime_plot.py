@@ -1,7 +1,15 @@
 import argparse
 import collections
+import dataclasses
+import hashlib
+import json
 import math
+import multiprocessing
+import os
 import pathlib
+import sys
+import time
+from typing import Any, Callable
 
 import numpy as np
 import stim
@@ -9,81 +17,353 @@ from matplotlib import pyplot as plt
 
 import gen
 import cultiv
+from cultiv._decoding._staged_detector_sampler import circuit_to_layers
 
 
-def circuit_to_layers(circuit: stim.Circuit) -> list[stim.Circuit]:
-    cur_layer = stim.Circuit()
-    prev_layers = []
-    saw_two_qubit_gate = False
-    saw_measurement = False
-    for inst in circuit.flattened():
-        data = stim.GateData(inst.name)
-        if inst.name == 'QUBIT_COORDS':
-            continue
-        elif data.is_two_qubit_gate:
-            if saw_measurement:
-                saw_measurement = False
-                prev_layers.append(cur_layer)
-                cur_layer = stim.Circuit()
-            saw_two_qubit_gate = True
-            cur_layer.append(inst)
-        elif data.produces_measurements:
-            cur_layer.append(inst)
-            saw_measurement = True
-        elif data.is_reset or data.produces_measurements:
-            if saw_two_qubit_gate:
-                saw_two_qubit_gate = False
-                saw_measurement = False
-                prev_layers.append(cur_layer)
-                cur_layer = stim.Circuit()
-            cur_layer.append(inst)
-        else:
-            cur_layer.append(inst)
-    if len(cur_layer):
-        prev_layers.append(cur_layer)
-    return prev_layers
-
-
-def sample_times(circuit: stim.Circuit, shots: int) -> tuple[collections.Counter, list[int]]:
-    sim = stim.FlipSimulator(batch_size=1024, num_qubits=circuit.num_qubits)
-    layers = circuit_to_layers(circuit)
-
-    qubit_counts = []
-    used_qubits = set()
-    for layer in layers:
-        for inst in layer:
-            if inst.name in ['R', 'RX']:
-                for t in inst.targets_copy():
-                    used_qubits.add(t.qubit_value)
-        qubit_counts.append(len(used_qubits))
-    survivors = np.zeros(1024, dtype=np.bool_)
-    postselected_detectors = set()
-    for det, coord in circuit.get_detector_coordinates().items():
-        if len(coord) == 3 or coord[-1] == -9 or coord[4] == 0 or coord[4] == 4:
-            postselected_detectors.add(det)
-    counts = collections.Counter()
-
-    shots_left = shots
-    while shots_left > 0:
-        sim.clear()
-        cur_det = 0
-        tick = 0
-        survivors[:] = True
+@dataclasses.dataclass(frozen=True)
+class SurvivalSampler:
+    """Samples how many shots are still alive (not postselected away) after each layer.
+
+    Attributes:
+        layers: The circuit split by `circuit_to_layers`.
+        layer_postselected_detectors: For each layer, the indices of the postselected
+            detectors that the layer declares.
+        qubit_counts: For each layer, how many qubits have been reset so far.
+        num_qubits: The number of qubits used by the circuit.
+    """
+    layers: tuple[stim.Circuit, ...]
+    layer_postselected_detectors: tuple[np.ndarray, ...]
+    qubit_counts: tuple[int, ...]
+    num_qubits: int
+
+    @staticmethod
+    def from_circuit(circuit: stim.Circuit) -> 'SurvivalSampler':
+        layers = circuit_to_layers(circuit)
+
+        qubit_counts = []
+        used_qubits = set()
         for layer in layers:
-            tick += 1
-            sim.do(layer)
-            if cur_det < sim.num_detectors:
-                while cur_det < sim.num_detectors:
-                    if cur_det in postselected_detectors:
-                        fired = sim.get_detector_flips(detector_index=cur_det)
-                        survivors &= ~fired
-                    cur_det += 1
-            counts[tick] += np.count_nonzero(survivors)
+            for inst in layer:
+                if inst.name in ['R', 'RX']:
+                    for t in inst.targets_copy():
+                        used_qubits.add(t.qubit_value)
+            qubit_counts.append(len(used_qubits))
+
+        is_postselected = np.zeros(circuit.num_detectors, dtype=np.bool_)
+        for det, coord in circuit.get_detector_coordinates().items():
+            if len(coord) == 3 or coord[-1] == -9 or coord[4] == 0 or coord[4] == 4:
+                is_postselected[det] = True
+        det_ends = np.cumsum([layer.num_detectors for layer in layers], dtype=np.int64)
+        det_starts = det_ends - [layer.num_detectors for layer in layers]
+        layer_postselected_detectors = tuple(
+            np.flatnonzero(is_postselected[a:b]) + a
+            for a, b in zip(det_starts.tolist(), det_ends.tolist())
+        )
+
+        return SurvivalSampler(
+            layers=tuple(layers),
+            layer_postselected_detectors=layer_postselected_detectors,
+            qubit_counts=tuple(qubit_counts),
+            num_qubits=circuit.num_qubits,
+        )
+
+    def sample_batch(self, sim: stim.FlipSimulator, shots: int) -> np.ndarray:
+        """Runs one batch of the simulator, and counts the survivors after each layer.
+
+        Args:
+            sim: The simulator to run. Its state is cleared before running.
+            shots: How many of the simulator's instances to count. At most
+                `sim.batch_size`.
+
+        Returns:
+            An int64 array `a` where `a[0]` is `shots` and `a[k]` is how many of the
+            shots are alive after the k'th layer.
+        """
+        assert 0 <= shots <= sim.batch_size
+        result = np.full(len(self.layers) + 1, shots, dtype=np.int64)
+        survivors = np.packbits(np.arange(sim.batch_size) < shots, bitorder='little')
+        sim.clear()
+        for tick in range(1, self.num_simulated_layers + 1):
+            sim.do(self.layers[tick - 1])
+            dets = self.layer_postselected_detectors[tick - 1]
+            if len(dets):
+                flips = sim.get_detector_flips(bit_packed=True)
+                survivors &= ~np.bitwise_or.reduce(flips[dets], axis=0)
+            # Survivor counts only change when there are more postselected
+            # detectors, and can't recover once every shot is dead.
+            result[tick:] = np.count_nonzero(np.unpackbits(survivors, bitorder='little'))
+            if not result[tick]:
+                break
+        return result
+
+    @property
+    def num_simulated_layers(self) -> int:
+        """The number of layers up to and including the last postselected detector."""
+        for k in range(len(self.layers), 0, -1):
+            if len(self.layer_postselected_detectors[k - 1]):
+                return k
+        return 0
+
+    def sample(
+            self,
+            shots: int,
+            *,
+            batch_size: int = 1024,
+            seed: int | None = None,
+    ) -> collections.Counter:
+        """Counts survivors after each layer (tick) over many shots.
+
+        Returns:
+            A counter mapping each tick to how many shots were alive after it. Tick 0
+            is the number of shots.
+        """
+        sim = stim.FlipSimulator(batch_size=batch_size, num_qubits=self.num_qubits, seed=seed)
+        totals = np.zeros(len(self.layers) + 1, dtype=np.int64)
+        shots_left = shots
+        while shots_left > 0:
+            batch_shots = min(batch_size, shots_left)
+            totals += self.sample_batch(sim, batch_shots)
+            shots_left -= batch_shots
+        return collections.Counter(dict(enumerate(totals.tolist())))
+
+
+@dataclasses.dataclass(frozen=True)
+class SurvivalShard:
+    """The survivor counts from one shard of the shots sampled by `sample_times`.
+
+    Attributes:
+        index: Which shard this is. Shard k is sampled with a seed derived from the
+            run's seed and k, so the shard's results don't depend on which worker
+            sampled it or how many workers there were.
+        shots: The number of shots in the shard.
+        survivors: How many of the shots were alive after each tick (tick 0 is
+            `shots`).
+        seconds: How long the shard took to sample.
+        worker: The process id of the worker that sampled the shard.
+    """
+    index: int
+    shots: int
+    survivors: tuple[int, ...]
+    seconds: float
+    worker: int
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            'shots': self.shots,
+            'survivors': list(self.survivors),
+            'seconds': self.seconds,
+            'worker': self.worker,
+        }
+
+    @staticmethod
+    def from_json(index: int, data: dict[str, Any]) -> 'SurvivalShard':
+        return SurvivalShard(
+            index=index,
+            shots=data['shots'],
+            survivors=tuple(data['survivors']),
+            seconds=data['seconds'],
+            worker=data['worker'],
+        )
+
+
+def _shard_seed(seed: int, index: int) -> int:
+    seq = np.random.SeedSequence(seed, spawn_key=(index,))
+    return int(seq.generate_state(1, dtype=np.uint64)[0])
+
 
-        counts[0] += 1024
-        shots_left -= 1024
+def _sample_shard(sampler: SurvivalSampler, task: tuple[int, int, int, int]) -> SurvivalShard:
+    index, shots, batch_size, seed = task
+    t0 = time.monotonic()
+    counts = sampler.sample(shots, batch_size=batch_size, seed=_shard_seed(seed, index))
+    return SurvivalShard(
+        index=index,
+        shots=shots,
+        survivors=tuple(counts[tick] for tick in range(len(sampler.layers) + 1)),
+        seconds=time.monotonic() - t0,
+        worker=os.getpid(),
+    )
 
-    return counts, qubit_counts
+
+_worker_sampler: SurvivalSampler | None = None
+
+
+def _init_survival_worker(circuit: stim.Circuit) -> None:
+    global _worker_sampler
+    _worker_sampler = SurvivalSampler.from_circuit(circuit)
+
+
+def _run_survival_task(task: tuple[int, int, int, int]) -> SurvivalShard:
+    return _sample_shard(_worker_sampler, task)
+
+
+def _read_checkpoint(
+        path: pathlib.Path,
+        *,
+        circuit_hash: str,
+        seed: int | None,
+        shots_per_shard: int,
+        batch_size: int,
+) -> tuple[int | None, dict[int, SurvivalShard]]:
+    if not path.exists():
+        return seed, {}
+    with open(path) as f:
+        data = json.load(f)
+    if data['circuit'] != circuit_hash:
+        raise ValueError(f"The checkpoint {path} is for a different circuit.")
+    if seed is not None and data['seed'] != seed:
+        raise ValueError(f"The checkpoint {path} used seed={data['seed']}, not {seed=}.")
+    if data['shots_per_shard'] != shots_per_shard:
+        raise ValueError(f"The checkpoint {path} used shots_per_shard={data['shots_per_shard']}, not {shots_per_shard=}.")
+    # The batch size changes how the simulator consumes its random stream, so it changes the samples.
+    if data.get('batch_size') != batch_size:
+        raise ValueError(f"The checkpoint {path} used batch_size={data.get('batch_size')}, not {batch_size=}.")
+    shards = {
+        int(k): SurvivalShard.from_json(int(k), v)
+        for k, v in data['shards'].items()
+    }
+    return data['seed'], shards
+
+
+def _write_checkpoint(
+        path: pathlib.Path,
+        *,
+        circuit_hash: str,
+        seed: int,
+        shots_per_shard: int,
+        batch_size: int,
+        shards: dict[int, SurvivalShard],
+) -> None:
+    data = {
+        'circuit': circuit_hash,
+        'seed': seed,
+        'shots_per_shard': shots_per_shard,
+        'batch_size': batch_size,
+        'shards': {str(k): shard.to_json() for k, shard in sorted(shards.items())},
+    }
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def sample_times(
+        circuit: stim.Circuit,
+        shots: int,
+        *,
+        batch_size: int = 1024,
+        seed: int | None = None,
+        workers: int = 1,
+        shots_per_shard: int = 2**20,
+        checkpoint_path: str | pathlib.Path | None = None,
+        progress: Callable[[SurvivalShard, int, int], None] | None = None,
+) -> tuple[collections.Counter, list[int]]:
+    """Counts how many shots survive postselection after each layer of a circuit.
+
+    Args:
+        circuit: The noisy circuit to sample.
+        shots: The number of shots to sample.
+        batch_size: The batch size of the flip simulators.
+        seed: Determines the results. The shots are split into shards of
+            `shots_per_shard` shots, and each shard gets an independent seed derived
+            from this one. Defaults to a random seed.
+        workers: The number of processes to sample shards with.
+        shots_per_shard: How many shots each shard has (except maybe the last).
+        checkpoint_path: A json file to record finished shards in. If it already
+            exists, its shards are reused instead of being sampled again. It must
+            have been made with the same circuit, seed, shots_per_shard, and
+            batch_size. Shards it has that aren't needed for this many shots are
+            kept in the file, so that sampling fewer shots doesn't lose them.
+        progress: Called with (shard, shards_done, num_shards) after each shard is
+            sampled.
+
+    Returns:
+        A (counts, qubit_counts) tuple. `counts[t]` is the number of shots alive
+        after tick t (with `counts[0] == shots`) and `qubit_counts[t]` is how many
+        qubits have been used by the end of the t'th layer.
+    """
+    if workers < 1:
+        raise ValueError(f'{workers=} < 1')
+    sampler = SurvivalSampler.from_circuit(circuit)
+    circuit_hash = hashlib.sha256(str(circuit).encode()).hexdigest()
+
+    stored = {}
+    if checkpoint_path is not None:
+        checkpoint_path = pathlib.Path(checkpoint_path)
+        seed, stored = _read_checkpoint(
+            checkpoint_path,
+            circuit_hash=circuit_hash,
+            seed=seed,
+            shots_per_shard=shots_per_shard,
+            batch_size=batch_size,
+        )
+    if seed is None:
+        seed = int(np.random.SeedSequence().generate_state(1, dtype=np.uint64)[0])
+
+    num_shards = (shots + shots_per_shard - 1) // shots_per_shard
+    shard_shots = [min(shots_per_shard, shots - k * shots_per_shard) for k in range(num_shards)]
+    shards = {
+        k: shard
+        for k, shard in stored.items()
+        if k < num_shards and shard.shots == shard_shots[k]
+    }
+    tasks = [
+        (k, shard_shots[k], batch_size, seed)
+        for k in range(num_shards)
+        if k not in shards
+    ]
+
+    def finish(shard: SurvivalShard) -> None:
+        shards[shard.index] = shard
+        if checkpoint_path is not None:
+            # A stored shard is only replaced by a shard with at least as many shots.
+            if shard.index not in stored or stored[shard.index].shots <= shard.shots:
+                stored[shard.index] = shard
+            _write_checkpoint(
+                checkpoint_path,
+                circuit_hash=circuit_hash,
+                seed=seed,
+                shots_per_shard=shots_per_shard,
+                batch_size=batch_size,
+                shards=stored,
+            )
+        if progress is not None:
+            progress(shard, len(shards), num_shards)
+
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            finish(_sample_shard(sampler, task))
+    else:
+        with multiprocessing.Pool(
+                min(workers, len(tasks)),
+                initializer=_init_survival_worker,
+                initargs=(circuit,)) as pool:
+            for shard in pool.imap_unordered(_run_survival_task, tasks):
+                finish(shard)
+
+    counts = collections.Counter({tick: 0 for tick in range(len(sampler.layers) + 1)})
+    for shard in shards.values():
+        counts.update(dict(enumerate(shard.survivors)))
+    return counts, list(sampler.qubit_counts)
+
+
+class WorkerRates:
+    """Tracks and prints the sampling speed of each worker of `sample_times`."""
+
+    def __init__(self):
+        self.shots = collections.Counter()
+        self.seconds = collections.Counter()
+
+    def print_progress(self, shard: SurvivalShard, done: int, total: int) -> None:
+        self.shots[shard.worker] += shard.shots
+        self.seconds[shard.worker] += shard.seconds
+        end = '\n' if done == total else ''
+        print(f"\r    sampled {done}/{total} shards", end=end, file=sys.stderr, flush=True)
+
+    def print_summary(self) -> None:
+        for worker in sorted(self.shots):
+            shots = self.shots[worker]
+            seconds = self.seconds[worker]
+            print(f"    worker {worker}: {shots} shots in {seconds:.1f}s ({shots / max(seconds, 1e-9):.0f} shots/s)", file=sys.stderr)
 
 
 def desc(n: float) -> str:
@@ -99,7 +379,15 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--out', type=str, default=None)
     parser.add_argument('--show', action='store_true')
+    parser.add_argument('--shots', type=int, default=1024 * 100)
+    parser.add_argument('--batch_size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=1, help='Processes to sample shards of shots with.')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--shots_per_shard', type=int, default=2**20)
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='Where to record finished shards, so an interrupted run can resume.')
     args = parser.parse_args()
+    if args.checkpoint_dir is not None:
+        pathlib.Path(args.checkpoint_dir).mkdir(parents=True, exist_ok=True)
 
     fig, (ax1, ax2) = plt.subplots(1, 2)
     for dcolor in [3, 5]:
@@ -114,8 +402,19 @@ def main():
             inject_style='unitary',
         )
         circuit = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
-        num_shots = 1024*100
-        ts, qs = sample_times(circuit, num_shots)
+        num_shots = args.shots
+        worker_rates = WorkerRates()
+        ts, qs = sample_times(
+            circuit,
+            num_shots,
+            batch_size=args.batch_size,
+            seed=args.seed,
+            workers=args.workers,
+            shots_per_shard=args.shots_per_shard,
+            checkpoint_path=None if args.checkpoint_dir is None else pathlib.Path(args.checkpoint_dir) / f'lifetime_d1={dcolor}.json',
+            progress=worker_rates.print_progress,
+        )
+        worker_rates.print_summary()
         if dcolor == 5:
             success_rate = 0.01  # Taken from the rejection-vs-logical-error plot near high end of rejection.
         elif dcolor == 3:
@@ -1,7 +1,14 @@
+import collections
+import json
+import pathlib
+
+import numpy as np
+import pytest
 import stim
 
+import gen
 import cultiv
-from cultiv.make_lifetime_plot import circuit_to_layers
+from cultiv.make_lifetime_plot import SurvivalSampler, circuit_to_layers, sample_times
 
 
 def test_circuit_to_layers():
@@ -279,3 +286,112 @@ def test_circuit_to_layers():
         DETECTOR(10, 1, 7, 0, 6) rec[-56] rec[-19]
         TICK
     """)
+
+
+def _looped_sample_times(circuit: stim.Circuit, batch_size: int, seed: int) -> collections.Counter:
+    sim = stim.FlipSimulator(batch_size=batch_size, num_qubits=circuit.num_qubits, seed=seed)
+    postselected = {
+        det
+        for det, coord in circuit.get_detector_coordinates().items()
+        if len(coord) == 3 or coord[-1] == -9 or coord[4] == 0 or coord[4] == 4
+    }
+    sim.clear()
+    survivors = np.ones(batch_size, dtype=np.bool_)
+    counts = collections.Counter({0: batch_size})
+    cur_det = 0
+    for tick, layer in enumerate(circuit_to_layers(circuit), start=1):
+        sim.do(layer)
+        while cur_det < sim.num_detectors:
+            if cur_det in postselected:
+                survivors &= ~sim.get_detector_flips(detector_index=cur_det)
+            cur_det += 1
+        counts[tick] += np.count_nonzero(survivors)
+    return counts
+
+
+def test_sample_times():
+    circuit = cultiv.make_end2end_cultivation_circuit(dcolor=3, dsurface=6, basis='Y', r_growing=3, r_end=3, inject_style='unitary')
+    noisy = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
+    num_layers = len(circuit_to_layers(circuit))
+
+    counts = SurvivalSampler.from_circuit(noisy).sample(256, batch_size=256, seed=5)
+    assert counts == _looped_sample_times(noisy, batch_size=256, seed=5)
+    counts, qubit_counts = sample_times(noisy, 256, batch_size=256, seed=5)
+    assert sorted(counts.keys()) == list(range(num_layers + 1))
+    assert 0 < counts[num_layers] < counts[1] <= 256
+    assert qubit_counts[0] == 13
+    assert qubit_counts == sorted(qubit_counts)
+    assert len(qubit_counts) == num_layers
+
+    counts, _ = sample_times(circuit, 1000, batch_size=256)
+    assert counts == collections.Counter({tick: 1000 for tick in range(num_layers + 1)})
+
+
+def test_survival_sampler_stops_when_all_dead():
+    circuit = cultiv.make_end2end_cultivation_circuit(dcolor=3, dsurface=6, basis='Y', r_growing=3, r_end=3, inject_style='unitary')
+    layers = circuit_to_layers(circuit)
+    measure_index = [inst.name for inst in layers[1]].index('M')
+    layers[1].insert(measure_index, stim.CircuitInstruction('X_ERROR', [11], [1]))
+    sampler = SurvivalSampler.from_circuit(sum(layers, stim.Circuit()))
+    assert len(sampler.layers) == len(layers)
+    assert sum(len(dets) for dets in sampler.layer_postselected_detectors) > 0
+
+    sim = stim.FlipSimulator(batch_size=64, num_qubits=sampler.num_qubits)
+    survivors = sampler.sample_batch(sim, 50)
+    assert survivors.tolist() == [50, 50] + [0] * (len(layers) - 1)
+    assert sim.num_detectors == layers[1].num_detectors
+
+
+def test_sample_times_sharded(tmp_path: pathlib.Path):
+    circuit = cultiv.make_end2end_cultivation_circuit(dcolor=3, dsurface=6, basis='Y', r_growing=3, r_end=3, inject_style='unitary')
+    circuit = gen.NoiseModel.uniform_depolarizing(1e-3).noisy_circuit_skipping_mpp_boundaries(circuit)
+    expected, qubit_counts = sample_times(circuit, 1000, batch_size=128, seed=7, shots_per_shard=300)
+    assert expected[0] == 1000
+
+    seen = []
+    counts, _ = sample_times(circuit, 1000, batch_size=128, seed=7, shots_per_shard=300, workers=2, progress=lambda shard, done, total: seen.append((shard.index, shard.shots, done, total)))
+    assert counts == expected
+    assert sorted((index, shots) for index, shots, _, _ in seen) == [(0, 300), (1, 300), (2, 300), (3, 100)]
+    assert [(done, total) for _, _, done, total in seen] == [(1, 4), (2, 4), (3, 4), (4, 4)]
+    assert counts != sample_times(circuit, 1000, batch_size=128, seed=8, shots_per_shard=300)[0]
+
+    path = tmp_path / 'checkpoint.json'
+    assert sample_times(circuit, 1000, batch_size=128, seed=7, shots_per_shard=300, checkpoint_path=path) == (expected, qubit_counts)
+    data = json.loads(path.read_text())
+    assert sorted(data['shards']) == ['0', '1', '2', '3']
+    del data['shards']['2']
+    path.write_text(json.dumps(data))
+
+    seen = []
+    counts, _ = sample_times(circuit, 1000, batch_size=128, shots_per_shard=300, checkpoint_path=path, progress=lambda shard, done, total: seen.append(shard.index))
+    assert counts == expected
+    assert seen == [2]
+
+    # Growing a finished run only samples the new shards.
+    seen = []
+    counts, _ = sample_times(circuit, 1200, batch_size=128, shots_per_shard=300, checkpoint_path=path, progress=lambda shard, done, total: seen.append(shard.index))
+    assert counts[0] == 1200
+    assert seen == [3]
+
+    # Shrinking a run keeps the unused shards in the checkpoint.
+    grown = counts
+    counts, _ = sample_times(circuit, 600, batch_size=128, shots_per_shard=300, checkpoint_path=path)
+    assert counts[0] == 600
+    assert sorted(json.loads(path.read_text())['shards']) == ['0', '1', '2', '3']
+    seen = []
+    counts, _ = sample_times(circuit, 1200, batch_size=128, shots_per_shard=300, checkpoint_path=path, progress=lambda shard, done, total: seen.append(shard.index))
+    assert counts == grown
+    assert seen == []
+    seen = []
+    sample_times(circuit, 1100, batch_size=128, shots_per_shard=300, checkpoint_path=path, progress=lambda shard, done, total: seen.append(shard.index))
+    assert seen == [3]
+    assert json.loads(path.read_text())['shards']['3']['shots'] == 300
+
+    with pytest.raises(ValueError, match='seed'):
+        sample_times(circuit, 1000, seed=8, shots_per_shard=300, checkpoint_path=path)
+    with pytest.raises(ValueError, match='shots_per_shard'):
+        sample_times(circuit, 1000, shots_per_shard=200, checkpoint_path=path)
+    with pytest.raises(ValueError, match='batch_size'):
+        sample_times(circuit, 1000, batch_size=256, shots_per_shard=300, checkpoint_path=path)
+    with pytest.raises(ValueError, match='circuit'):
+        sample_times(circuit.without_noise(), 1000, shots_per_shard=300, checkpoint_path=path)
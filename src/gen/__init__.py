@@ -38,6 +38,9 @@ from ._layers import (
     MeasureLayer,
     InteractLayer,
 )
+from ._dem_arrays import (
+    DemArrays,
+)
 from ._util import (
     xor_sorted,
     write_file,
@@ -1,9 +1,11 @@
 import collections
 from typing import Callable, Iterable, TYPE_CHECKING, Union
 
+import numpy as np
 import stim
 
 from gen._chunk._stabilizer_code import StabilizerCode
+from gen._dem_arrays import DemArrays
 
 if TYPE_CHECKING:
     import gen
@@ -406,27 +408,18 @@ def find_d1_error(
     else:
         raise NotImplementedError(f"{obj=}")
 
-    for inst in dem:
-        if inst.type == "error":
-            dets = set()
-            obs = set()
-            for target in inst.targets_copy():
-                if target.is_relative_detector_id():
-                    dets ^= {target.val}
-                elif target.is_logical_observable_id():
-                    obs ^= {target.val}
-            dets = frozenset(dets)
-            obs = frozenset(obs)
-            if obs and not dets:
-                if circuit is None:
-                    return inst
-                filter_det = stim.DetectorErrorModel()
-                filter_det.append(inst)
-                return circuit.explain_detector_error_model_errors(
-                    dem_filter=filter_det, reduce_to_one_representative_error=True
-                )[0]
-
-    return None
+    arrays = DemArrays.from_dem(dem)
+    (hits,) = np.nonzero((arrays.det_counts == 0) & (arrays.obs_masks != 0))
+    if len(hits) == 0:
+        return None
+    inst = arrays.error_instruction(int(hits[0]))
+    if circuit is None:
+        return inst
+    filter_det = stim.DetectorErrorModel()
+    filter_det.append(inst)
+    return circuit.explain_detector_error_model_errors(
+        dem_filter=filter_det, reduce_to_one_representative_error=True
+    )[0]
 
 
 def find_d2_error(
@@ -449,30 +442,26 @@ def find_d2_error(
     else:
         raise NotImplementedError(f"{obj=}")
 
-    seen = {}
-    for inst in dem.flattened():
-        if inst.type == "error":
-            dets = set()
-            obs = set()
-            for target in inst.targets_copy():
-                if target.is_relative_detector_id():
-                    dets ^= {target.val}
-                elif target.is_logical_observable_id():
-                    obs ^= {target.val}
-            dets = frozenset(dets)
-            obs = frozenset(obs)
-            if dets not in seen:
-                seen[dets] = (obs, inst)
-            elif seen[dets][0] != obs:
-                filter_det = stim.DetectorErrorModel()
-                filter_det.append(inst)
-                filter_det.append(seen[dets][1])
-                if circuit is None:
-                    return filter_det
-                return circuit.explain_detector_error_model_errors(
-                    dem_filter=filter_det,
-                    reduce_to_one_representative_error=True,
-                )
+    # Look for an error with the same detectors as an earlier error, but different
+    # observables.
+    arrays = DemArrays.from_dem(dem)
+    masks = np.ascontiguousarray(arrays.detector_masks())
+    keys = masks.view(np.dtype((np.void, masks.shape[1] * 8))).ravel()
+    _, first_seen, group = np.unique(keys, return_index=True, return_inverse=True)
+    earlier = first_seen[group.ravel()]
+    (hits,) = np.nonzero(arrays.obs_masks != arrays.obs_masks[earlier])
+    if len(hits) == 0:
+        return None
+    k = int(hits[0])
+    filter_det = stim.DetectorErrorModel()
+    filter_det.append(arrays.error_instruction(k))
+    filter_det.append(arrays.error_instruction(int(earlier[k])))
+    if circuit is None:
+        return filter_det
+    return circuit.explain_detector_error_model_errors(
+        dem_filter=filter_det,
+        reduce_to_one_representative_error=True,
+    )
 
 
 def verify_distance_is_at_least_2(
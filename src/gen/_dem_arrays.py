@@ -0,0 +1,258 @@
+import dataclasses
+import functools
+from typing import Iterable
+
+import numpy as np
+import stim
+
+
+@dataclasses.dataclass(frozen=True)
+class DemArrays:
+    """The errors of a flattened detector error model, stored as flat arrays.
+
+    Errors are in the order they appear in the flattened dem. Error k flips the
+    detectors `det_indices[det_offsets[k]:det_offsets[k + 1]]` (sorted, with repeated
+    detectors cancelled) and the observables set in `obs_masks[k]`.
+
+    Errors can be split into parts by `^` separators. The parts of error k are
+    `part_offsets[k]` through `part_offsets[k + 1]`, and part j flips the detectors
+    `part_det_indices[part_det_offsets[j]:part_det_offsets[j + 1]]` and the
+    observables in `part_obs_masks[j]`. An error without separators has one part.
+
+    Use `DemArrays.from_dem` to make instances. It's memoized, so every consumer of
+    the same dem shares one parse. The arrays are read-only for the same reason.
+    """
+
+    num_detectors: int
+    num_observables: int
+    probabilities: np.ndarray
+    det_offsets: np.ndarray
+    det_indices: np.ndarray
+    obs_masks: np.ndarray
+    part_offsets: np.ndarray
+    part_det_offsets: np.ndarray
+    part_det_indices: np.ndarray
+    part_obs_masks: np.ndarray
+    coord_detectors: np.ndarray
+    coord_offsets: np.ndarray
+    coord_values: np.ndarray
+
+    @staticmethod
+    def from_dem(dem: stim.DetectorErrorModel) -> "DemArrays":
+        flat = dem.flattened()
+        return _dem_arrays_from_flat_text(
+            str(flat), flat.num_detectors, flat.num_observables
+        )
+
+    @property
+    def num_errors(self) -> int:
+        return len(self.probabilities)
+
+    @property
+    def det_counts(self) -> np.ndarray:
+        return np.diff(self.det_offsets)
+
+    @property
+    def part_counts(self) -> np.ndarray:
+        return np.diff(self.part_offsets)
+
+    def dets_of(self, k: int) -> np.ndarray:
+        return self.det_indices[self.det_offsets[k] : self.det_offsets[k + 1]]
+
+    def det_lists(self) -> list[list[int]]:
+        """Returns the detectors flipped by each error, as python lists."""
+        dets = self.det_indices.tolist()
+        offsets = self.det_offsets.tolist()
+        return [dets[a:b] for a, b in zip(offsets, offsets[1:])]
+
+    def detector_masks(self) -> np.ndarray:
+        """Returns a bit-packed (num_errors, words) uint64 table of flipped detectors.
+
+        Detector d is bit d % 64 of word d // 64.
+        """
+        words = max(1, (self.num_detectors + 63) // 64)
+        masks = np.zeros((self.num_errors, words), dtype=np.uint64)
+        rows = np.repeat(np.arange(self.num_errors), self.det_counts)
+        bits = np.left_shift(
+            np.uint64(1), (self.det_indices % 64).astype(np.uint64)
+        )
+        np.bitwise_or.at(masks, (rows, self.det_indices // 64), bits)
+        return masks
+
+    def count_detector_targets_in(self, detectors: Iterable[int]) -> np.ndarray:
+        """Counts how many of each error's detector targets are in the given set.
+
+        Targets are counted per part, so a detector in two parts of an error (e.g.
+        `error(0.1) D0 D1 ^ D1 D2`) counts twice even though the parts cancel it.
+        """
+        is_hit = np.zeros(self.num_detectors, dtype=np.bool_)
+        is_hit[list(detectors)] = True
+        part_errors = np.repeat(np.arange(self.num_errors), self.part_counts)
+        part_det_errors = np.repeat(part_errors, np.diff(self.part_det_offsets))
+        return np.bincount(
+            part_det_errors[is_hit[self.part_det_indices]],
+            minlength=self.num_errors,
+        )
+
+    def error_instruction(self, k: int) -> stim.DemInstruction:
+        """Returns an instruction equivalent to the dem's k'th error."""
+        targets = []
+        for j in range(self.part_offsets[k], self.part_offsets[k + 1]):
+            if targets:
+                targets.append(stim.target_separator())
+            a, b = self.part_det_offsets[j], self.part_det_offsets[j + 1]
+            for d in self.part_det_indices[a:b]:
+                targets.append(stim.target_relative_detector_id(int(d)))
+            obs_mask = int(self.part_obs_masks[j])
+            for b in range(obs_mask.bit_length()):
+                if obs_mask >> b & 1:
+                    targets.append(stim.target_logical_observable_id(b))
+        return stim.DemInstruction(
+            "error", [float(self.probabilities[k])], targets
+        )
+
+    def detector_coordinates(self) -> dict[int, list[float]]:
+        """Same as `stim.DetectorErrorModel.get_detector_coordinates()`."""
+        values = self.coord_values.tolist()
+        offsets = self.coord_offsets.tolist()
+        result = {d: [] for d in range(self.num_detectors)}
+        for d, a, b in zip(self.coord_detectors.tolist(), offsets, offsets[1:]):
+            result[d] = values[a:b]
+        return result
+
+
+def _xor_reduce_pairs(
+    groups: np.ndarray, vals: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Sorts (group, val) pairs, and cancels equal pairs within a group."""
+    order = np.lexsort((vals, groups))
+    groups = groups[order]
+    vals = vals[order]
+    if len(groups) == 0:
+        return groups, vals
+    starts = np.flatnonzero(
+        np.concatenate(
+            [[True], (groups[1:] != groups[:-1]) | (vals[1:] != vals[:-1])]
+        )
+    )
+    counts = np.diff(np.append(starts, len(groups)))
+    keep = starts[counts % 2 == 1]
+    return groups[keep], vals[keep]
+
+
+def _offsets_from_groups(groups: np.ndarray, num_groups: int) -> np.ndarray:
+    offsets = np.zeros(num_groups + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=num_groups), out=offsets[1:])
+    return offsets
+
+
+@functools.lru_cache(maxsize=8)
+def _dem_arrays_from_flat_text(
+    text: str, num_detectors: int, num_observables: int
+) -> DemArrays:
+    if num_observables > 64:
+        raise NotImplementedError(f"{num_observables=} > 64")
+
+    error_lines = []
+    coord_detectors = []
+    coord_offsets = [0]
+    coord_values = []
+    for line in text.splitlines():
+        if line.startswith("error"):
+            error_lines.append(line)
+        elif line.startswith("detector"):
+            if "(" in line:
+                close_paren = line.index(")")
+                args = line[line.index("(") + 1 : close_paren].split(",")
+                coord_values.extend(float(e) for e in args)
+                target = line[close_paren + 1 :].strip()
+            else:
+                target = line[len("detector") :].strip()
+            coord_detectors.append(int(target[1:]))
+            coord_offsets.append(len(coord_values))
+
+    # Split each error line into its probability and its space separated targets.
+    num_errors = len(error_lines)
+    heads = []
+    target_texts = []
+    for line in error_lines:
+        head, _, targets = line.partition(")")
+        heads.append(head.rpartition("(")[2])
+        target_texts.append(targets.strip())
+    probabilities = np.array(heads, dtype=np.float64)
+    token_counts = np.array(
+        [t.count(" ") + 1 if t else 0 for t in target_texts], dtype=np.int64
+    )
+    tokens = np.array(" ".join(target_texts).split())
+    token_errors = np.repeat(np.arange(num_errors), token_counts)
+
+    # Decode the tokens ('D5', 'L0', '^') from their unicode code points.
+    if len(tokens) == 0:
+        tokens = np.zeros(0, dtype="U1")
+    codes = tokens.view(np.uint32).reshape(len(tokens), tokens.itemsize // 4)
+    kinds = codes[:, 0]
+    vals = np.zeros(len(tokens), dtype=np.int64)
+    for col in range(1, codes.shape[1]):
+        digit = codes[:, col].astype(np.int64)
+        present = digit != 0
+        vals[present] *= 10
+        vals[present] += digit[present] - ord("0")
+
+    # Number the parts of each error, which are separated by '^' tokens.
+    is_sep = kinds == ord("^")
+    num_parts_per_error = np.bincount(
+        token_errors[is_sep], minlength=num_errors
+    ) + 1
+    part_offsets = np.zeros(num_errors + 1, dtype=np.int64)
+    np.cumsum(num_parts_per_error, out=part_offsets[1:])
+    num_parts = int(part_offsets[-1])
+    seps_before = np.cumsum(is_sep) - is_sep
+    first_tokens = np.cumsum(token_counts) - token_counts
+    token_parts = (
+        part_offsets[token_errors]
+        + seps_before
+        - seps_before[first_tokens[token_errors]]
+    )
+    part_errors = np.repeat(np.arange(num_errors), num_parts_per_error)
+    keep = ~is_sep
+    kinds = kinds[keep]
+    vals = vals[keep]
+    token_parts = token_parts[keep]
+    if np.any((kinds != ord("D")) & (kinds != ord("L"))):
+        raise NotImplementedError(f"Unrecognized dem targets in {text!r}")
+
+    is_det = kinds == ord("D")
+    is_obs = ~is_det
+    obs_bits = np.left_shift(np.uint64(1), vals[is_obs].astype(np.uint64))
+    part_obs_masks = np.zeros(num_parts, dtype=np.uint64)
+    np.bitwise_xor.at(part_obs_masks, token_parts[is_obs], obs_bits)
+    obs_masks = np.zeros(num_errors, dtype=np.uint64)
+    np.bitwise_xor.at(obs_masks, part_errors, part_obs_masks)
+
+    part_dets_parts, part_det_indices = _xor_reduce_pairs(
+        token_parts[is_det], vals[is_det]
+    )
+    det_errors, det_indices = _xor_reduce_pairs(
+        part_errors[part_dets_parts], part_det_indices
+    )
+
+    result = DemArrays(
+        num_detectors=num_detectors,
+        num_observables=num_observables,
+        probabilities=probabilities,
+        det_offsets=_offsets_from_groups(det_errors, num_errors),
+        det_indices=det_indices,
+        obs_masks=obs_masks,
+        part_offsets=part_offsets,
+        part_det_offsets=_offsets_from_groups(part_dets_parts, num_parts),
+        part_det_indices=part_det_indices,
+        part_obs_masks=part_obs_masks,
+        coord_detectors=np.array(coord_detectors, dtype=np.int64),
+        coord_offsets=np.array(coord_offsets, dtype=np.int64),
+        coord_values=np.array(coord_values, dtype=np.float64),
+    )
+    for field in dataclasses.fields(result):
+        value = getattr(result, field.name)
+        if isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return result
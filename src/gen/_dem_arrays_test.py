@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+import stim
+
+from gen._dem_arrays import DemArrays
+
+
+def _walk_errors(dem: stim.DetectorErrorModel) -> list[tuple[float, list, list]]:
+    result = []
+    for inst in dem.flattened():
+        if inst.type == "error":
+            parts = [[set(), 0]]
+            for t in inst.targets_copy():
+                if t.is_separator():
+                    parts.append([set(), 0])
+                elif t.is_relative_detector_id():
+                    parts[-1][0] ^= {t.val}
+                else:
+                    parts[-1][1] ^= 1 << t.val
+            result.append((inst.args_copy()[0], parts))
+    return result
+
+
+@pytest.mark.parametrize(
+    "dem",
+    [
+        stim.DetectorErrorModel(),
+        stim.DetectorErrorModel(
+            """
+            error(0.125) D0 D0 D1 ^ D1 D2 L0 ^ L0 L3
+            error(0.25)
+            error(0.375) D123 L1
+            detector(1, 2) D5
+            detector D6
+            repeat 2 {
+                error(0.5) D1 ^ D1
+                shift_detectors(0, 1) 1
+                detector(3) D2
+            }
+            """
+        ),
+        stim.Circuit.generated(
+            "surface_code:rotated_memory_x",
+            distance=3,
+            rounds=3,
+            after_clifford_depolarization=0.01,
+        ).detector_error_model(decompose_errors=True),
+    ],
+)
+def test_from_dem_matches_instructions(dem: stim.DetectorErrorModel):
+    arrays = DemArrays.from_dem(dem)
+    expected = _walk_errors(dem)
+    assert arrays.num_errors == len(expected)
+    assert arrays.num_detectors == dem.num_detectors
+    assert arrays.num_observables == dem.num_observables
+    assert arrays.detector_coordinates() == dem.get_detector_coordinates()
+    det_lists = arrays.det_lists()
+    for k, (p, parts) in enumerate(expected):
+        assert arrays.probabilities[k] == p
+        dets = set()
+        obs = 0
+        for j, (part_dets, part_obs) in enumerate(parts, start=arrays.part_offsets[k]):
+            a, b = arrays.part_det_offsets[j], arrays.part_det_offsets[j + 1]
+            assert arrays.part_det_indices[a:b].tolist() == sorted(part_dets)
+            assert arrays.part_obs_masks[j] == part_obs
+            dets ^= part_dets
+            obs ^= part_obs
+        assert arrays.part_counts[k] == len(parts)
+        assert det_lists[k] == arrays.dets_of(k).tolist() == sorted(dets)
+        assert arrays.obs_masks[k] == obs
+        single = stim.DetectorErrorModel()
+        single.append(arrays.error_instruction(k))
+        assert _walk_errors(single) == [(p, parts)]
+
+
+def test_from_dem_is_memoized():
+    dem = stim.DetectorErrorModel(
+        """
+        error(0.125) D0 D1 ^ D1 D2
+        error(0.25) D1 D65 L0
+        """
+    )
+    arrays = DemArrays.from_dem(dem)
+    assert DemArrays.from_dem(dem.copy()) is arrays
+    assert not arrays.det_indices.flags.writeable
+    dem.append("error", 0.5, [stim.target_relative_detector_id(0)])
+    assert DemArrays.from_dem(dem) is not arrays
+
+    np.testing.assert_array_equal(
+        arrays.detector_masks(),
+        [[0b101, 0], [0b10, 0b10]],
+    )
+    np.testing.assert_array_equal(arrays.count_detector_targets_in([1]), [2, 1])
+    np.testing.assert_array_equal(arrays.count_detector_targets_in([0, 65]), [1, 1])
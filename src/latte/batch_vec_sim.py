@@ -0,0 +1,420 @@
+import string
+from typing import Literal, cast
+
+import numpy as np
+import stim
+
+
+class BatchVecSim:
+    """A state vector simulator that advances a batch of independent shots together.
+
+    The state tensor has a leading branch axis, followed by one axis per qubit. Shots
+    whose histories (sampled errors and measurement results) are identical share a
+    branch, so unitary gates cost one pass over the distinct branches instead of one
+    pass per shot. Noise, classically controlled gates, and measurement collapse take
+    per-shot masks; a branch is split when only some of its shots are affected. Shots
+    can be dropped from the batch (e.g. once a detector fires) using `keep_shots`.
+
+    Qubits are identified by integers in `range(num_qubits)` and all start in |0>.
+    """
+
+    def __init__(self, *, num_qubits: int, batch_size: int, rng: np.random.Generator | None = None):
+        assert num_qubits < 20
+        self.num_qubits = num_qubits
+        self.rng = np.random.default_rng() if rng is None else rng
+        # The distinct state vectors, with the branch axis first. Every branch is kept at
+        # the same squared norm, `self._norm2`, so measurements only need the weight of
+        # one outcome.
+        self.state: np.ndarray = np.zeros(shape=(1,) + (2,) * num_qubits, dtype=np.complex64)
+        self.state[(0,) * (num_qubits + 1)] = 1
+        self._norm2 = 1.0
+        # The branch that each shot is in. Every branch has at least one shot.
+        self.branch_of_shot: np.ndarray = np.zeros(shape=batch_size, dtype=np.int64)
+        # Workspace for implementing operations without allocating each time.
+        self._buffer: np.ndarray = np.zeros_like(self.state)
+        # Slicers selecting the |0> and |1> halves of each qubit, computed once.
+        self._halves = [
+            (self.state_slicer({q: False}), self.state_slicer({q: True}))
+            for q in range(num_qubits)
+        ]
+        self._pair_halves: dict[tuple[int, int], tuple[tuple[int | slice, ...], tuple[int | slice, ...]]] = {}
+
+    @property
+    def batch_size(self) -> int:
+        return self.branch_of_shot.shape[0]
+
+    @property
+    def num_branches(self) -> int:
+        return self.state.shape[0]
+
+    def _set_state(self, state: np.ndarray) -> None:
+        self.state = state
+        if self._buffer.shape[0] < state.shape[0]:
+            self._buffer = np.zeros_like(state)
+
+    def _buffer_slice(self, index: tuple[int | slice, ...]) -> np.ndarray:
+        return self._buffer[:self.num_branches][index]
+
+    def keep_shots(self, keep: np.ndarray) -> None:
+        """Drops the shots where the given bool mask is False."""
+        used, self.branch_of_shot = np.unique(self.branch_of_shot[keep], return_inverse=True)
+        if len(used) < self.num_branches:
+            self._set_state(self.state[used])
+
+    def shot_states(self) -> np.ndarray:
+        """Returns each shot's state as a unit vector, with shape (batch_size, 2, 2, ...)."""
+        return self.state[self.branch_of_shot] / np.float32(np.sqrt(self._norm2))
+
+    def state_slicer(self, qs: dict[int, bool]) -> tuple[int | slice, ...]:
+        """Returns a value that slices the part of every branch where the given qubits have the given values."""
+        mask: list[int | slice] = [slice(None)] * (self.num_qubits + 1)
+        for q, b in qs.items():
+            assert mask[q + 1] == slice(None)
+            mask[q + 1] = int(b)
+        return tuple(mask)
+
+    def _per_branch(self, values: np.ndarray) -> np.ndarray:
+        """Reshapes per-branch values to broadcast against a single-qubit slice of the state."""
+        return values.astype(np.float32).reshape((-1,) + (1,) * (self.num_qubits - 1))
+
+    def _isolate(self, shots: np.ndarray) -> np.ndarray | None:
+        """Splits branches so the selected shots are exactly the shots of some branches.
+
+        Args:
+            shots: A bool mask over the shots.
+
+        Returns:
+            A bool mask over the (new) branches, selecting the branches holding the
+            selected shots. None if no shots were selected.
+        """
+        if not np.any(shots):
+            return None
+        n = self.num_branches
+        total = np.bincount(self.branch_of_shot, minlength=n)
+        chosen = np.bincount(self.branch_of_shot[shots], minlength=n)
+        rows = (chosen > 0) & (chosen == total)
+        partial = np.flatnonzero((chosen > 0) & (chosen < total))
+        if len(partial):
+            new_branch = np.full(shape=n, fill_value=-1, dtype=np.int64)
+            new_branch[partial] = np.arange(n, n + len(partial))
+            moved = shots & (new_branch[self.branch_of_shot] >= 0)
+            self.branch_of_shot[moved] = new_branch[self.branch_of_shot[moved]]
+            self._set_state(np.concatenate([self.state, self.state[partial]]))
+            rows = np.concatenate([rows, np.ones(shape=len(partial), dtype=np.bool_)])
+        return rows
+
+    def do_x(self, q: int, shots: np.ndarray | None = None) -> None:
+        """Applies X to a qubit, in every shot or only in the shots selected by a bool mask."""
+        f_slice, t_slice = self._halves[q]
+        f = self.state[f_slice]
+        t = self.state[t_slice]
+        if shots is None:
+            tmp = self._buffer_slice(f_slice)
+            np.copyto(tmp, f)
+            np.copyto(f, t)
+            np.copyto(t, tmp)
+        else:
+            rows = self._isolate(shots)
+            if rows is not None:
+                f = self.state[f_slice]
+                t = self.state[t_slice]
+                tmp = f[rows]
+                f[rows] = t[rows]
+                t[rows] = tmp
+
+    def do_z(self, q: int, shots: np.ndarray | None = None) -> None:
+        """Applies Z to a qubit, in every shot or only in the shots selected by a bool mask."""
+        t_slice = self._halves[q][1]
+        if shots is None:
+            self.state[t_slice] *= -1
+        else:
+            rows = self._isolate(shots)
+            if rows is not None:
+                self.state[t_slice][rows] *= -1
+
+    def do_y(self, q: int, shots: np.ndarray | None = None) -> None:
+        self.do_x(q, shots)
+        self.do_z(q, shots)
+
+    def do_pauli(self, q: int, pauli: int, shots: np.ndarray | None = None) -> None:
+        """Applies I/X/Y/Z (pauli=0/1/2/3) to a qubit, in every shot or only in the shots selected by a bool mask."""
+        if pauli == 1:
+            self.do_x(q, shots)
+        elif pauli == 2:
+            self.do_y(q, shots)
+        elif pauli == 3:
+            self.do_z(q, shots)
+
+    def do_h(self, q: int) -> None:
+        """Applies an unnormalized Hadamard gate (the state's norm is tracked separately)."""
+        f_slice, t_slice = self._halves[q]
+        f = self.state[f_slice]
+        t = self.state[t_slice]
+        tmp = self._buffer_slice(f_slice)
+        np.subtract(f, t, out=tmp)
+        f += t
+        np.copyto(t, tmp)
+        self._norm2 *= 2
+
+    def do_h_yz(self, q: int) -> None:
+        self.do_s_dag(q)
+        self.do_h(q)
+        self.do_s(q)
+
+    def do_phase(self, q: int, phase: complex) -> None:
+        """Multiplies the |1> half of a qubit by the given phase."""
+        self.state[self._halves[q][1]] *= np.complex64(phase)
+
+    def do_s(self, q: int) -> None:
+        self.do_phase(q, 1j)
+
+    def do_s_dag(self, q: int) -> None:
+        self.do_phase(q, -1j)
+
+    def do_t(self, q: int) -> None:
+        self.do_phase(q, (1 + 1j) / np.sqrt(2))
+
+    def do_t_dag(self, q: int) -> None:
+        self.do_phase(q, (1 - 1j) / np.sqrt(2))
+
+    def _control_halves(self, a: int, b: int) -> tuple[tuple[int | slice, ...], tuple[int | slice, ...]]:
+        """Returns slicers for the a=1,b=0 and a=1,b=1 parts of the state, computing them at most once."""
+        key = (a, b)
+        result = self._pair_halves.get(key)
+        if result is None:
+            result = (self.state_slicer({a: True, b: False}), self.state_slicer({a: True, b: True}))
+            self._pair_halves[key] = result
+        return result
+
+    def do_cx(self, a: int, b: int) -> None:
+        tf_slice, tt_slice = self._control_halves(a, b)
+        tf = self.state[tf_slice]
+        tt = self.state[tt_slice]
+        tmp = self._buffer_slice(tf_slice)
+        np.copyto(tmp, tf)
+        np.copyto(tf, tt)
+        np.copyto(tt, tmp)
+
+    def do_cz(self, a: int, b: int) -> None:
+        self.state[self._control_halves(a, b)[1]] *= -1
+
+    def _sample_z(self, q: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Samples Z measurement results, splitting branches whose shots got different results.
+
+        Returns:
+            A (per-shot results, per-branch results, per-branch rescaling factor) tuple.
+        """
+        t = self.state[self._halves[q][1]]
+        axes = string.ascii_letters[:t.ndim]
+        subscripts = f'{axes},{axes}->{axes[0]}'
+        weight_t = np.einsum(subscripts, t.real, t.real) + np.einsum(subscripts, t.imag, t.imag)
+        weight_t = np.minimum(weight_t, self._norm2)
+
+        shot_results = self.rng.random(self.batch_size) * self._norm2 < weight_t[self.branch_of_shot]
+        keys, self.branch_of_shot = np.unique(self.branch_of_shot * 2 + shot_results, return_inverse=True)
+        sources = keys >> 1
+        if len(keys) > self.num_branches:
+            self._set_state(self.state[sources])
+            weight_t = weight_t[sources]
+        branch_results = (keys & 1).astype(np.bool_)
+
+        weight = np.where(branch_results, weight_t, self._norm2 - weight_t)
+        self._norm2 = 1.0
+        return shot_results, branch_results, 1 / np.sqrt(weight)
+
+    def do_mz(self, q: int) -> np.ndarray:
+        """Measures a qubit in every shot, returning a bool array of results."""
+        shot_results, branch_results, scale = self._sample_z(q)
+        f_slice, t_slice = self._halves[q]
+        f = self.state[f_slice]
+        t = self.state[t_slice]
+        f *= self._per_branch(np.where(branch_results, 0, scale))
+        t *= self._per_branch(np.where(branch_results, scale, 0))
+        return shot_results
+
+    def do_mrz(self, q: int) -> np.ndarray:
+        """Measures and resets a qubit in every shot, returning a bool array of results."""
+        shot_results, branch_results, scale = self._sample_z(q)
+        f_slice, t_slice = self._halves[q]
+        f = self.state[f_slice]
+        t = self.state[t_slice]
+        f *= self._per_branch(np.where(branch_results, 0, scale))
+        if np.any(branch_results):
+            tmp = self._buffer_slice(f_slice)
+            np.multiply(t, self._per_branch(np.where(branch_results, scale, 0)), out=tmp)
+            f += tmp
+        t[...] = 0
+        return shot_results
+
+    def do_rz(self, q: int) -> None:
+        self.do_mrz(q)
+
+    def do_mx(self, q: int) -> np.ndarray:
+        self.do_h(q)
+        r = self.do_mz(q)
+        self.do_h(q)
+        return r
+
+    def do_rx(self, q: int) -> None:
+        self.do_rz(q)
+        self.do_h(q)
+
+    def _do_obs_qubits_to_z(self, obs: dict[int, Literal['X', 'Y', 'Z']]) -> None:
+        for q, b in obs.items():
+            if b == 'X':
+                self.do_h(q)
+            elif b == 'Y':
+                self.do_h_yz(q)
+            elif b == 'Z':
+                pass
+            else:
+                raise NotImplementedError(f'{obs=}')
+
+    def do_measure_obs(self, obs: dict[int, Literal['X', 'Y', 'Z']]) -> np.ndarray:
+        """Measures a Pauli product in every shot, returning a bool array of results."""
+        self._do_obs_qubits_to_z(obs)
+        root, *rest = obs.keys()
+        for q in rest:
+            self.do_cx(q, root)
+        r = self.do_mz(root)
+        for q in rest:
+            self.do_cx(q, root)
+        self._do_obs_qubits_to_z(obs)
+        return r
+
+    def sample_hits(self, p: float, count: int) -> np.ndarray:
+        """Samples a (count, batch_size) bool array where each entry is True with probability p."""
+        if p == 0:
+            return np.zeros(shape=(count, self.batch_size), dtype=np.bool_)
+        return self.rng.random(size=(count, self.batch_size)) < p
+
+    def do_stim_instruction(
+            self,
+            inst: stim.CircuitInstruction,
+            *,
+            sweep_bits: dict[int, np.ndarray],
+            out_measurements: list[np.ndarray],
+            out_detectors: list[np.ndarray],
+            out_observables: list[np.ndarray],
+    ):
+        """Batched equivalent of `VecSim.do_stim_instruction`.
+
+        Sweep bits, measurement records, detectors, and observables are bool arrays with
+        one entry per shot in the batch.
+        """
+        if inst.name == 'QUBIT_COORDS':
+            pass
+        elif inst.name == 'SHIFT_COORDS':
+            pass
+        elif inst.name == 'TICK':
+            pass
+        elif inst.name == 'DETECTOR':
+            b = np.zeros(shape=self.batch_size, dtype=np.bool_)
+            for q in inst.targets_copy():
+                assert q.is_measurement_record_target
+                assert -len(out_measurements) <= q.value < 0
+                b ^= out_measurements[q.value]
+            out_detectors.append(b)
+        elif inst.name == 'OBSERVABLE_INCLUDE':
+            index, = inst.gate_args_copy()
+            index = round(index)
+            while index >= len(out_observables):
+                out_observables.append(np.zeros(shape=self.batch_size, dtype=np.bool_))
+            for q in inst.targets_copy():
+                assert q.is_measurement_record_target
+                assert -len(out_measurements) <= q.value < 0
+                out_observables[index] ^= out_measurements[q.value]
+        elif inst.name == 'MPP':
+            ps = inst.gate_args_copy()
+            groups = inst.target_groups()
+            flips = self.sample_hits(ps[0] if ps else 0, len(groups))
+            for k, terms in enumerate(groups):
+                obs: dict[int, Literal['X', 'Y', 'Z']] = {}
+                flipped = False
+                for t in terms:
+                    flipped ^= t.is_inverted_result_target
+                    obs[t.qubit_value] = cast(Literal['X', 'Y', 'Z'], t.pauli_type)
+                out_measurements.append(self.do_measure_obs(obs) ^ flipped ^ flips[k])
+        elif inst.name == 'RX':
+            for q in inst.targets_copy():
+                self.do_rx(q.qubit_value)
+        elif inst.name == 'R':
+            for q in inst.targets_copy():
+                self.do_rz(q.qubit_value)
+        elif inst.name == 'X':
+            for q in inst.targets_copy():
+                self.do_x(q.qubit_value)
+        elif inst.name == 'Y':
+            for q in inst.targets_copy():
+                self.do_y(q.qubit_value)
+        elif inst.name == 'Z':
+            for q in inst.targets_copy():
+                self.do_z(q.qubit_value)
+        elif inst.name == 'S':
+            for q in inst.targets_copy():
+                self.do_s(q.qubit_value)
+        elif inst.name == 'M' or inst.name == 'MX':
+            ps = inst.gate_args_copy()
+            targets = inst.targets_copy()
+            flips = self.sample_hits(ps[0] if ps else 0, len(targets))
+            for k, q in enumerate(targets):
+                if inst.name == 'M':
+                    r = self.do_mz(q.qubit_value)
+                else:
+                    r = self.do_mx(q.qubit_value)
+                out_measurements.append(r ^ q.is_inverted_result_target ^ flips[k])
+        elif inst.name == 'X_ERROR' or inst.name == 'Z_ERROR':
+            p, = inst.gate_args_copy()
+            targets = inst.targets_copy()
+            hits = self.sample_hits(p, len(targets))
+            for k in np.flatnonzero(np.any(hits, axis=1)):
+                if inst.name == 'X_ERROR':
+                    self.do_x(targets[k].qubit_value, hits[k])
+                else:
+                    self.do_z(targets[k].qubit_value, hits[k])
+        elif inst.name == 'DEPOLARIZE1':
+            p, = inst.gate_args_copy()
+            targets = inst.targets_copy()
+            hits = self.sample_hits(p, len(targets))
+            for k in np.flatnonzero(np.any(hits, axis=1)):
+                v = self.rng.integers(1, 4, size=self.batch_size)
+                for pauli in range(1, 4):
+                    self.do_pauli(targets[k].qubit_value, pauli, hits[k] & (v == pauli))
+        elif inst.name == 'DEPOLARIZE2':
+            p, = inst.gate_args_copy()
+            ts = inst.targets_copy()
+            hits = self.sample_hits(p, len(ts) // 2)
+            for k in np.flatnonzero(np.any(hits, axis=1)):
+                q1 = ts[2 * k].qubit_value
+                q2 = ts[2 * k + 1].qubit_value
+                v = self.rng.integers(1, 16, size=self.batch_size)
+                for pauli in range(1, 4):
+                    self.do_pauli(q1, pauli, hits[k] & ((v & 3) == pauli))
+                    self.do_pauli(q2, pauli, hits[k] & ((v >> 2) == pauli))
+        elif inst.name == 'CX':
+            ts = inst.targets_copy()
+            for k in range(0, len(ts), 2):
+                t1, t2 = ts[k], ts[k + 1]
+                if t1.is_measurement_record_target:
+                    self.do_x(t2.qubit_value, out_measurements[t1.value])
+                elif t1.is_sweep_bit_target:
+                    self.do_z(t2.qubit_value, sweep_bits[t1.value])
+                else:
+                    self.do_cx(t1.qubit_value, t2.qubit_value)
+        elif inst.name == 'CZ':
+            ts = inst.targets_copy()
+            for k in range(0, len(ts), 2):
+                t1, t2 = ts[k], ts[k + 1]
+                if t1.is_measurement_record_target:
+                    self.do_z(t2.qubit_value, out_measurements[t1.value])
+                elif t2.is_measurement_record_target:
+                    self.do_z(t1.qubit_value, out_measurements[t2.value])
+                elif t1.is_sweep_bit_target:
+                    self.do_z(t2.qubit_value, sweep_bits[t1.value])
+                elif t2.is_sweep_bit_target:
+                    self.do_z(t1.qubit_value, sweep_bits[t2.value])
+                else:
+                    self.do_cz(t1.qubit_value, t2.qubit_value)
+        else:
+            raise NotImplementedError(f'{inst=}')
+
@@ -0,0 +1,91 @@
+import numpy as np
+import stim
+
+from latte.batch_vec_sim import BatchVecSim
+
+
+def test_gates_match_stim():
+    sim = BatchVecSim(num_qubits=3, batch_size=4)
+    sim.do_h(0)
+    sim.do_cx(0, 1)
+    sim.do_s(1)
+    sim.do_h(2)
+    sim.do_cz(1, 2)
+    sim.do_h_yz(2)
+    sim.do_s_dag(0)
+    sim.do_y(2)
+
+    expected = stim.Circuit("""
+        H 0
+        CX 0 1
+        S 1
+        H 2
+        CZ 1 2
+        H_YZ 2
+        S_DAG 0
+        Y 2
+    """).to_tableau().to_state_vector(endian='little')
+    states = sim.shot_states()
+    assert states.shape == (4, 2, 2, 2)
+    for state in states:
+        # Equal up to global phase.
+        overlap = np.vdot(expected, state.transpose().reshape(8))
+        np.testing.assert_allclose(abs(overlap), 1, atol=1e-5)
+
+
+def test_masked_paulis_split_branches():
+    sim = BatchVecSim(num_qubits=2, batch_size=5)
+    sim.do_h(0)
+    sim.do_x(1, np.array([True, False, True, False, False]))
+    assert sim.num_branches == 2
+    sim.do_z(0, np.array([True, True, False, False, False]))
+    assert sim.num_branches == 4
+    sim.do_x(1, np.array([True, False, True, False, False]))
+    assert sim.num_branches == 4
+
+    states = sim.shot_states()
+    np.testing.assert_allclose(states[0], states[1], atol=1e-6)
+    np.testing.assert_allclose(states[2], states[3], atol=1e-6)
+    np.testing.assert_allclose(states[3], states[4], atol=1e-6)
+    np.testing.assert_allclose(states[0][:, 0], [2**-0.5, -2**-0.5], atol=1e-6)
+    np.testing.assert_allclose(states[2][:, 0], [2**-0.5, 2**-0.5], atol=1e-6)
+
+    sim.keep_shots(np.array([False, False, True, True, False]))
+    assert sim.batch_size == 2
+    assert sim.num_branches == 2
+    sim.keep_shots(np.array([False, True]))
+    assert sim.batch_size == 1
+    assert sim.num_branches == 1
+
+
+def test_measurement_statistics():
+    sim = BatchVecSim(num_qubits=2, batch_size=4000, rng=np.random.default_rng(5))
+    sim.do_h(0)
+    sim.do_cx(0, 1)
+    a = sim.do_mz(0)
+    assert sim.num_branches == 2
+    b = sim.do_mz(1)
+    assert sim.num_branches == 2
+    np.testing.assert_array_equal(a, b)
+    assert 1800 < np.count_nonzero(a) < 2200
+
+    # Measurement results must match the post-measurement states.
+    states = sim.shot_states()
+    np.testing.assert_allclose(np.abs(states[a, 1, 1]), 1, atol=1e-6)
+    np.testing.assert_allclose(np.abs(states[~a, 0, 0]), 1, atol=1e-6)
+
+    sim.do_rx(0)
+    sim.do_rz(1)
+    assert not np.any(sim.do_mx(0))
+    assert not np.any(sim.do_mz(1))
+
+
+def test_measure_obs():
+    sim = BatchVecSim(num_qubits=3, batch_size=100)
+    sim.do_h(0)
+    sim.do_cx(0, 1)
+    sim.do_cx(0, 2)
+    assert not np.any(sim.do_measure_obs({0: 'X', 1: 'X', 2: 'X'}))
+    assert not np.any(sim.do_measure_obs({0: 'Z', 1: 'Z'}))
+    sim.do_z(2, np.arange(100) < 30)
+    np.testing.assert_array_equal(sim.do_measure_obs({0: 'X', 1: 'X', 2: 'X'}), np.arange(100) < 30)
@@ -58,6 +58,11 @@ class Symptom:
                 raise NotImplementedError(f'{t=}')
         return Symptom(obs_mask=obs_mask, dets=frozenset(gen.xor_sorted(dets)))
 
+    @staticmethod
+    def from_dem_arrays(arrays: gen.DemArrays, k: int) -> 'Symptom':
+        """Returns the symptom of the k'th error of the dem the arrays came from."""
+        return Symptom(obs_mask=int(arrays.obs_masks[k]), dets=frozenset(arrays.dets_of(k).tolist()))
+
     def __mul__(self, other: 'Symptom') -> 'Symptom':
         return Symptom(
             obs_mask=self.obs_mask ^ other.obs_mask,
@@ -155,7 +160,8 @@ def dem_with_compressed_detectors(
         error_size_cutoff: int,
         detection_event_cutoff: int,
 ) -> stim.DetectorErrorModel:
-    d2c = dem.get_detector_coordinates()
+    arrays = gen.DemArrays.from_dem(dem)
+    d2c = arrays.detector_coordinates()
     out_dem = stim.DetectorErrorModel()
     compressed_dets = frozenset(
         det
@@ -166,17 +172,19 @@ def dem_with_compressed_detectors(
         return dem
 
     dem = dem.flattened()
+    touches_compressed = (arrays.count_detector_targets_in(compressed_dets) > 0).tolist()
     error_sets: DefaultDict[Symptom, float] = collections.defaultdict(float)
+    k = 0
     for inst in dem:
         if inst.type != 'error':
             out_dem.append(inst)
             continue
-        targets = inst.targets_copy()
-        if not any(d.is_relative_detector_id() and d.val in compressed_dets for d in targets):
+        k += 1
+        if not touches_compressed[k - 1]:
             out_dem.append(inst)
             continue
-        symptom = Symptom.from_dem_targets(targets)
-        error_sets[symptom] = bernoulli_sum(error_sets[symptom], inst.args_copy()[0])
+        symptom = Symptom.from_dem_arrays(arrays, k - 1)
+        error_sets[symptom] = bernoulli_sum(error_sets[symptom], float(arrays.probabilities[k - 1]))
 
     combos = bernoulli_combo(
         errors=error_sets,
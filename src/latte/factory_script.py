@@ -584,7 +584,7 @@ class FactoryScript:
         prefer_check_result: bool | None = None,
         prefer_output_result: bool | None = None,
     ) -> list[Any]:
-        sim = VecSim()
+        sim = VecSim(max_qubits=self._recompute_max_storage())
         err_index = 0
         outs = []
 
@@ -1,3 +1,4 @@
+import heapq
 import random
 from typing import Dict, Any, Tuple, Union, Iterable, Literal, List, \
     Optional, Sequence, Callable, TYPE_CHECKING, cast
@@ -18,18 +19,38 @@ class VecSim:
     Qubits are added to the state using methods like `do_qalloc_x`.
     Qubits are operated on using methods like `do_h`.
     Qubits are removed using methods like `do_mz_discard`.
+
+    Each qubit lives on one axis of the state tensor. Axes without a qubit are kept in
+    the |0> state and are ignored by operations, so freeing a qubit just returns its
+    axis to a free list for the next allocation to reuse. The state tensor only has to
+    grow when every axis is in use.
     """
 
-    def __init__(self):
+    def __init__(self, *, max_qubits: Optional[int] = None):
+        """
+        Args:
+            max_qubits: The most qubits that will be allocated at once. When specified, the
+                state tensor is allocated up front with this many axes and is never
+                reallocated; allocating past the budget raises a ValueError. Otherwise
+                the state tensor grows as needed.
+        """
+        self.max_qubits = max_qubits
         # External qubit key to internal simulator index.
         self.q2i: Dict[Any, int] = {}
         # Internal simulator qubit index to external qubit key.
         self.i2q: Dict[int, Any] = {}
         # The state vector, stored as numpy tensor.
-        self.state: np.ndarray = np.zeros(shape=(2, 2), dtype=np.complex64)
-        self.state[0, 0] = 1
+        self.state: np.ndarray = np.zeros(shape=(2,) * self._initial_num_axes(), dtype=np.complex64)
+        self.state.flat[0] = 1
         # Workspace for implementing operations without allocating each time.
-        self._buffer: np.ndarray = np.zeros(shape=(2, 2), dtype=np.complex64)
+        self._buffer: np.ndarray = np.zeros_like(self.state)
+        # Axes of the state that have no qubit (and are in the |0> state), as a heap.
+        self._free_axes: List[int] = list(range(self.state.ndim))
+        # Cached views into the state (and workspace) for single qubits and qubit pairs.
+        # Cleared by `_forget_views` whenever qubits are allocated, freed, or renamed.
+        self._qubit_views: Dict[Any, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._pair_views: Dict[Tuple[Any, Any], Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._live_view: Optional[np.ndarray] = None
         # Recorded measurement results.
         self.m_record: Dict[Any, bool] = {}
         # Storage for instructions like `accumulator_bit_xor` and `accumulator_bit_save`.
@@ -45,21 +66,28 @@ class VecSim:
         self._next_error_mechanism = 0
         self.included_error_mechanisms = set()
 
+    def _initial_num_axes(self) -> int:
+        return 2 if self.max_qubits is None else self.max_qubits
+
     def clear(self):
         self.q2i = {}
         self.i2q = {}
-        self.state = np.zeros(shape=(2, 2), dtype=np.complex64)
-        self._buffer = np.zeros(shape=(2, 2), dtype=np.complex64)
-        self.state[0, 0] = 1
+        self.state = np.zeros(shape=(2,) * self._initial_num_axes(), dtype=np.complex64)
+        self._buffer = np.zeros_like(self.state)
+        self.state.flat[0] = 1
+        self._free_axes = list(range(self.state.ndim))
+        self._forget_views()
         self.m_record = {}
         self.next_anon_key = 0
 
     def copy(self) -> 'VecSim':
         s = VecSim()
+        s.max_qubits = self.max_qubits
         s.q2i = dict(self.q2i)
         s.i2q = dict(self.i2q)
         s.state = np.copy(self.state)
         s._buffer = np.copy(self._buffer)
+        s._free_axes = list(self._free_axes)
         s.grounded_qubits = set(self.grounded_qubits)
         s._measurements_to_flip = set(self._measurements_to_flip)
         s._next_error_mechanism = self._next_error_mechanism
@@ -121,29 +149,64 @@ class VecSim:
             qs: The subset to slice into is identified by specifying values for some qubits.
                 For example, the part of the state vector where qubit 'A' is ON.
         """
-        mask: List[Union[slice, int]] = [slice(None)] * len(self.state.shape)
-        for k in range(len(self.q2i), len(mask)):
-            mask[k] = 0
+        mask: List[Union[slice, int]] = [0] * len(self.state.shape)
+        for i in self.i2q:
+            mask[i] = slice(None)
         for a, b in qs.items():
             i = self.q2i[a]
             assert mask[i] == slice(None)
             mask[i] = int(b)
         return tuple(mask)
 
+    def _forget_views(self) -> None:
+        self._qubit_views.clear()
+        self._pair_views.clear()
+        self._live_view = None
+
+    def _live_state(self) -> np.ndarray:
+        """Returns a view of the part of the state where every free axis is OFF."""
+        if self._live_view is None:
+            self._live_view = self.state[self.state_slicer({}) + (Ellipsis,)]
+        return self._live_view
+
+    def _views_of(self, q: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns views of the state where q is OFF and where q is ON, and of the workspace where q is OFF."""
+        views = self._qubit_views.get(q)
+        if views is None:
+            # The trailing ellipsis keeps the result a view when every axis gets an integer.
+            f = self.state_slicer({q: False}) + (Ellipsis,)
+            t = self.state_slicer({q: True}) + (Ellipsis,)
+            views = (self.state[f], self.state[t], self._buffer[f])
+            self._qubit_views[q] = views
+        return views
+
+    def _pair_views_of(self, a: Any, b: Any) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns views of the state where (a, b) is (ON, OFF), (OFF, ON), and (ON, ON), and of the workspace where (a, b) is (ON, OFF)."""
+        views = self._pair_views.get((a, b))
+        if views is None:
+            tf = self.state_slicer({a: True, b: False}) + (Ellipsis,)
+            ft = self.state_slicer({a: False, b: True}) + (Ellipsis,)
+            tt = self.state_slicer({a: True, b: True}) + (Ellipsis,)
+            views = (self.state[tf], self.state[ft], self.state[tt], self._buffer[tf])
+            self._pair_views[(a, b)] = views
+        return views
+
     def do_qalloc_z(self, q: Any) -> None:
         """Allocates a new qubit, initializing it into the |0> state."""
         assert q not in self.q2i, f'{q} already allocated'
-        i = len(self.q2i)
-        assert len(self.q2i) < 20
+        if not self._free_axes:
+            if self.max_qubits is not None:
+                raise ValueError(f"Can't allocate {q!r} because all {self.max_qubits=} qubits are in use.")
+            assert len(self.q2i) < 20
+            old_state = self.state
+            self.state = np.zeros(shape=(2,) * (old_state.ndim + 1), dtype=np.complex64)
+            self._buffer = np.zeros_like(self.state)
+            self.state[..., 0] = old_state
+            self._free_axes.append(old_state.ndim)
+        i = heapq.heappop(self._free_axes)
         self.q2i[q] = i
         self.i2q[i] = q
-        if len(self.q2i) > len(self.state.shape):
-            old_state = self.state
-            self.state = np.zeros(shape=(2,) * len(self.q2i), dtype=np.complex64)
-            self._buffer = np.zeros(shape=(2,) * len(self.q2i), dtype=np.complex64)
-            m: List[Union[slice, int]] = [slice(None)] * len(old_state.shape)
-            m += [0] * (len(self.q2i) - len(old_state.shape))
-            self.state[tuple(m)] = old_state
+        self._forget_views()
         self.do_rz(q)
 
     def do_qalloc_y(self, q: Any) -> None:
@@ -248,26 +311,24 @@ class VecSim:
         self._do_obs_qubits_to_z(obs)
 
     def do_z(self, a: Any) -> None:
-        self.state[self.state_slicer({a: True})] *= -1
+        _, t, _ = self._views_of(a)
+        t *= -1
 
     def do_y(self, a: Any) -> None:
         self.do_x(a)
         self.do_z(a)
 
     def do_x(self, q: Any) -> None:
-        f = self.state_slicer({q: False})
-        t = self.state_slicer({q: True})
-        self._buffer[f] = self.state[f]
-        self.state[f] = self.state[t]
-        self.state[t] = self._buffer[f]
+        f, t, buf = self._views_of(q)
+        np.copyto(buf, f)
+        np.copyto(f, t)
+        np.copyto(t, buf)
 
     def do_h(self, q: Any) -> None:
-        f = self.state_slicer({q: False})
-        t = self.state_slicer({q: True})
-        self._buffer[f] = self.state[f]
-        self.state[f] += self.state[t]
-        self.state[t] *= -1
-        self.state[t] += self._buffer[f]
+        f, t, buf = self._views_of(q)
+        np.subtract(f, t, out=buf)
+        f += t
+        np.copyto(t, buf)
 
     def do_h_yz(self, q: Any) -> None:
         self.do_s_dag(q)
@@ -280,31 +341,35 @@ class VecSim:
         self.do_t(q)
 
     def do_t(self, q: Any) -> None:
-        self.state[self.state_slicer({q: True})] *= (1 + 1j) / np.sqrt(2)
+        _, t, _ = self._views_of(q)
+        t *= (1 + 1j) / np.sqrt(2)
 
     def do_t_dag(self, q: Any) -> None:
-        self.state[self.state_slicer({q: True})] *= (1 - 1j) / np.sqrt(2)
+        _, t, _ = self._views_of(q)
+        t *= (1 - 1j) / np.sqrt(2)
 
     def do_s(self, a: Any) -> None:
-        self.state[self.state_slicer({a: True})] *= 1j
+        _, t, _ = self._views_of(a)
+        t *= 1j
 
     def do_multi_phase(self, qubits: Iterable[Any], phase: complex) -> None:
         root, *rest = qubits
         for q in rest:
             self.do_cx(q, root)
-        self.state[self.state_slicer({root: True})] *= phase
+        _, t, _ = self._views_of(root)
+        t *= phase
         for q in rest:
             self.do_cx(q, root)
 
     def do_s_dag(self, a: Any) -> None:
-        self.state[self.state_slicer({a: True})] *= -1j
+        _, t, _ = self._views_of(a)
+        t *= -1j
 
     def do_cx(self, a: Any, b: Any) -> None:
-        tf = self.state_slicer({a: True, b: False})
-        tt = self.state_slicer({a: True, b: True})
-        self._buffer[tf] = self.state[tf]
-        self.state[tf] = self.state[tt]
-        self.state[tt] = self._buffer[tf]
+        tf, _, tt, buf = self._pair_views_of(a, b)
+        np.copyto(buf, tf)
+        np.copyto(tf, tt)
+        np.copyto(tt, buf)
 
     def do_cy(self, a: Any, b: Any) -> None:
         self.do_s_dag(b)
@@ -317,12 +382,12 @@ class VecSim:
         self.do_h_yz(b)
 
     def do_cz(self, a: Any, b: Any) -> None:
-        tt = self.state_slicer({a: True, b: True})
-        self.state[tt] *= -1
+        _, _, tt, _ = self._pair_views_of(a, b)
+        tt *= -1
 
     def do_cs(self, a: Any, b: Any) -> None:
-        tt = self.state_slicer({a: True, b: True})
-        self.state[tt] *= 1j
+        _, _, tt, _ = self._pair_views_of(a, b)
+        tt *= 1j
 
     def do_ccz(self, a: Any, b: Any, c: Any) -> None:
         ttt = self.state_slicer({a: True, b: True, c: True})
@@ -338,13 +403,13 @@ class VecSim:
                 i = self.q2i.pop(b)
                 self.q2i[a] = i
                 self.i2q[i] = a
+            self._forget_views()
             return
 
-        tf = self.state_slicer({a: True, b: False})
-        ft = self.state_slicer({a: False, b: True})
-        self._buffer[tf] = self.state[tf]
-        self.state[tf] = self.state[ft]
-        self.state[ft] = self._buffer[tf]
+        tf, ft, _, buf = self._pair_views_of(a, b)
+        np.copyto(buf, tf)
+        np.copyto(tf, ft)
+        np.copyto(ft, buf)
 
     def do_mxx(self, a: Any, b: Any, *, key: Optional[Any] = None, prefer_result: bool | None = None) -> bool:
         if a in self.grounded_qubits or b in self.grounded_qubits:
@@ -381,10 +446,9 @@ class VecSim:
         return s.peek_z(q)
 
     def peek_z(self, q: Any) -> float:
-        f = self.state_slicer({q: False})
-        t = self.state_slicer({q: True})
-        weight_f = np.linalg.norm(self.state[f])**2
-        weight_t = np.linalg.norm(self.state[t])**2
+        f, t, _ = self._views_of(q)
+        weight_f = np.vdot(f, f).real
+        weight_t = np.vdot(t, t).real
         return 1 - 2 * weight_t / (weight_t + weight_f)
 
     def peek_p(self, q: Any, p: Literal['X', 'Y', 'Z']) -> float:
@@ -400,22 +464,21 @@ class VecSim:
     def do_mz(self, q: Any, *, key: Optional[Any] = None, prefer_result: bool | None = None) -> bool:
         if q in self.grounded_qubits:
             prefer_result = False
-        f = self.state_slicer({q: False})
-        t = self.state_slicer({q: True})
-        weight_f = np.linalg.norm(self.state[f])**2
-        weight_t = np.linalg.norm(self.state[t])**2
+        f, t, _ = self._views_of(q)
+        weight_f = np.vdot(f, f).real
+        weight_t = np.vdot(t, t).real
         p = weight_t / (weight_t + weight_f)
         result = random.random() < p
         if prefer_result is not None and 0.001 < p < 0.999:
             result = prefer_result
         if result:
-            self.state[f] = 0
+            f.fill(0)
             w = weight_t
         else:
-            self.state[t] = 0
+            t.fill(0)
             w = weight_f
         if not (0.001 < w < 1000):
-            self.state /= np.sqrt(w)
+            self._live_state()[...] /= np.sqrt(w)
         return self._record_measurement(key, result)
 
     def do_mrz(self, q: Any, *, key: Optional[Any] = None, prefer_result: bool | None = None) -> bool:
@@ -519,15 +582,11 @@ class VecSim:
     def do_mz_discard(self, q: Any, *, key: Optional[Any] = None, prefer_result: bool | None = None) -> bool:
         r = self.do_mrz(q, key=key, prefer_result=prefer_result)
 
-        i = self.q2i[q]
-        n = len(self.q2i) - 1
-        if i < n:
-            other = self.i2q[n]
-            self.do_swap(q, other)
-            self.q2i[other] = i
-            self.i2q[i] = other
-        del self.i2q[n]
-        del self.q2i[q]
+        # The qubit was reset to |0>, so its axis can be left as is for reuse.
+        i = self.q2i.pop(q)
+        del self.i2q[i]
+        heapq.heappush(self._free_axes, i)
+        self._forget_views()
         return r
 
     def _record_measurement(self, key: Any, b: bool) -> bool:
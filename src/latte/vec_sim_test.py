@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 import stim
 
 from latte.vec_sim import VecSim
@@ -172,7 +173,7 @@ def test_state_order_more():
     sim.do_qalloc_z('d')
     sim.do_qalloc_z('a')
     sim.do_mz_discard('e')
-    assert sim.q2i == {'b': 1, 'c': 2, 'd': 3, 'a': 0}
+    assert sim.q2i == {'b': 1, 'c': 2, 'd': 3, 'a': 4}
     assert list(sim.q2i) == ['b', 'c', 'd', 'a']
     sim.do_x('c')
     check('abdc', 0b0001)
@@ -218,3 +219,93 @@ def test_do_t_obs_xz_inverted():
         sim.normalized_state(order='ab'.index).flat,
         np.array([0, 0, 0.853553 + 0.35353j, -0.146447+0.353553j], dtype=np.complex64),
         atol=1e-3)
+
+
+def test_cached_views_follow_allocation():
+    s = VecSim()
+    s.do_qalloc_z('a')
+    s.do_qalloc_z('b')
+    s.do_x('b')
+    s.do_cx('b', 'a')
+    assert s.do_mz_discard('a')
+    s.do_qalloc_z('c')
+    s.do_cx('b', 'c')
+    assert s.do_mz('b', key=None)
+    assert s.do_mz('c', key=None)
+
+    s.do_swap('b', 'd')
+    assert 'b' not in s.q2i
+    s.do_x('d')
+    assert not s.do_mz('d', key=None)
+    s.do_qalloc_x('e')
+    s.do_qalloc_z('f')
+    s.do_cx('e', 'f')
+    s.do_x('c')
+    assert not s.do_mzz('e', 'f', key=None)
+    assert not s.do_mz('c', key=None)
+
+
+def test_max_qubits_reuses_freed_axes():
+    s = VecSim(max_qubits=3)
+    state = s.state
+    assert state.shape == (2, 2, 2)
+    s.do_qalloc_z('a')
+    s.do_qalloc_x('b')
+    s.do_qalloc_z('c')
+    s.do_cx('b', 'a')
+    s.do_x('c')
+    with pytest.raises(ValueError, match='max_qubits'):
+        s.do_qalloc_z('d')
+
+    s.do_mz_discard('b')
+    s.do_qalloc_z('d')
+    assert s.q2i['d'] == 1
+    assert not s.do_mz('d', key=None)
+    assert s.do_mz('c', key=None)
+    s.do_mz_discard('a')
+    s.do_mz_discard('c')
+    s.do_qalloc_z('e')
+    assert s.q2i == {'d': 1, 'e': 0}
+    assert s.state is state
+
+    s.do_h('e')
+    s.do_cx('e', 'd')
+    np.testing.assert_allclose(
+        s.normalized_state(order='ed'.index).flat,
+        [0.5**0.5, 0, 0, 0.5**0.5],
+        atol=1e-6)
+    s.clear()
+    assert s.state.shape == (2, 2, 2)
+    assert s.q2i == {}
+
+
+def test_matches_stim_on_random_cliffords():
+    rng = np.random.default_rng(5)
+    for _ in range(10):
+        n = 6
+        s = VecSim()
+        t = stim.TableauSimulator()
+        t.set_num_qubits(n)
+        for q in range(n):
+            s.do_qalloc_z(q)
+        for _ in range(60):
+            g = rng.choice(['H', 'S', 'X', 'Z', 'CX', 'CZ', 'SWAP'])
+            a, b = rng.choice(n, size=2, replace=False).tolist()
+            if g == 'H':
+                s.do_h(a)
+            elif g == 'S':
+                s.do_s(a)
+            elif g == 'X':
+                s.do_x(a)
+            elif g == 'Z':
+                s.do_z(a)
+            elif g == 'CX':
+                s.do_cx(a, b)
+            elif g == 'CZ':
+                s.do_cz(a, b)
+            elif g == 'SWAP':
+                s.do_swap(a, b)
+            t.do(stim.Circuit(f'{g} {a}' if len(g) == 1 else f'{g} {a} {b}'))
+        actual = s.normalized_state(order=lambda q: q).flatten()
+        expected = t.state_vector(endian='big')
+        assert abs(abs(np.vdot(actual, expected)) - 1) < 1e-4